@@ -1,15 +1,36 @@
+from typing import Any, Mapping, Optional
+
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.base import Handoff
-from autogen_agentchat.messages import HandoffMessage, TextMessage
-from autogen_core import AgentId, MessageContext, RoutedAgent, message_handler
+from autogen_agentchat.messages import HandoffMessage
+from autogen_core import AgentId, MessageContext, message_handler
 from autogen_core.models import ChatCompletionClient
+from context import get_model_context
 from datastore import CarIdCache
-from messages import AdvisorMessage, TriageMessage, UserMessage
-from tools import Tools
+from lifecycle import PooledAgent
+from messages import AdvisorMessage, StreamChunkMessage, TriageMessage, UserMessage
+from prompts import ADVISOR_PROMPT, session_context
+from streaming import STREAMING_ENABLED, run_streaming
+from tools import ADVISOR_TOOLS, SharedHandoff
+from usage import usage_tracker
 from utils import print_core, print_route
 
 
-class AdvisorAgent(RoutedAgent):
+# Shared by all the instances, see tools.py
+ADVISOR_HANDOFFS = [
+    SharedHandoff(
+        target="triage_agent",
+        description="Use it when the user provides a question that is out of the current discussion context.",
+        message="I'm sorry, I'm not able to help you with that. I'll redirect you to the right agent.",
+    ),
+    SharedHandoff(
+        target="sales_agent",
+        description="Use it when the user provides a question that is related to ordering the car in discussion or when the user has any question about orders. Be sure only one car is discussed and the cache_carId tool has been used.",
+        message="The user is interested in the car with car_id= {car_id}, find all the car details and then proceed with the order.",
+    ),
+]
+
+
+class AdvisorAgent(PooledAgent):
     """
     Advisor agent that specializes in helping users select the right car.
     It uses a set of tools to perform operations such as retrieving available cars and caching car IDs.
@@ -24,50 +45,30 @@ class AdvisorAgent(RoutedAgent):
         self._agent = AssistantAgent(
             name="advisor_agent",
             model_client=model_client,
-            tools=[Tools.get_available_cars, Tools.cache_carId],
-            system_message=f"""
-                You are a friendly and knowledgeable car selection agent dedicated to helping users find the car of their dreams. Your primary goal is to guide the user through a conversational journey that uncovers their true automotive needs and desires.
-                Your agent_id is {self.id}.
-
-                Key Details:
-
-                You have access to a tool that retrieves a list of available cars when provided with specific parameters: car brand, year, and available budget.
-
-                If the user does not specify any one of these details, consider that parameter open-ended, meaning you can assume any brand, year, or budget to start with.
-
-                Ask the user clarifying questions about their preferences (e.g., what type of car they prefer, any specific features, performance or aesthetic priorities) while gently guiding them toward specifying details like brand, year, and budget.
-
-                Use the available tools as soon as you have enough details to fetch relevant car options, and then discuss those options with the user.
-
-                Make sure your conversation is engaging, informative, and tailored to the user's responses so that by the end, the user feels confident that you've helped them find the perfect car.
-
-                Example Conversation Flow:
-
-                Introduction & Warm-Up: Start with a friendly greeting and ask a few open-ended questions like, “What's most important to you in your next car—performance, comfort, style, or something else?”
-
-                Information Gathering: Ask about any brand preferences, the desired model year or range, and their budget. For instance, “Do you have a favorite car brand or a particular year in mind? Also, what's your approximate budget for this new car?”
-
-                Tool Utilization: Once you have enough information, inform the user that you're checking the latest available options. Retrieve the list of cars using the tool by passing the car brand, year, and budget (using defaults if any are missing).
+            # Keeps the conversation within a token budget, see CONTEXT_POLICIES. The agent id, used by the
+            # cache_carId tool, follows the static system prompt so that its prefix is shared by all the sessions
+            model_context=get_model_context(
+                "advisor_agent", model_client, session_context(agent_id=self.id)
+            ),
+            tools=ADVISOR_TOOLS,
+            system_message=ADVISOR_PROMPT,
+            reflect_on_tool_use=True,
+            model_client_stream=STREAMING_ENABLED,
+            handoffs=ADVISOR_HANDOFFS,
+        )
+        # The car the user is interested in, cached by the cache_carId tool, it is part of the session state
+        self._car_id: Optional[int] = None
 
-                Recommendation & Engagement: Present the user with a tailored list of options. Provide insights into the features of each option, and ask follow-up questions like, “How do you feel about these choices?” or “Would you like to adjust any criteria?”
+    async def save_state(self) -> Mapping[str, Any]:
+        return {"assistant": await self._agent.save_state(), "car_id": self._car_id}
 
-                Final Decision: Continue the conversation until the user identifies the car that truly feels like their dream car. Offer additional advice or alternative options if needed.
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        await self._agent.load_state(state["assistant"])
+        self._car_id = state.get("car_id")
 
-                Remember: The conversation should always focus on understanding the user's unique tastes and guiding them step-by-step toward a decision that best fits their lifestyle and preferences.
-            """,
-            reflect_on_tool_use=True,
-            handoffs=[
-                Handoff(
-                    target="triage_agent",
-                    description="Use it when the user provides a question that is out of the current discussion context.",
-                    message="I'm sorry, I'm not able to help you with that. I'll redirect you to the right agent.",
-                ),
-                Handoff(
-                    target="sales_agent",
-                    description="Use it when the user provides a question that is related to ordering the car in discussion or when the user has any question about orders. Be sure only one car is discussed and the cache_carId tool has been used.",
-                    message="The user is interested in the car with car_id= {car_id}, find all the car details and then proceed with the order.",
-                ),
-            ],
+    async def _send_chunk(self, content: str) -> None:
+        await self.send_message(
+            StreamChunkMessage(content=content), AgentId("user_agent", self.id.key)
         )
 
     @message_handler()
@@ -80,22 +81,29 @@ class AdvisorAgent(RoutedAgent):
 
         print_route(ctx.sender, self.id, message.content)
 
-        response = await self._agent.on_messages(
-            [TextMessage(content=message.content, source="user")],
-            ctx.cancellation_token,
-        )
+        with usage_tracker.turn(self.id.type, self.id.key):
+            response = await run_streaming(
+                self._agent, message.content, ctx.cancellation_token, self._send_chunk
+            )
+        car_id = CarIdCache.cache.pop(str(self.id), None)
+        if car_id is not None:
+            self._car_id = car_id
+        if (
+            isinstance(response.chat_message, HandoffMessage)
+            and response.chat_message.target == "sales_agent"
+        ):
+            # Handed to the sales agent, a later handoff must not order the same car again
+            car_id, self._car_id = self._car_id, None
+        # Saved before the answer is sent, the user may leave or the process stop while the session waits for them
+        await self.checkpoint()
 
         if isinstance(response.chat_message, HandoffMessage):
             match response.chat_message.target:
                 case "sales_agent":
-                    car_id = CarIdCache.cache.pop(
-                        str(self.id), -1
-                    )  # not very safe, but ok to keep it simple for the demo
-
-                    # if car_is is -1 means that handoff is not related to a car
+                    # if there is no car id the handoff is not related to a car
                     # order, so we assume that the user is interested in orders.
                     # Again, there are better ways to do this.
-                    if car_id == -1:
+                    if car_id is None:
                         order_agent_instructions = message.content
                     else:
                         order_agent_instructions = response.chat_message.content.format(
@@ -3,7 +3,9 @@ from autogen_agentchat.messages import TextMessage
 from autogen_core import MessageContext, RoutedAgent, message_handler, type_subscription
 from autogen_core.models import ChatCompletionClient
 from messages import OrderUpdateMessage
-from tools import Tools
+from prompts import AFTER_SALES_PROMPT
+from tools import AFTER_SALES_TOOLS
+from usage import usage_tracker
 from utils import print_core, print_notification, print_route
 
 
@@ -25,20 +27,8 @@ class AfterSalesAgent(RoutedAgent):
         self._agent = AssistantAgent(
             name="communication_agent",
             model_client=model_client,
-            tools=[Tools.lookup_order],
-            system_message=f""""
-            You are a helpful assistant that can handle after-sales operations.
-            Your goal is to craft emails informing the customer about the order status.
-
-            use the following template to construct the email:
-
-            Dear <customer_name>,
-
-            We'd like to inform you that your order '<order_id>' placed on <order_date> for the car <car_brand> <car_model> has been updated to '<status>'.
-
-            Best regards,
-            CardDream Service Team
-            """,
+            tools=AFTER_SALES_TOOLS,
+            system_message=AFTER_SALES_PROMPT,
             reflect_on_tool_use=True,
         )
 
@@ -53,11 +43,16 @@ class AfterSalesAgent(RoutedAgent):
 
         print_route(ctx.sender, self.id, message.order_id)
 
+        # Each notification is independent, resetting the assistant keeps the prompt small and lets
+        # repeated notifications be served by the response cache.
+        await self._agent.on_reset(ctx.cancellation_token)
+
         query = f"The following order has been updated: {message.order_id}"
-        response = await self._agent.on_messages(
-            [TextMessage(content=query, source="user")],
-            ctx.cancellation_token,
-        )
+        with usage_tracker.turn(self.id.type, self.id.key):
+            response = await self._agent.on_messages(
+                [TextMessage(content=query, source="user")],
+                ctx.cancellation_token,
+            )
 
         # we just print the response here, but in a real scenario we would send it to the customer
         # using the email service.
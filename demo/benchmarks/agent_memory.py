@@ -0,0 +1,178 @@
+"""
+Memory of the agent instances: the sessions of the load benchmark (data/conversations.jsonl, on the scripted stub
+model) are run with the agent pool configured to keep every instance, to cap the live instances of each agent type
+and to evict the idle ones (with and without saving their state), the memory still allocated once the sessions
+ended is measured with tracemalloc and reported per 1k sessions.
+The cost of building an advisor AssistantAgent with its own tools and with the shared tools is reported too.
+
+    uv run benchmarks/agent_memory.py --sessions 1000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+
+import common
+
+# Set before the demo modules are imported, they read them at import time
+os.environ["MODEL_BACKEND"] = "stub"
+os.environ["MODEL_CACHE"] = "none"
+os.environ["USAGE_LOG_PATH"] = ""
+
+from advisor_agent import ADVISOR_HANDOFFS  # noqa: E402
+from autogen_agentchat.agents import AssistantAgent  # noqa: E402
+from autogen_agentchat.base import Handoff  # noqa: E402
+from autogen_core import SingleThreadedAgentRuntime  # noqa: E402
+from datastore import AsyncCarDB, get_profile  # noqa: E402
+from lifecycle import AgentPool, MemoryStateStore  # noqa: E402
+from load_sessions import drive_sessions, load_corpus, session_turns  # noqa: E402
+from main import get_agent_model_clients, register_agents  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from prompts import ADVISOR_PROMPT  # noqa: E402
+from rich import print  # noqa: E402
+from rich.table import Table  # noqa: E402
+from tools import ADVISOR_TOOLS, Tools  # noqa: E402
+from user_io import QueueChannel  # noqa: E402
+from utils import print_metrics  # noqa: E402
+
+from model_clients.stub import ScriptedChatCompletionClient  # noqa: E402
+
+IDLE_TIMEOUT = 0.5
+
+
+def pools() -> Dict[str, AgentPool]:
+    return {
+        "no eviction": AgentPool(idle_timeout=0, max_instances=0),
+        "max 100 per type": AgentPool(idle_timeout=0, max_instances=100),
+        f"idle {IDLE_TIMEOUT}s": AgentPool(idle_timeout=IDLE_TIMEOUT, max_instances=0),
+        f"idle {IDLE_TIMEOUT}s, saved state": AgentPool(
+            idle_timeout=IDLE_TIMEOUT, max_instances=0, store=MemoryStateStore()
+        ),
+    }
+
+
+async def run(args: argparse.Namespace, db_path: str, pool: AgentPool) -> Dict[str, Any]:
+    Tools.db = AsyncCarDB(db_path, profile=get_profile())
+    await Tools.db.init()
+    runtime = SingleThreadedAgentRuntime()
+    Tools.runtime = runtime
+    agent_metrics = Metrics()
+    model_clients = get_agent_model_clients(agent_metrics)
+    channel = QueueChannel()
+    corpus = load_corpus(args.corpus)
+
+    gc.collect()
+    tracemalloc.start()
+    await register_agents(runtime, model_clients, channel, agent_metrics, pool=pool)
+    pool.start()
+    runtime.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # The answers are drained once each session ended, they are not retained by the channel
+        await drive_sessions(
+            runtime,
+            channel,
+            lambda session_id: session_turns(corpus, int(session_id), args.seed),
+            args.sessions,
+            args.concurrency,
+        )
+        await runtime.stop_when_idle()
+        # Leaves the sweep the time to evict the last sessions
+        await asyncio.sleep(pool.idle_timeout * 3)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    live = len(runtime._instantiated_agents)
+    await pool.close()
+    await runtime.close()
+    await Tools.db.close()
+    return {
+        "elapsed": elapsed,
+        "retained": retained,
+        "peak": peak,
+        "live": live,
+        "stats": pool.stats(),
+    }
+
+
+def assistant_cost(count: int = 200) -> List[Tuple[str, float, float]]:
+    """KiB and ms needed to build an advisor AssistantAgent, with its own tools and with the shared ones."""
+    client = ScriptedChatCompletionClient(seed=0)
+    functions = [getattr(Tools, tool.name) for tool in ADVISOR_TOOLS]
+    own_handoffs = [Handoff(**handoff.model_dump()) for handoff in ADVISOR_HANDOFFS]
+    results = []
+    for name, tools, handoffs in (
+        ("own tools", functions, own_handoffs),
+        ("shared tools", ADVISOR_TOOLS, ADVISOR_HANDOFFS),
+    ):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        agents = [
+            AssistantAgent(
+                name="advisor_agent",
+                model_client=client,
+                tools=tools,
+                handoffs=handoffs,
+                system_message=ADVISOR_PROMPT,
+            )
+            for _ in range(count)
+        ]
+        elapsed = time.perf_counter() - start
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append((name, allocated / count / 1024, elapsed / count * 1000))
+        del agents
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50, help="sessions running at once, 0 for all")
+    parser.add_argument("--corpus", default="data/conversations.jsonl")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    os.environ["MODEL_STUB_LATENCY"] = "none"
+    os.environ["MODEL_STUB_SEED"] = str(args.seed)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for i, (name, pool) in enumerate(pools().items()):
+            results[name] = asyncio.run(run(args, common.fresh_db(directory, f"cars-{i}.db"), pool))
+
+    table = Table(title=f"Agent instances, {args.sessions} sessions, {args.concurrency or args.sessions} concurrent")
+    for column in ("pool", "live instances", "retained MiB", "MiB per 1k sessions", "peak MiB", "elapsed_s"):
+        table.add_column(column, justify="right")
+    for name, result in results.items():
+        table.add_row(
+            name,
+            str(result["live"]),
+            f"{result['retained'] / 2**20:.1f}",
+            f"{result['retained'] / 2**20 / args.sessions * 1000:.1f}",
+            f"{result['peak'] / 2**20:.1f}",
+            f"{result['elapsed']:.2f}",
+        )
+    print(table)
+    print_metrics(f"Pool, idle {IDLE_TIMEOUT}s, saved state", results[name]["stats"])
+
+    table = Table(title="Advisor AssistantAgent construction")
+    for column in ("tools", "KiB per instance", "ms per instance"):
+        table.add_column(column, justify="right")
+    for name, kib, ms in assistant_cost():
+        table.add_row(name, f"{kib:.1f}", f"{ms:.2f}")
+    print(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""
+Helpers shared by the benchmark scripts.
+Benchmarks are meant to be run from the demo folder, e.g. `uv run benchmarks/datastore_profiles.py`.
+"""
+
+import os
+import sys
+
+DEMO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Make the demo modules and the model_clients package importable, and resolve data/ paths from the demo folder
+sys.path.append(DEMO_DIR)
+sys.path.append(os.path.dirname(DEMO_DIR))
+os.chdir(DEMO_DIR)
+
+from datastore import CarDB  # noqa: E402
+
+
+def fresh_db(directory: str, name: str = "cars.db") -> str:
+    """Creates a new database populated with data/cars.csv and returns its path."""
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        os.remove(path)
+    db = CarDB(path)
+    db.init()
+    db.close()
+    return path
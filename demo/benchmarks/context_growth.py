@@ -0,0 +1,124 @@
+"""
+Prompt size of a long advisor session, with the whole conversation kept in the model context (unbounded)
+and with the advisor context policy (bounded window, compacted tool results and background summaries).
+The advisor runs on the scripted stub model, the prompt tokens of each turn are the ones of its largest model call
+(the reflection on the tool results), counted as characters / 4 like the stub does.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from typing import Any, AsyncGenerator, List, Sequence, Union
+
+import common
+
+os.environ["MODEL_STREAMING"] = "false"
+
+from advisor_agent import AdvisorAgent  # noqa: E402
+from autogen_agentchat.messages import TextMessage  # noqa: E402
+from autogen_core import (  # noqa: E402
+    AgentId,
+    AgentInstantiationContext,
+    CancellationToken,
+    SingleThreadedAgentRuntime,
+)
+from autogen_core.models import CreateResult, LLMMessage, SystemMessage  # noqa: E402
+from context import (  # noqa: E402
+    SUMMARY_PROMPT,
+    BoundedChatCompletionContext,
+    SessionChatCompletionContext,
+)
+from datastore import AsyncCarDB  # noqa: E402
+from rich import print  # noqa: E402
+from rich.table import Table  # noqa: E402
+from tools import Tools  # noqa: E402
+
+from model_clients.stub import ScriptedChatCompletionClient  # noqa: E402
+from model_clients.wrapper import ChatCompletionClientWrapper  # noqa: E402
+
+TURNS = 24
+REQUESTS = [
+    "Show me Tesla",
+    "Do you have any BMW?",
+    "What about Audi?",
+    "Something around 30k",
+    "Any Toyota?",
+    "And Ford?",
+]
+
+
+class PromptRecorder(ChatCompletionClientWrapper):
+    """Records the prompt tokens of the agent model calls, the summary calls are counted apart."""
+
+    def __init__(self, client) -> None:
+        super().__init__(client)
+        self.prompts: List[int] = []
+        self.summaries = 0
+
+    def _record(self, messages: Sequence[LLMMessage]) -> None:
+        if isinstance(messages[0], SystemMessage) and messages[0].content == SUMMARY_PROMPT:
+            self.summaries += 1
+        else:
+            self.prompts.append(self.count_tokens(messages))
+
+    async def create(self, messages: Sequence[LLMMessage], **kwargs: Any) -> CreateResult:
+        self._record(messages)
+        return await self.client.create(messages, **kwargs)
+
+    def create_stream(
+        self, messages: Sequence[LLMMessage], **kwargs: Any
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        self._record(messages)
+        return self.client.create_stream(messages, **kwargs)
+
+
+async def run_session(policy: str, path: str) -> List[int]:
+    os.environ["CONTEXT_POLICY"] = policy
+    Tools.db = AsyncCarDB(path)
+    await Tools.db.init()
+    client = PromptRecorder(ScriptedChatCompletionClient(seed=0))
+    runtime = SingleThreadedAgentRuntime()
+    with AgentInstantiationContext.populate_context((runtime, AgentId("advisor_agent", policy))):
+        advisor = AdvisorAgent(model_client=client)
+
+    per_turn: List[int] = []
+    for turn in range(TURNS):
+        calls = len(client.prompts)
+        await advisor._agent.on_messages(
+            [TextMessage(content=REQUESTS[turn % len(REQUESTS)], source="user")],
+            CancellationToken(),
+        )
+        per_turn.append(max(client.prompts[calls:]))
+
+    context = advisor._agent._model_context
+    if isinstance(context, SessionChatCompletionContext):
+        context = context.context
+    if isinstance(context, BoundedChatCompletionContext):
+        await context.wait_for_summary()
+    await Tools.db.close()
+    print(f"{policy}: {client.summaries} summaries")
+    return per_turn
+
+
+async def main() -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            policy: await run_session(policy, common.fresh_db(directory, f"{policy}.db"))
+            for policy in ("unbounded", "bounded")
+        }
+
+    table = Table(title=f"Advisor prompt tokens per turn ({TURNS} turns)")
+    table.add_column("turn", justify="right")
+    for policy in results:
+        table.add_column(policy, justify="right")
+    for turn in range(TURNS):
+        if turn < 3 or (turn + 1) % 4 == 0:
+            table.add_row(str(turn + 1), *(str(results[policy][turn]) for policy in results))
+    table.add_row("total", *(str(sum(results[policy])) for policy in results))
+    print(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,76 @@
+"""
+Compares read/write throughput of the default and production SQLite profiles
+with 1, 10 and 100 concurrent sessions sharing an AsyncCarDB.
+"""
+
+import asyncio
+import random
+import tempfile
+import time
+
+import common
+from datastore import PROFILES, AsyncCarDB
+from rich import print
+from rich.table import Table
+
+SESSIONS = (1, 10, 100)
+ITERATIONS = 20
+WRITE_EVERY = 5
+
+
+async def session(db: AsyncCarDB, rng: random.Random, counters: dict) -> None:
+    for i in range(ITERATIONS):
+        await db.find_cars()
+        await db.get_car(rng.randint(1, 50))
+        counters["reads"] += 2
+        if i % WRITE_EVERY == 0:
+            try:
+                order = await db.create_order(rng.randint(1, 50), "bench", "bench@cardream.com")
+                await db.delete_order(order.id)
+                counters["writes"] += 2
+            except ValueError:
+                # The car has been ordered by another session in the meantime
+                counters["conflicts"] += 1
+
+
+async def run(profile_name: str, sessions: int, directory: str) -> dict:
+    path = common.fresh_db(directory, f"{profile_name}-{sessions}.db")
+    db = AsyncCarDB(path, profile=PROFILES[profile_name])
+    counters = {"reads": 0, "writes": 0, "conflicts": 0}
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(session(db, random.Random(i), counters) for i in range(sessions))
+    )
+    elapsed = time.perf_counter() - start
+    await db.close()
+    return {
+        "reads/s": counters["reads"] / elapsed,
+        "writes/s": counters["writes"] / elapsed,
+        "conflicts": counters["conflicts"],
+        "p95 read ms": db.metrics.get("find_cars").percentile(95) * 1000,
+        "p95 pool wait ms": db.metrics.get("pool_wait").percentile(95) * 1000,
+    }
+
+
+async def main():
+    table = Table(title="SQLite profiles")
+    for column in ("profile", "sessions", "reads/s", "writes/s", "conflicts", "p95 read ms", "p95 pool wait ms"):
+        table.add_column(column, justify="right")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for profile_name in PROFILES:
+            for sessions in SESSIONS:
+                result = await run(profile_name, sessions, directory)
+                table.add_row(
+                    profile_name,
+                    str(sessions),
+                    *(
+                        f"{value:.1f}" if isinstance(value, float) else str(value)
+                        for value in result.values()
+                    ),
+                )
+    print(table)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
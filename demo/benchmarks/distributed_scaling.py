@@ -0,0 +1,143 @@
+"""
+Throughput of the distributed runtime with 1 to N local worker processes, against the single process runtime.
+The sessions of the load benchmark (data/conversations.jsonl, on the scripted stub model) are driven from this
+process, that runs the gRPC host and the user agent, the other agent types are spread over the workers.
+The host routes each agent type to a single worker, so there are at most as many workers as agent types.
+Every message between agents crosses the host, the workers pay off only when the cores are more than the processes.
+
+    uv run benchmarks/distributed_scaling.py --sessions 100 --concurrency 20 --latency constant:0.05
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import common
+from load_sessions import drive_sessions, load_corpus, session_turns
+from load_sessions import run as run_local
+
+from distributed import (
+    RuntimeWatcher,
+    host_address,
+    spawn_workers,
+    start_host,
+    start_worker,
+    stop_workers,
+)
+from main import AGENT_TYPES, register_agents
+from metrics import Metrics
+from rich import print
+from rich.table import Table
+from tools import Tools
+from user_io import QueueChannel
+from utils import print_metrics
+
+
+def worker_groups(workers: int) -> List[List[str]]:
+    """Spreads the agent types over `workers` processes, round robin."""
+    return [AGENT_TYPES[i::workers] for i in range(workers)]
+
+
+def free_address() -> str:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return f"localhost:{s.getsockname()[1]}"
+
+
+async def run_distributed(args: argparse.Namespace, db_path: str, workers: int) -> Dict[str, Any]:
+    # Inherited by the worker processes
+    os.environ["RUNTIME_HOST_ADDRESS"] = free_address()
+    os.environ["CARDB_PATH"] = db_path
+    os.environ["USAGE_METRICS_PATH"] = os.path.join(os.path.dirname(db_path), "usage.prom")
+    os.environ["MODEL_STUB_LATENCY"] = args.latency
+    os.environ["MODEL_STUB_TOKEN_LATENCY"] = args.token_latency
+    os.environ["MODEL_STUB_SEED"] = str(args.seed)
+
+    address = host_address()
+    host = start_host(address)
+    runtime = await start_worker(address)
+    Tools.runtime = runtime
+
+    agent_metrics = Metrics()
+    channel = QueueChannel()
+    watcher = RuntimeWatcher(args.sessions)
+    await watcher.register(runtime)
+    await register_agents(runtime, {}, channel, agent_metrics, agent_types=["user_agent"])
+    processes = spawn_workers(worker_groups(workers), address, stdout=subprocess.DEVNULL)
+
+    corpus = load_corpus(args.corpus)
+
+    try:
+        await watcher.wait_ready(AGENT_TYPES)
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            counts = await drive_sessions(
+                runtime,
+                channel,
+                lambda session_id: session_turns(corpus, int(session_id), args.seed),
+                args.sessions,
+                args.concurrency,
+            )
+            await watcher.wait_terminated()
+        elapsed = time.perf_counter() - start
+    finally:
+        stop_workers(processes)
+        await runtime.stop()
+        await host.stop()
+    return {"elapsed": elapsed, "turns": counts.answers, "counts": counts, "agent_metrics": agent_metrics}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions running at once, 0 for all")
+    parser.add_argument("--workers", type=int, default=len(AGENT_TYPES), help="largest number of worker processes")
+    parser.add_argument("--corpus", default="data/conversations.jsonl")
+    parser.add_argument("--latency", default="none", help="stub model latency, e.g. constant:0.5 or lognormal:0.8:0.5")
+    parser.add_argument("--token-latency", default="none", help="stub latency of each streamed chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results["local"] = asyncio.run(run_local(args, common.fresh_db(directory, "local.db")))
+        for workers in range(1, min(args.workers, len(AGENT_TYPES)) + 1):
+            db_path = common.fresh_db(directory, f"workers-{workers}.db")
+            results[f"{workers} worker{'s' if workers > 1 else ''}"] = asyncio.run(run_distributed(args, db_path, workers))
+
+    baseline = args.sessions / results["local"]["elapsed"]
+    table = Table(
+        title=f"Distributed runtime, {args.sessions} sessions, {args.concurrency or args.sessions} concurrent, "
+        f"{os.cpu_count()} cores"
+    )
+    for column in ("runtime", "elapsed_s", "sessions/s", "turns/s", "vs local", "turn_p50_ms", "turn_p95_ms"):
+        table.add_column(column, justify="right")
+    for name, result in results.items():
+        throughput = args.sessions / result["elapsed"]
+        turn = result["agent_metrics"].summary().get("turn", {})
+        table.add_row(
+            name,
+            f"{result['elapsed']:.2f}",
+            f"{throughput:.1f}",
+            f"{result['turns'] / result['elapsed']:.1f}",
+            f"{throughput / baseline:.2f}x",
+            f"{turn.get('p50_ms', 0):.0f}",
+            f"{turn.get('p95_ms', 0):.0f}",
+        )
+    print(table)
+    print_metrics("Latency with the most workers", results[name]["agent_metrics"].summary())
+    lost = {name: result["counts"] for name, result in results.items() if result["counts"].lost}
+    for name, counts in lost.items():
+        print(f"[red]{name}: {counts.lost} turns of {counts.incomplete} sessions were not answered[/red]")
+    return 1 if lost else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Headless load test of the whole agent graph: synthetic sessions replay the conversations of a corpus
+(data/conversations.jsonl, `{brand}`, `{name}` and `{email}` are filled per session) through a QueueChannel,
+on the scripted stub model, so it runs offline and without a terminal.
+Reports the sessions per second, the per-turn latency percentiles, the tool calls and the database time,
+and fails when a turn was not answered.
+
+    uv run benchmarks/load_sessions.py --sessions 200 --concurrency 50 --latency lognormal:0.8:0.5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Dict, List, Sequence, Union
+
+import common
+
+# Set before the demo modules are imported, they read them at import time
+os.environ["MODEL_BACKEND"] = "stub"
+os.environ["USAGE_LOG_PATH"] = ""
+
+from autogen_core import AgentRuntime, FunctionCall, SingleThreadedAgentRuntime  # noqa: E402
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage  # noqa: E402
+from datastore import AsyncCarDB, get_profile  # noqa: E402
+from main import get_agent_model_clients, register_agents, send_session_message  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from rich import print  # noqa: E402
+from rich.table import Table  # noqa: E402
+from tools import Tools  # noqa: E402
+from user_io import QueueChannel  # noqa: E402
+from utils import print_metrics  # noqa: E402
+
+from model_clients.wrapper import ChatCompletionClientWrapper  # noqa: E402
+
+BRANDS = ["Tesla", "BMW", "Audi", "Toyota", "Ford", "Honda", "Volkswagen", "Mercedes"]
+
+
+class ToolCallCounter(ChatCompletionClientWrapper):
+    """Counts the tool calls (handoffs included) requested by the model."""
+
+    def __init__(self, client: ChatCompletionClient, counter: Counter) -> None:
+        super().__init__(client)
+        self.counter = counter
+
+    def _count(self, result: CreateResult) -> None:
+        if isinstance(result.content, list):
+            self.counter.update(call.name for call in result.content if isinstance(call, FunctionCall))
+
+    async def create(self, messages: Sequence[LLMMessage], **kwargs: Any) -> CreateResult:
+        result = await self.client.create(messages, **kwargs)
+        self._count(result)
+        return result
+
+    def create_stream(
+        self, messages: Sequence[LLMMessage], **kwargs: Any
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            async for chunk in self.client.create_stream(messages, **kwargs):
+                if isinstance(chunk, CreateResult):
+                    self._count(chunk)
+                yield chunk
+
+        return _generator()
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def session_turns(corpus: List[Dict[str, Any]], session: int, seed: int) -> List[str]:
+    """The turns of a session: a conversation of the corpus, filled with values of its own."""
+    rng = random.Random(seed * 1_000_003 + session)
+    conversation = corpus[session % len(corpus)]
+    # The stub reads single word names, the name is made of letters only
+    name = "customer" + "".join(rng.choice(string.ascii_lowercase) for _ in range(6))
+    values = {"brand": rng.choice(BRANDS), "name": name, "email": f"{name}@cardream.com"}
+    return [turn.format(**values) for turn in conversation["turns"]]
+
+
+@dataclass
+class SessionCounts:
+    # User inputs sent and answers received
+    turns: int = 0
+    answers: int = 0
+    # Sessions that got fewer answers than inputs
+    incomplete: int = 0
+
+    @property
+    def lost(self) -> int:
+        return self.turns - self.answers
+
+
+async def drive_sessions(
+    runtime: AgentRuntime,
+    channel: QueueChannel,
+    turns: Callable[[str], List[str]],
+    sessions: int,
+    concurrency: int = 0,
+    end: bool = True,
+    timeout: float = 60,
+) -> SessionCounts:
+    """
+    Replays the `turns` of each session through `channel`, `concurrency` sessions at a time (0 for all), and counts
+    the answers. With `end` a session is closed after its turns and awaited until the user agent ended it, otherwise
+    it is left waiting for its next input once its turns are answered (within `timeout` seconds each).
+    """
+    counts = SessionCounts()
+    semaphore = asyncio.Semaphore(concurrency or sessions)
+
+    async def session(session_id: str) -> None:
+        inputs = turns(session_id)
+        async with semaphore:
+            for turn in inputs:
+                channel.put(session_id, turn)
+            counts.turns += len(inputs)
+            if end:
+                channel.end(session_id)
+                # Returns when the user agent has ended the session
+                await send_session_message(runtime, session_id)
+                answers = len(channel.drain(session_id))
+            else:
+                asyncio.create_task(send_session_message(runtime, session_id))
+                answers = 0
+                with contextlib.suppress(asyncio.TimeoutError):
+                    for _ in inputs:
+                        await asyncio.wait_for(channel.get(session_id), timeout)
+                        answers += 1
+        counts.answers += answers
+        if answers < len(inputs):
+            counts.incomplete += 1
+
+    await channel.start(session, sessions)
+    return counts
+
+
+async def run(args: argparse.Namespace, db_path: str) -> Dict[str, Any]:
+    os.environ["MODEL_STUB_LATENCY"] = args.latency
+    os.environ["MODEL_STUB_TOKEN_LATENCY"] = args.token_latency
+    os.environ["MODEL_STUB_SEED"] = str(args.seed)
+
+    Tools.db = AsyncCarDB(db_path, profile=get_profile())
+    await Tools.db.init()
+    runtime = SingleThreadedAgentRuntime()
+    Tools.runtime = runtime
+
+    agent_metrics = Metrics()
+    tool_calls: Counter = Counter()
+    model_clients = {
+        agent_type: ToolCallCounter(client, tool_calls)
+        for agent_type, client in get_agent_model_clients(agent_metrics).items()
+    }
+    channel = QueueChannel()
+    await register_agents(runtime, model_clients, channel, agent_metrics)
+    runtime.start()
+
+    corpus = load_corpus(args.corpus)
+
+    start = time.perf_counter()
+    # The agents trace every message on the console, it is silenced during the run
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        counts = await drive_sessions(
+            runtime,
+            channel,
+            lambda session_id: session_turns(corpus, int(session_id), args.seed),
+            args.sessions,
+            args.concurrency,
+        )
+        await runtime.stop_when_idle()
+    elapsed = time.perf_counter() - start
+
+    await runtime.close()
+    await Tools.db.close()
+    return {
+        "elapsed": elapsed,
+        "turns": counts.answers,
+        "counts": counts,
+        "agent_metrics": agent_metrics,
+        "tool_calls": tool_calls,
+        "db": Tools.db.metrics.summary(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=0, help="sessions running at once, 0 for all")
+    parser.add_argument("--corpus", default="data/conversations.jsonl")
+    parser.add_argument("--latency", default="none", help="stub model latency, e.g. constant:0.5 or lognormal:0.8:0.5")
+    parser.add_argument("--token-latency", default="none", help="stub latency of each streamed chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        result = asyncio.run(run(args, common.fresh_db(directory)))
+
+    elapsed = result["elapsed"]
+    table = Table(title="Load")
+    table.add_column("metric")
+    table.add_column("value", justify="right")
+    table.add_row("sessions", str(args.sessions))
+    table.add_row("concurrency", str(args.concurrency or args.sessions))
+    table.add_row("elapsed_s", f"{elapsed:.2f}")
+    table.add_row("sessions/s", f"{args.sessions / elapsed:.1f}")
+    table.add_row("turns/s", f"{result['turns'] / elapsed:.1f}")
+    counts = result["counts"]
+    table.add_row("turns answered", f"{counts.answers}/{counts.turns}")
+    table.add_row("tool calls", str(sum(result["tool_calls"].values())))
+    # Time spent in the queries, waiting for a connection (pool_wait, writer_wait) excluded
+    db_seconds = sum(
+        stats["count"] * stats["mean_ms"]
+        for name, stats in result["db"].items()
+        if not name.endswith("_wait") and name != "init"
+    ) / 1000
+    table.add_row("db_query_s", f"{db_seconds:.2f}")
+    print(table)
+
+    print_metrics("Latency", result["agent_metrics"].summary())
+    print_metrics("Tool calls", {name: {"calls": count} for name, count in result["tool_calls"].most_common()})
+    print_metrics("Database", result["db"])
+    if counts.lost:
+        print(f"[red]{counts.lost} turns of {counts.incomplete} sessions were not answered[/red]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Fault injection for the model clients: a fake Azure OpenAI endpoint (stdlib http.server) answers the chat completions
+with the faults of each scenario (throttling, server errors, a slow tail, hung requests, an outage of the primary
+deployment), the same calls are made with the plain Azure client (SDK retries) and with ResilientChatCompletionClient.
+Reports the success rate and latency percentiles of both, fails if the resilient client loses any call.
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import common  # noqa: F401
+from autogen_core.models import ChatCompletionClient, UserMessage
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+from rich import print
+from rich.table import Table
+
+from model_clients.resilient import ResiliencePolicy, ResilientChatCompletionClient
+
+CALLS = 60
+CONCURRENCY = 10
+# Calls of the plain client still pending after this are counted as failed
+CALL_LIMIT = 10.0
+POLICY = ResiliencePolicy(
+    timeout=1.0,
+    deadline=8.0,
+    retries=3,
+    backoff=0.05,
+    max_backoff=1.0,
+    hedge=True,
+    hedge_min_samples=10,
+    breaker_failures=5,
+    breaker_reset=5.0,
+)
+
+
+@dataclass
+class Faults:
+    """The behavior of a deployment, each request draws its fault at random."""
+
+    latency: float = 0.05
+    error_rate: float = 0.0
+    error_status: int = 500
+    slow_rate: float = 0.0
+    slow_latency: float = 2.0
+    hang_rate: float = 0.0
+
+
+@dataclass
+class Scenario:
+    name: str
+    primary: Faults
+    secondary: Faults = field(default_factory=Faults)
+
+
+SCENARIOS = [
+    Scenario("healthy", Faults()),
+    Scenario("429 (30%)", Faults(error_rate=0.3, error_status=429)),
+    Scenario("503 (20%)", Faults(error_rate=0.2, error_status=503)),
+    Scenario("slow 2s (10%)", Faults(slow_rate=0.1)),
+    Scenario("hung (10%)", Faults(hang_rate=0.1)),
+    Scenario("outage", Faults(error_rate=1.0)),
+]
+
+
+class FakeAzureOpenAI(BaseHTTPRequestHandler):
+    """Answers /openai/deployments/<deployment>/chat/completions following the faults of the deployment."""
+
+    faults: Dict[str, Faults] = {}
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: dict, headers: Dict[str, str] = {}) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        deployment = self.path.split("/deployments/", 1)[1].split("/", 1)[0]
+        faults = self.faults[deployment]
+        with self.lock:
+            draw = self.rng.random()
+
+        if draw < faults.error_rate:
+            time.sleep(faults.latency)
+            headers = {"retry-after-ms": "100"} if faults.error_status == 429 else {}
+            self._send(faults.error_status, {"error": {"code": str(faults.error_status), "message": "Injected fault"}}, headers)
+            return
+        draw -= faults.error_rate
+        if draw < faults.hang_rate:
+            time.sleep(CALL_LIMIT * 2)
+        elif draw - faults.hang_rate < faults.slow_rate:
+            time.sleep(faults.slow_latency)
+        else:
+            time.sleep(faults.latency)
+        self._send(
+            200,
+            {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "gpt-4o",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": f"Answer from {deployment}"},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            },
+        )
+
+
+def azure_client(port: int, deployment: str, max_retries: int) -> AzureOpenAIChatCompletionClient:
+    return AzureOpenAIChatCompletionClient(
+        azure_deployment=deployment,
+        model="gpt-4o",
+        api_version="2024-06-01",
+        azure_endpoint=f"http://127.0.0.1:{port}",
+        api_key="fake",
+        max_retries=max_retries,
+    )
+
+
+async def run_calls(client: ChatCompletionClient) -> Tuple[int, List[float]]:
+    """Makes CALLS calls, CONCURRENCY at a time, returns the successful calls and the latencies of all the calls."""
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies: List[float] = []
+    successes = 0
+
+    async def call(i: int) -> None:
+        nonlocal successes
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(
+                    client.create([UserMessage(content=f"Request {i}", source="user")]), CALL_LIMIT
+                )
+                successes += 1
+            except Exception:
+                pass
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(call(i) for i in range(CALLS)))
+    return successes, latencies
+
+
+def percentile(values: List[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+async def run_scenario(port: int, scenario: Scenario) -> List[Tuple[str, int, List[float], Optional[dict]]]:
+    FakeAzureOpenAI.faults = {"primary": scenario.primary, "secondary": scenario.secondary}
+    plain = azure_client(port, "primary", max_retries=2)
+    resilient = ResilientChatCompletionClient(
+        azure_client(port, "primary", max_retries=0),
+        POLICY,
+        fallback=azure_client(port, "secondary", max_retries=0),
+        seed=0,
+    )
+    results = []
+    for name, client in (("sdk", plain), ("resilient", resilient)):
+        successes, latencies = await run_calls(client)
+        stats = client.stats() if isinstance(client, ResilientChatCompletionClient) else None
+        results.append((name, successes, latencies, stats))
+        await client.close()
+    return results
+
+
+async def main() -> int:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAzureOpenAI)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    table = Table(title=f"Model calls under injected faults ({CALLS} calls, {CONCURRENCY} concurrent)")
+    for column in ("scenario", "client", "ok", "p50_ms", "p95_ms", "max_ms", "retries", "hedges", "fallbacks"):
+        table.add_column(column, justify="right")
+    lost = 0
+    try:
+        for scenario in SCENARIOS:
+            for name, successes, latencies, stats in await run_scenario(port, scenario):
+                if stats is not None:
+                    lost += CALLS - successes
+                table.add_row(
+                    scenario.name,
+                    name,
+                    f"{successes}/{CALLS}",
+                    f"{percentile(latencies, 50) * 1000:.0f}",
+                    f"{percentile(latencies, 95) * 1000:.0f}",
+                    f"{max(latencies) * 1000:.0f}",
+                    *(str(stats[key]) if stats else "-" for key in ("retries", "hedges", "fallbacks")),
+                )
+    finally:
+        server.shutdown()
+    print(table)
+
+    if lost:
+        print(f"[bold red]The resilient client lost {lost} calls[/bold red]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
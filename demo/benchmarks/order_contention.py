@@ -0,0 +1,244 @@
+"""
+Stress test of the order creation path: hundreds of sessions order an overlapping set of cars
+in parallel, then the number of oversold cars (cars with more than one active order) is counted.
+A second run deletes every order twice at once while the other sessions order the freed cars, a late
+delete that frees the car again lets it be sold twice.
+
+Sessions run through a shared AsyncCarDB (as the agents do) and through independent connections
+on separate threads (as separate processes would), the previous check-then-insert implementation
+is included for comparison. Exits with a non-zero status if the CarDB order paths oversell.
+"""
+
+import asyncio
+import datetime
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import common
+from datastore import PRODUCTION_PROFILE, AsyncCarDB, CarDB, OrderConflictError
+from rich import print
+from rich.table import Table
+
+SESSIONS = 300
+CARS = 10
+
+
+def legacy_create_order(db: CarDB, car_id: int, customer_name: str, customer_email: str) -> None:
+    """The order path before it was made atomic: check availability, insert, update."""
+    car = db.get_car(car_id)
+    if not car:
+        raise OrderConflictError(car_id)
+    db.conn.execute(
+        "INSERT INTO Orders (car_id, customer_name, customer_email, date, status, is_available) VALUES (?, ?, ?, ?, ?, 1);",
+        (car_id, customer_name, customer_email, datetime.date.today().isoformat(), "order created"),
+    )
+    db.conn.execute("UPDATE Cars SET is_available = 0 WHERE id = ?;", (car_id,))
+    db.conn.commit()
+
+
+def legacy_delete_order(db: CarDB, order_id: int) -> Optional[int]:
+    """The delete path before it was made atomic: check the order, free the car, mark the order."""
+    if db.get_order(order_id) is None:
+        return None
+    car_id = db.conn.execute("SELECT car_id FROM Orders WHERE id = ?;", (order_id,)).fetchone()["car_id"]
+    db.conn.execute("UPDATE Cars SET is_available = 1 WHERE id = ?;", (car_id,))
+    db.conn.execute("UPDATE Orders SET is_available = 0, is_deleted = 1, status = 'Deleted' WHERE id = ?;", (order_id,))
+    db.conn.commit()
+    return car_id
+
+
+def order_all_cars(path: str) -> None:
+    """Orders every car, order i is the order of car i."""
+    db = CarDB(path)
+    for car_id in range(1, CARS + 1):
+        db.create_order(car_id, "owner", "owner@cardream.com")
+    db.close()
+
+
+def oversells(path: str) -> int:
+    db = CarDB(path)
+    row = db.conn.execute(
+        """
+        SELECT COUNT(*) FROM (
+            SELECT car_id FROM Orders WHERE is_available = 1 GROUP BY car_id HAVING COUNT(*) > 1
+        );
+        """
+    ).fetchone()
+    db.close()
+    return row[0]
+
+
+async def run_async(path: str) -> dict:
+    db = AsyncCarDB(path, profile=PRODUCTION_PROFILE)
+    counters = {"orders": 0, "conflicts": 0, "errors": 0}
+
+    async def session(i: int) -> None:
+        try:
+            await db.create_order(random.Random(i).randint(1, CARS), f"customer{i}", f"customer{i}@cardream.com")
+            counters["orders"] += 1
+        except OrderConflictError:
+            counters["conflicts"] += 1
+        except Exception:
+            counters["errors"] += 1
+
+    await asyncio.gather(*(session(i) for i in range(SESSIONS)))
+    await db.close()
+    return counters
+
+
+def run_threads(path: str, create_order) -> dict:
+    counters = {"orders": 0, "conflicts": 0, "errors": 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(SESSIONS)
+
+    def session(i: int) -> None:
+        db = CarDB(path, profile=PRODUCTION_PROFILE)
+        barrier.wait()
+        try:
+            create_order(db, random.Random(i).randint(1, CARS), f"customer{i}", f"customer{i}@cardream.com")
+            outcome = "orders"
+        except OrderConflictError:
+            outcome = "conflicts"
+        except Exception:
+            outcome = "errors"
+        finally:
+            db.close()
+        with lock:
+            counters[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        list(executor.map(session, range(SESSIONS)))
+    return counters
+
+
+async def run_async_deletes(path: str) -> dict:
+    order_all_cars(path)
+    db = AsyncCarDB(path, profile=PRODUCTION_PROFILE)
+    counters = {"orders": 0, "conflicts": 0, "deletes": 0, "errors": 0}
+
+    async def session(i: int) -> None:
+        try:
+            # The first sessions delete each order twice, the others order the freed cars
+            if i < 2 * CARS:
+                if await db.delete_order(i % CARS + 1) is not None:
+                    counters["deletes"] += 1
+            else:
+                await db.create_order(random.Random(i).randint(1, CARS), f"customer{i}", f"customer{i}@cardream.com")
+                counters["orders"] += 1
+        except OrderConflictError:
+            counters["conflicts"] += 1
+        except Exception:
+            counters["errors"] += 1
+
+    await asyncio.gather(*(session(i) for i in random.Random(0).sample(range(SESSIONS), SESSIONS)))
+    await db.close()
+    return counters
+
+
+def run_thread_deletes(path: str, delete_order: Callable[[CarDB, int], Optional[int]]) -> dict:
+    order_all_cars(path)
+    counters = {"orders": 0, "conflicts": 0, "deletes": 0, "errors": 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(SESSIONS)
+
+    def session(i: int) -> None:
+        db = CarDB(path, profile=PRODUCTION_PROFILE)
+        barrier.wait()
+        outcome = None
+        try:
+            if i < 2 * CARS:
+                if delete_order(db, i % CARS + 1) is not None:
+                    outcome = "deletes"
+            else:
+                db.create_order(random.Random(i).randint(1, CARS), f"customer{i}", f"customer{i}@cardream.com")
+                outcome = "orders"
+        except OrderConflictError:
+            outcome = "conflicts"
+        except Exception:
+            outcome = "errors"
+        finally:
+            db.close()
+        if outcome is not None:
+            with lock:
+                counters[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        list(executor.map(session, range(SESSIONS)))
+    return counters
+
+
+def double_deletes(directory: str) -> bool:
+    """Deletes each of the CARS orders twice at once, returns True if a CarDB delete path oversells."""
+    scenarios = {
+        "AsyncCarDB": lambda path: asyncio.run(run_async_deletes(path)),
+        "independent connections": lambda path: run_thread_deletes(path, lambda db, order_id: db.delete_order(order_id)),
+        "legacy check-then-delete": lambda path: run_thread_deletes(path, legacy_delete_order),
+    }
+
+    table = Table(title=f"{2 * CARS} sessions deleting {CARS} orders twice, {SESSIONS - 2 * CARS} ordering the cars")
+    for column in ("delete path", "deletes", "orders", "conflicts", "errors", "oversells"):
+        table.add_column(column, justify="right")
+
+    failed = False
+    for name, scenario in scenarios.items():
+        path = common.fresh_db(directory, "deletes.db")
+        counters = scenario(path)
+        oversold = oversells(path)
+        # Each order is deleted once, a second delete would free the car again
+        if (oversold or counters["deletes"] != CARS) and not name.startswith("legacy"):
+            failed = True
+        table.add_row(
+            name,
+            str(counters["deletes"]) if counters["deletes"] == CARS else f"[bold red]{counters['deletes']}[/bold red]",
+            str(counters["orders"]),
+            str(counters["conflicts"]),
+            str(counters["errors"]),
+            f"[bold red]{oversold}[/bold red]" if oversold else "0",
+        )
+    print(table)
+    return failed
+
+
+def main() -> int:
+    scenarios = {
+        "AsyncCarDB": lambda path: asyncio.run(run_async(path)),
+        "independent connections": lambda path: run_threads(
+            path, lambda db, *args: db.create_order(*args)
+        ),
+        "legacy check-then-insert": lambda path: run_threads(path, legacy_create_order),
+    }
+
+    table = Table(title=f"{SESSIONS} sessions ordering {CARS} cars")
+    for column in ("order path", "orders/s", "orders", "conflicts", "errors", "oversells"):
+        table.add_column(column, justify="right")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for name, scenario in scenarios.items():
+            path = common.fresh_db(directory)
+            start = time.perf_counter()
+            counters = scenario(path)
+            elapsed = time.perf_counter() - start
+            oversold = oversells(path)
+            if oversold and not name.startswith("legacy"):
+                failed = True
+            table.add_row(
+                name,
+                f"{SESSIONS / elapsed:.0f}",
+                str(counters["orders"]),
+                str(counters["conflicts"]),
+                str(counters["errors"]),
+                f"[bold red]{oversold}[/bold red]" if oversold else "0",
+            )
+        print(table)
+        failed = double_deletes(directory) or failed
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Share of the advisor prompt tokens a provider with automatic prompt caching serves from its cache, over
+100 simulated sessions, with the agent id interpolated in the system prompt (previous layout) and with the
+static prompt followed by the session context message (prompts.py).
+The advisor runs on the scripted stub model. The cache is modeled on the Azure OpenAI one: prompts of at least
+1024 tokens are cached in blocks of 128 tokens, a request is served the longest cached prefix of any earlier request.
+Tokens are counted with the tiktoken encoding of the gpt-4o models, or as chunks of 4 characters when the encoding
+cannot be downloaded.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from typing import Any, AsyncGenerator, Callable, List, Sequence, Set, Tuple, Union
+
+import common
+
+os.environ["MODEL_STREAMING"] = "false"
+
+from advisor_agent import AdvisorAgent  # noqa: E402
+from autogen_agentchat.messages import TextMessage  # noqa: E402
+from autogen_core import (  # noqa: E402
+    AgentId,
+    AgentInstantiationContext,
+    CancellationToken,
+    SingleThreadedAgentRuntime,
+)
+from autogen_core.models import CreateResult, LLMMessage, SystemMessage  # noqa: E402
+from autogen_core.tools import Tool, ToolSchema  # noqa: E402
+from datastore import AsyncCarDB  # noqa: E402
+from prompts import ADVISOR_PROMPT  # noqa: E402
+from rich import print  # noqa: E402
+from rich.table import Table  # noqa: E402
+from tools import Tools  # noqa: E402
+
+from model_clients.stub import ScriptedChatCompletionClient  # noqa: E402
+from model_clients.wrapper import ChatCompletionClientWrapper  # noqa: E402
+
+SESSIONS = 100
+MIN_CACHED_TOKENS = 1024
+CACHE_BLOCK = 128
+CONVERSATIONS = [
+    ["Show me Tesla", "What about Audi?", "Something around 30k"],
+    ["Do you have any BMW?", "Any Toyota?"],
+    ["I'm looking for an electric car", "And Ford?", "Do you have any BMW?"],
+]
+
+# The advisor prompt line replaced by the session context
+AGENT_ID_LINE = "Use the agent_id given in the session context message when caching a car id."
+
+Request = Tuple[List[LLMMessage], List[ToolSchema]]
+
+
+class RequestRecorder(ChatCompletionClientWrapper):
+    """Records the messages and tools of every model call."""
+
+    def __init__(self, client) -> None:
+        super().__init__(client)
+        self.requests: List[Request] = []
+
+    def _record(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema]) -> None:
+        schemas = [tool.schema if isinstance(tool, Tool) else tool for tool in tools]
+        self.requests.append((list(messages), schemas))
+
+    async def create(self, messages: Sequence[LLMMessage], **kwargs: Any) -> CreateResult:
+        self._record(messages, kwargs.get("tools", []))
+        return await self.client.create(messages, **kwargs)
+
+    def create_stream(
+        self, messages: Sequence[LLMMessage], **kwargs: Any
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        self._record(messages, kwargs.get("tools", []))
+        return self.client.create_stream(messages, **kwargs)
+
+
+def interpolated_layout(request: Request) -> Request:
+    """The same request with the agent id in the system prompt, as the advisor built it before prompts.py."""
+    messages, tools = request
+    session = messages[1].content
+    agent_id = session.split("agent_id: ", 1)[1].splitlines()[0]
+    prompt = ADVISOR_PROMPT.replace(AGENT_ID_LINE, f"Your agent_id is {agent_id}.")
+    return [SystemMessage(content=prompt), *messages[2:]], tools
+
+
+def tokenizer() -> Callable[[str], Sequence[Any]]:
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base").encode
+    except Exception as e:
+        print(f"[bold red]tiktoken encoding not available ({type(e).__name__}), using chunks of 4 characters[/bold red]")
+        return lambda text: [text[i : i + 4] for i in range(0, len(text), 4)]
+
+
+def serialize(request: Request) -> str:
+    # Tools first, then the messages in order, like the chat completions prompt
+    messages, tools = request
+    return json.dumps(tools) + "".join(f"\n<{message.type}>{message.content}" for message in messages)
+
+
+def cached_tokens(
+    requests: List[Request], encode: Callable[[str], Sequence[Any]]
+) -> List[Tuple[int, int]]:
+    """Returns the prompt tokens and the cached tokens of each request, sent in order."""
+    cache: Set[int] = set()
+    usage = []
+    for request in requests:
+        tokens = tuple(encode(serialize(request)))
+        blocks = range(MIN_CACHED_TOKENS, len(tokens) + 1, CACHE_BLOCK)
+        hit = max((size for size in blocks if hash(tokens[:size]) in cache), default=0)
+        usage.append((len(tokens), hit))
+        cache.update(hash(tokens[:size]) for size in blocks)
+    return usage
+
+
+def ratio(usage: Sequence[Tuple[int, int]]) -> str:
+    return f"{sum(hit for _, hit in usage) / sum(total for total, _ in usage):.0%}"
+
+
+async def record_sessions(path: str) -> Tuple[List[Request], List[int]]:
+    """Returns the requests of the sessions and the index of the first request of each session."""
+    Tools.db = AsyncCarDB(path)
+    await Tools.db.init()
+    client = RequestRecorder(ScriptedChatCompletionClient(seed=0))
+    runtime = SingleThreadedAgentRuntime()
+    first_requests = []
+    for session in range(SESSIONS):
+        first_requests.append(len(client.requests))
+        with AgentInstantiationContext.populate_context((runtime, AgentId("advisor_agent", str(session)))):
+            advisor = AdvisorAgent(model_client=client)
+        for content in CONVERSATIONS[session % len(CONVERSATIONS)]:
+            await advisor._agent.on_messages([TextMessage(content=content, source="user")], CancellationToken())
+    await Tools.db.close()
+    return client.requests, first_requests
+
+
+def main() -> int:
+    encode = tokenizer()
+    with tempfile.TemporaryDirectory() as directory:
+        requests, first_requests = asyncio.run(record_sessions(common.fresh_db(directory)))
+
+    layouts = {
+        "agent id in prompt": [interpolated_layout(request) for request in requests],
+        "session context": requests,
+    }
+    table = Table(title=f"Advisor prompt cache, {SESSIONS} sessions, {len(requests)} model calls")
+    for column in ("layout", "prompt tokens", "cached tokens", "cached ratio", "first call of a session"):
+        table.add_column(column, justify="right")
+    for name, layout in layouts.items():
+        usage = cached_tokens(layout, encode)
+        table.add_row(
+            name,
+            str(sum(total for total, _ in usage)),
+            str(sum(hit for _, hit in usage)),
+            ratio(usage),
+            ratio([usage[i] for i in first_requests]),
+        )
+    print(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
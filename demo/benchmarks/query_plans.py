@@ -0,0 +1,83 @@
+"""
+Runs every CarDB query against a fresh database, captures the executed statements and checks
+their EXPLAIN QUERY PLAN. Exits with a non-zero status if any query falls back to a table SCAN.
+"""
+
+import itertools
+import sqlite3
+import sys
+import tempfile
+from typing import List
+
+import common
+from datastore import CarDB
+from rich import print
+
+# Statements that are not queries and do not have a meaningful plan, and trigger traces
+SKIPPED_PREFIXES = ("CREATE", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "ANALYZE", "SAVEPOINT", "RELEASE", "--")
+# Internal statements issued by FTS5 on its shadow tables
+SKIPPED_TABLES = ("'main'.'CarsFts_",)
+
+
+def exercise(db: CarDB) -> None:
+    """Invokes every CarDB query at least once."""
+    for brand, year, price in itertools.product(("Audi", None), (2022, None), (40000, None)):
+        db.find_cars(brand=brand, year=year, price=price)
+    db.search_cars("red electric", max_price=40000, max_mileage=30000)
+    db.search_cars(None, min_year=2020, max_year=2022)
+    db.search_cars(None, min_price=20000, max_mileage=30000, limit=5, offset=5)
+    db.get_car(1)
+    db.get_car(1, include_unavailable=True)
+    db.get_cars([1, 2, 3])
+    db.get_cars([1, 2, 3], include_unavailable=True)
+    order = db.create_order(1, "bench", "bench@cardream.com")
+    db.order_exists(order.id)
+    db.get_order(order.id)
+    db.get_order(order.id, include_deleted=True)
+    db.get_orders_by_ids([order.id, order.id + 1])
+    db.get_orders_by_ids([order.id], include_deleted=True)
+    db.get_orders_by_customer("bench")
+    db.delete_order(order.id)
+    db.delete_car(2)
+
+
+def scans(conn: sqlite3.Connection, statement: str) -> List[str]:
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    # Full-text searches are served by the FTS index, that the planner reports as a virtual table scan
+    return [
+        row[3]
+        for row in plan
+        if row[3].startswith("SCAN") and "VIRTUAL TABLE" not in row[3]
+    ]
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        db = CarDB(common.fresh_db(directory))
+        db.init()
+
+        statements: List[str] = []
+        db.conn.set_trace_callback(statements.append)
+        exercise(db)
+        db.conn.set_trace_callback(None)
+
+        failures = 0
+        for statement in dict.fromkeys(s.strip() for s in statements):
+            if statement.upper().startswith(SKIPPED_PREFIXES) or any(
+                table in statement for table in SKIPPED_TABLES
+            ):
+                continue
+            found = scans(db.conn, statement)
+            compact = " ".join(statement.split())
+            if found:
+                failures += 1
+                print(f"[bold red]SCAN[/bold red] {compact}\n    {'; '.join(found)}")
+            else:
+                print(f"[bold green]OK[/bold green]   {compact}")
+        db.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
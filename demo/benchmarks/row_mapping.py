@@ -0,0 +1,105 @@
+"""
+Measures the allocations needed to map 10k Cars rows with the previous approach (sqlite3.Row objects
+mapped by column name to a regular dataclass) and with the slotted row factory used by CarDB,
+both materializing the result set and consuming it lazily.
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable
+
+import common  # noqa: F401
+from datastore import CarDB
+from rich import print
+from rich.table import Table
+
+ROWS = 10_000
+
+
+@dataclass
+class LegacyCar:
+    id: int
+    brand: str
+    year: int
+    price: int
+    color: str
+    mileage: int
+    fuel: str
+    model: str
+    is_available: bool
+
+
+def legacy_find_cars(db: CarDB) -> list:
+    rows = db.conn.execute("SELECT * FROM Cars WHERE is_available = 1").fetchall()
+    return [
+        LegacyCar(
+            id=row["id"],
+            brand=row["brand"],
+            year=row["year"],
+            price=row["price"],
+            color=row["color"],
+            mileage=row["mileage"],
+            fuel=row["fuel"],
+            model=row["model"],
+            is_available=row["is_available"],
+        )
+        for row in rows
+    ]
+
+
+def lazy_find_cars(db: CarDB) -> int:
+    # Consumes the cars one at a time without keeping them
+    return sum(1 for _ in db.find_cars(lazy=True))
+
+
+def measure(name: str, run: Callable[[], object], table: Table) -> None:
+    run()  # warm up the statement cache
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    retained = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in retained)
+    size = sum(stat.size_diff for stat in retained)
+    table.add_row(
+        name,
+        f"{blocks:,}",
+        f"{size / 1024:,.0f}",
+        f"{peak / 1024:,.0f}",
+        f"{elapsed * 1000:.1f}",
+    )
+    del result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        db = CarDB(os.path.join(directory, "cars.db"))
+        db.init()
+        db.conn.executemany(
+            "INSERT OR REPLACE INTO Cars (id, brand, year, price, color, mileage, fuel, model, is_available) "
+            "VALUES (?, 'Audi', 2022, 40000, 'Red', 10000, 'gasoline', 'A4', 1);",
+            ((i,) for i in range(1, ROWS + 1)),
+        )
+        db.conn.commit()
+
+        table = Table(title=f"Mapping {ROWS:,} rows")
+        for column in ("mapping", "retained blocks", "retained KiB", "peak KiB", "ms"):
+            table.add_column(column, justify="right")
+
+        measure("sqlite3.Row + dataclass", lambda: legacy_find_cars(db), table)
+        measure("slotted row factory", lambda: db.find_cars(), table)
+        measure("slotted row factory (lazy)", lambda: lazy_find_cars(db), table)
+        db.close()
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
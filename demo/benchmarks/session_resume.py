@@ -0,0 +1,188 @@
+"""
+Durable session state: the sessions of the load benchmark (data/conversations.jsonl, on the scripted stub model) are
+checkpointed to a SQLite state store after each turn, the process running them is killed before their last turn,
+and a new process answers the last turns, resuming the sessions from the store when their first message arrives.
+Reports the checkpoint cost, the size of the store, the resume latency and the tool calls of the last turns,
+against a restart without the store (the sessions start over and the last turns lack their context).
+
+    uv run benchmarks/session_resume.py --sessions 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import common
+
+# Set before the demo modules are imported, they read them at import time
+os.environ["MODEL_BACKEND"] = "stub"
+os.environ["MODEL_CACHE"] = "none"
+os.environ["USAGE_LOG_PATH"] = ""
+
+from autogen_core import SingleThreadedAgentRuntime  # noqa: E402
+from datastore import AsyncCarDB, get_profile  # noqa: E402
+from lifecycle import AgentPool, SQLiteStateStore  # noqa: E402
+from load_sessions import ToolCallCounter, drive_sessions, load_corpus, session_turns  # noqa: E402
+from main import get_agent_model_clients, register_agents  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from rich import print  # noqa: E402
+from rich.table import Table  # noqa: E402
+from tools import Tools  # noqa: E402
+from user_io import QueueChannel  # noqa: E402
+from utils import print_metrics  # noqa: E402
+
+
+async def run(
+    args: argparse.Namespace, db_path: str, state_path: Optional[str], crash: bool
+) -> Dict[str, Any]:
+    """
+    Runs the sessions up to their last turn and kills the process (`crash`), or runs their last turn only, on the
+    state of `state_path` (None for no store).
+    """
+    Tools.db = AsyncCarDB(db_path, profile=get_profile())
+    await Tools.db.init()
+    runtime = SingleThreadedAgentRuntime()
+    Tools.runtime = runtime
+    pool = AgentPool(idle_timeout=0, max_instances=0, store=SQLiteStateStore(state_path) if state_path else None)
+
+    agent_metrics = Metrics()
+    tool_calls: Counter = Counter()
+    model_clients = {
+        agent_type: ToolCallCounter(client, tool_calls)
+        for agent_type, client in get_agent_model_clients(agent_metrics).items()
+    }
+    channel = QueueChannel()
+    await register_agents(runtime, model_clients, channel, agent_metrics, pool=pool)
+    runtime.start()
+
+    corpus = load_corpus(args.corpus)
+
+    def turns(session_id: str) -> List[str]:
+        return session_turns(corpus, int(session_id), args.seed)
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if crash:
+            # The answer of a turn is sent once the agents have been checkpointed
+            counts = await drive_sessions(
+                runtime, channel, lambda session_id: turns(session_id)[:-1], args.sessions, args.concurrency, end=False
+            )
+        else:
+            counts = await drive_sessions(
+                runtime, channel, lambda session_id: turns(session_id)[-1:], args.sessions, args.concurrency
+            )
+            await runtime.stop_when_idle()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "elapsed": elapsed,
+        "turns": counts.turns,
+        "answers": counts.answers,
+        "tool_calls": dict(tool_calls),
+        "pool": pool.metrics.summary(),
+        "restored": {agent_type: stats["restored"] for agent_type, stats in pool.stats().items()},
+        "store": pool.store.stats() if pool.store is not None else {},
+    }
+    if crash:
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+        # Killed while the sessions wait for their last input, nothing is closed nor flushed
+        os._exit(0)
+
+    await pool.close()
+    await runtime.close()
+    await Tools.db.close()
+    return result
+
+
+def copy_db(source: str, target: str) -> str:
+    """Copies a SQLite database, WAL included."""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+    return target
+
+
+def states(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM agent_state;").fetchone()[0]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50, help="sessions running at once, 0 for all")
+    parser.add_argument("--corpus", default="data/conversations.jsonl")
+    parser.add_argument("--seed", type=int, default=0)
+    # Internal, runs the first phase in the child process
+    parser.add_argument("--crash", nargs=2, metavar=("DB", "STATE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    os.environ["MODEL_STUB_LATENCY"] = "none"
+    os.environ["MODEL_STUB_SEED"] = str(args.seed)
+
+    if args.crash:
+        asyncio.run(run(args, args.crash[0], args.crash[1], crash=True))
+        return 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = common.fresh_db(directory)
+        state_path = os.path.join(directory, "sessions.db")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--crash", db_path, state_path],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        interrupted = json.loads(output.strip().splitlines()[-1])
+        state_size = sum(os.path.getsize(path) for path in (state_path, f"{state_path}-wal") if os.path.exists(path))
+        saved = states(state_path)
+
+        results = {}
+        for name, resume in (("resumed", True), ("started over", False)):
+            run_db = copy_db(db_path, os.path.join(directory, f"cars-{name}.db"))
+            run_state = copy_db(state_path, os.path.join(directory, f"sessions-{name}.db")) if resume else None
+            results[name] = asyncio.run(run(args, run_db, run_state, crash=False))
+        left = states(os.path.join(directory, "sessions-resumed.db"))
+
+    checkpoint = interrupted["pool"].get("checkpoint", {})
+    table = Table(title=f"Session state, {args.sessions} sessions interrupted before their last turn")
+    table.add_column("metric")
+    table.add_column("value", justify="right")
+    table.add_row("checkpoints", str(checkpoint.get("count", 0)))
+    table.add_row("checkpoint_mean_ms", f"{checkpoint.get('mean_ms', 0):.2f}")
+    table.add_row("checkpoint_p95_ms", f"{checkpoint.get('p95_ms', 0):.2f}")
+    store = interrupted["store"]
+    table.add_row("writes", str(store["writes"]))
+    table.add_row("unchanged, not written", str(store["unchanged"]))
+    table.add_row("bytes per write", f"{store['bytes_written'] / max(store['writes'], 1):.0f}")
+    table.add_row("saved agent states", str(saved))
+    table.add_row("store KiB per session (with WAL)", f"{state_size / 1024 / args.sessions:.1f}")
+    table.add_row("states left once the sessions ended", str(left))
+    for name, result in (("interrupted", interrupted), *results.items()):
+        table.add_row(f"turns answered, {name}", f"{result['answers']}/{result['turns']}")
+    print(table)
+
+    print_metrics("Resume latency", {"resume": results["resumed"]["pool"].get("resume", {})})
+    print_metrics("Restored agents", {"resumed": results["resumed"]["restored"]})
+    tools = sorted(set(results["resumed"]["tool_calls"]) | set(results["started over"]["tool_calls"]))
+    print_metrics(
+        "Tool calls of the last turns",
+        {name: {tool: result["tool_calls"].get(tool, 0) for tool in tools} for name, result in results.items()},
+    )
+    lost = sum(result["turns"] - result["answers"] for result in (interrupted, *results.values()))
+    if lost:
+        print(f"[red]{lost} turns were not answered[/red]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
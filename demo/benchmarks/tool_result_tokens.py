@@ -0,0 +1,74 @@
+"""
+Tokens needed to send the tool results of the cars.csv inventory to the model, with the previous
+serialization (the dataclass reprs) and the compact tables of encoders.py.
+Tokens are counted with the tiktoken encoding of the gpt-4o models, or estimated as characters / 4
+when the encoding cannot be downloaded (e.g. on an isolated CI).
+"""
+
+import asyncio
+import sys
+import tempfile
+from typing import Callable
+
+import common
+import tiktoken
+from datastore import AsyncCarDB
+from encoders import encode_cars, encode_orders, encode_search_result
+from rich import print
+from rich.table import Table
+
+
+async def results(path: str) -> dict:
+    """The results of the tools, as returned by the database (previous) and as encoded by the tools (compact)."""
+    db = AsyncCarDB(path)
+    await db.init()
+    all_cars = await db.find_cars()
+    tesla = await db.find_cars(brand="Tesla")
+    car = await db.get_car(all_cars[0].id)
+    orders = [
+        await db.create_order(car.id, "Mario Rossi", "mario.rossi@cardream.com")
+        for car in all_cars[:5]
+    ]
+    search = await db.search_cars("electric", limit=10)
+    await db.close()
+
+    return {
+        f"get_available_cars (all {len(all_cars)} cars)": (
+            all_cars,
+            encode_cars(all_cars, max_rows=len(all_cars)),
+        ),
+        "get_available_cars (all, first page)": (all_cars, encode_cars(all_cars)),
+        f"get_available_cars (Tesla, {len(tesla)} cars)": (tesla, encode_cars(tesla)),
+        "get_car": (car, encode_cars([car])),
+        f"get_orders ({len(orders)} orders)": (orders, encode_orders(orders)),
+        "search_cars ('electric', page 1)": (search, encode_search_result(search)),
+    }
+
+
+def token_counter() -> Callable[[str], int]:
+    try:
+        encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text))
+    except Exception as e:
+        print(f"[bold red]tiktoken encoding not available ({type(e).__name__}), estimating tokens as characters / 4[/bold red]")
+        return lambda text: len(text) // 4
+
+
+def main() -> int:
+    count_tokens = token_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        cases = asyncio.run(results(common.fresh_db(directory)))
+
+    table = Table(title="Tool result tokens")
+    for column in ("tool result", "repr", "compact", "saved"):
+        table.add_column(column, justify="right")
+    for name, (value, compact) in cases.items():
+        before = count_tokens(str(value))
+        after = count_tokens(compact)
+        table.add_row(name, str(before), str(after), f"{1 - after / before:.0%}")
+    print(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
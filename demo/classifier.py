@@ -0,0 +1,194 @@
+import hashlib
+import json
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from metrics import Metrics
+
+Vector = List[float]
+Embedder = Callable[[Sequence[str]], List[Vector]]
+
+BRANDS = r"audi|bmw|tesla|mercedes|toyota|ford|honda|volkswagen|hyundai|kia|nissan|chevrolet|porsche|volvo|mazda|lexus|fiat"
+
+# Keyword rules, a message is routed only when the rules of a single handoff target match
+TRIAGE_RULES: Dict[str, List[str]] = {
+    "sales_agent": [
+        r"\bmy (previous |last )?orders?\b",
+        r"\border (status|number|#?\d+)\b",
+        r"\b(cancel|delete)\b.*\border\b",
+        r"\border(ed)?\b.*\b(cancel|delete|anymore)\b",
+    ],
+    "advisor_agent": [
+        r"\b(buy|purchase|looking for|recommend|suggest)\b.*\b(cars?|suv|sedan|hatchback|wagon|ev)\b",
+        rf"\b({BRANDS})\b",
+        r"\b(suv|sedan|hatchback|electric|hybrid|diesel|mileage)\b",
+        r"\b(available|cheapest|budget|under \d+k?)\b.*\bcars?\b",
+    ],
+    "user_agent": [
+        r"\b(weather|joke|poem|football|news|recipe|restaurant|flight|homework)\b",
+    ],
+}
+
+
+# Function words carry no intent, they are ignored by the hashed embedding
+STOPWORDS = frozenset(
+    "a an the i i'm me my you your we is are am be to of for in on at with and or do does can could "
+    "would like want what which who how some any this that it please".split()
+)
+
+
+@dataclass(frozen=True)
+class Classification:
+    target: str
+    confidence: float
+    source: str
+
+
+def hashed_ngrams(texts: Sequence[str], dimensions: int = 512, n: int = 3) -> List[Vector]:
+    """
+    A dependency free local embedding: the character n-grams of the words (except the stopwords) are hashed into a fixed
+    size vector, normalized to unit length so that the dot product is the cosine similarity.
+    """
+    vectors = []
+    for text in texts:
+        vector = [0.0] * dimensions
+        for word in re.findall(r"[\w']+", text.lower()):
+            if word in STOPWORDS:
+                continue
+            padded = f" {word} "
+            for i in range(max(1, len(padded) - n + 1)):
+                digest = hashlib.blake2b(padded[i : i + n].encode(), digest_size=4).digest()
+                vector[int.from_bytes(digest, "little") % dimensions] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        vectors.append([value / norm for value in vector])
+    return vectors
+
+
+def sentence_transformer(model_name: str) -> Embedder:
+    """An embedder backed by a local sentence-transformers model (optional dependency)."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise ImportError(
+            "Embedding models require sentence-transformers, install it with `uv add sentence-transformers`."
+        ) from e
+
+    model = SentenceTransformer(model_name)
+    return lambda texts: model.encode(list(texts), normalize_embeddings=True).tolist()
+
+
+class ExampleIndex:
+    """
+    A small in-memory index of labeled examples, a message is classified as the label of its nearest
+    examples when they are similar enough and clearly closer than the examples of any other label.
+    """
+
+    def __init__(
+        self,
+        examples: List[Tuple[str, str]],
+        embed: Embedder = hashed_ngrams,
+        threshold: float = 0.5,
+        margin: float = 0.15,
+    ) -> None:
+        self.embed = embed
+        self.threshold = threshold
+        self.margin = margin
+        self.labels = [label for _, label in examples]
+        self.vectors = embed([text for text, _ in examples])
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "ExampleIndex":
+        """Loads the examples from a JSONL file of {"text", "label"} objects."""
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        examples = [(row["text"], row["label"]) for row in rows]
+        return cls(examples, **kwargs)
+
+    def classify(self, text: str) -> Optional[Classification]:
+        query = self.embed([text])[0]
+        best: Dict[str, float] = {}
+        for label, vector in zip(self.labels, self.vectors):
+            similarity = sum(a * b for a, b in zip(query, vector))
+            best[label] = max(best.get(label, -1.0), similarity)
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        label, similarity = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if similarity < self.threshold or similarity - runner_up < self.margin:
+            return None
+        return Classification(label, similarity, "embedding")
+
+
+class TriageClassifier:
+    """
+    A local pre-classifier for the triage: keyword rules first, then the optional example index.
+    Returns None for ambiguous messages, that are left to the LLM.
+    """
+
+    def __init__(
+        self,
+        rules: Dict[str, List[str]] = TRIAGE_RULES,
+        index: Optional[ExampleIndex] = None,
+    ) -> None:
+        self.rules = {
+            target: [re.compile(pattern, re.I) for pattern in patterns]
+            for target, patterns in rules.items()
+        }
+        self.index = index
+
+    def classify(self, text: str) -> Optional[Classification]:
+        targets = [
+            target
+            for target, patterns in self.rules.items()
+            if any(pattern.search(text) for pattern in patterns)
+        ]
+        if len(targets) == 1:
+            return Classification(targets[0], 1.0, "rules")
+        if len(targets) > 1:
+            # Conflicting keywords, e.g. cancelling an order to buy another car
+            return None
+        return self.index.classify(text) if self.index is not None else None
+
+    @classmethod
+    def from_env(cls) -> Optional["TriageClassifier"]:
+        """
+        Creates the classifier configured by TRIAGE_FAST_PATH: `rules`, `embeddings` (rules and the examples
+        in TRIAGE_EXAMPLES_PATH, embedded by TRIAGE_EMBEDDING_MODEL when set) or `none`.
+        """
+        mode = os.getenv("TRIAGE_FAST_PATH", "embeddings").lower()
+        match mode:
+            case "none" | "":
+                return None
+            case "rules":
+                return cls()
+            case "embeddings":
+                model_name = os.getenv("TRIAGE_EMBEDDING_MODEL")
+                index = ExampleIndex.load(
+                    os.getenv("TRIAGE_EXAMPLES_PATH", "data/triage_examples.jsonl"),
+                    **({"embed": sentence_transformer(model_name)} if model_name else {}),
+                )
+                return cls(index=index)
+            case _:
+                raise ValueError(f"Unknown TRIAGE_FAST_PATH mode '{mode}'")
+
+
+def fast_path_summary(metrics: Metrics) -> Dict[str, Dict[str, float]]:
+    """
+    Summarizes the triage turns recorded by the TriageAgent: the fast path hit rate and the latency
+    saved per turn, estimated from the mean latency of the turns classified by the LLM.
+    """
+    fast_path = metrics.get("triage:fast_path")
+    llm = metrics.get("triage:llm")
+    turns = fast_path.count + llm.count
+    saved = fast_path.count * max(0.0, llm.mean - fast_path.mean) if llm.count else 0.0
+    return {
+        "triage": {
+            "turns": turns,
+            "fast_path_hits": fast_path.count,
+            "hit_rate": fast_path.count / turns if turns else 0.0,
+            "saved_ms_per_turn": saved / turns * 1000 if turns else 0.0,
+        }
+    }
@@ -0,0 +1,250 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional
+
+from autogen_core.model_context import (
+    ChatCompletionContext,
+    ChatCompletionContextState,
+    UnboundedChatCompletionContext,
+)
+from autogen_core.models import (
+    AssistantMessage,
+    ChatCompletionClient,
+    FunctionExecutionResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    SystemMessage,
+    UserMessage,
+)
+from usage import background_context, usage_kind
+from utils import print_error
+
+SUMMARY_PROMPT = """
+Summarize the following conversation between a car dealership assistant and a customer in a few sentences.
+Keep the customer preferences (brands, budget, fuel, year), the cars and car ids discussed, the customer name and email
+and the orders created or cancelled. Extend the existing summary, if any.
+"""
+
+
+@dataclass(frozen=True)
+class ContextPolicy:
+    """
+    How much of the conversation an agent sends to the model.
+    `max_tokens` is the budget of the conversation history (the system prompt excluded), older turns are dropped
+    and, if `summarize` is set, folded into a summary written in the background by the model.
+    The tool results older than the last `keep_tool_results` ones are compacted to `compacted_result_chars`.
+    """
+
+    max_tokens: int = 4000
+    keep_tool_results: int = 1
+    compacted_result_chars: int = 300
+    summarize: bool = True
+
+
+# The policies of the agents keeping a conversation, agents not listed keep the whole conversation
+CONTEXT_POLICIES: Dict[str, ContextPolicy] = {
+    "advisor_agent": ContextPolicy(max_tokens=4000, keep_tool_results=1),
+    "sales_agent": ContextPolicy(max_tokens=3000, keep_tool_results=2),
+}
+
+
+class BoundedChatCompletionContext(ChatCompletionContext):
+    """
+    A model context bounded by a ContextPolicy: old tool results are compacted, the history is kept within
+    a token budget cutting it at the start of a user turn (so tool calls and results are never split)
+    and the evicted turns are summarized in the background, the summary is sent before the history.
+    """
+
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        policy: ContextPolicy = ContextPolicy(),
+        initial_messages: List[LLMMessage] | None = None,
+    ) -> None:
+        super().__init__(initial_messages)
+        self._model_client = model_client
+        self._policy = policy
+        self._summary = ""
+        self._summary_task: Optional[asyncio.Task[None]] = None
+
+    async def get_messages(self) -> List[LLMMessage]:
+        self._compact_tool_results()
+
+        start = self._window_start()
+        if start > 0:
+            evicted, self._messages = self._messages[:start], self._messages[start:]
+            if self._policy.summarize:
+                self._schedule_summary(evicted)
+
+        if not self._summary:
+            return list(self._messages)
+        return [
+            SystemMessage(content=f"Summary of the earlier conversation: {self._summary}"),
+            *self._messages,
+        ]
+
+    def _compact_tool_results(self) -> None:
+        results = [
+            i
+            for i, message in enumerate(self._messages)
+            if isinstance(message, FunctionExecutionResultMessage)
+        ]
+        limit = self._policy.compacted_result_chars
+        for i in results[: max(0, len(results) - self._policy.keep_tool_results)]:
+            message = self._messages[i]
+            if all(len(result.content) <= limit for result in message.content):
+                continue
+            self._messages[i] = FunctionExecutionResultMessage(
+                content=[
+                    FunctionExecutionResult(
+                        content=(
+                            result.content
+                            if len(result.content) <= limit
+                            else f"{result.content[:limit]}... ({len(result.content) - limit} characters omitted)"
+                        ),
+                        name=result.name,
+                        call_id=result.call_id,
+                        is_error=result.is_error,
+                    )
+                    for result in message.content
+                ]
+            )
+
+    def _window_start(self) -> int:
+        """
+        Returns the index of the oldest message to keep: the oldest user message from which the history
+        fits the budget, or the last user message when even the current turn exceeds it.
+        """
+        tokens = 0
+        start = len(self._messages)
+        last_user_message = None
+        for i in range(len(self._messages) - 1, -1, -1):
+            tokens += self._model_client.count_tokens([self._messages[i]])
+            is_turn_start = isinstance(self._messages[i], UserMessage)
+            if is_turn_start and last_user_message is None:
+                last_user_message = i
+            if tokens > self._policy.max_tokens:
+                break
+            if is_turn_start:
+                start = i
+        if start == len(self._messages):
+            return last_user_message or 0
+        return start
+
+    def _schedule_summary(self, evicted: List[LLMMessage]) -> None:
+        # Summaries are chained, so each one extends the previous
+        previous = self._summary_task
+        self._summary_task = asyncio.create_task(
+            self._summarize(previous, evicted), context=background_context()
+        )
+
+    async def _summarize(
+        self, previous: Optional["asyncio.Task[None]"], evicted: List[LLMMessage]
+    ) -> None:
+        if previous is not None:
+            await previous
+        transcript = "\n".join(_transcript_line(message) for message in evicted)
+        try:
+            with usage_kind("summary"):
+                result = await self._model_client.create(
+                    [
+                        SystemMessage(content=SUMMARY_PROMPT),
+                        UserMessage(
+                            content=f"Existing summary: {self._summary or 'none'}\n\nConversation:\n{transcript}",
+                            source="user",
+                        ),
+                    ]
+                )
+        except Exception as e:
+            # The turns are dropped without summary, the conversation can continue
+            print_error(f"Conversation summary failed: {e!r}")
+            return
+        if isinstance(result.content, str):
+            self._summary = result.content
+
+    async def wait_for_summary(self) -> None:
+        """Waits for the pending summaries, if any."""
+        if self._summary_task is not None:
+            await self._summary_task
+
+    async def clear(self) -> None:
+        await super().clear()
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+            self._summary_task = None
+        self._summary = ""
+
+    async def save_state(self) -> Mapping[str, Any]:
+        return BoundedContextState(messages=self._messages, summary=self._summary).model_dump()
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        loaded = BoundedContextState.model_validate(state)
+        self._messages = loaded.messages
+        self._summary = loaded.summary
+
+
+class BoundedContextState(ChatCompletionContextState):
+    summary: str = ""
+
+
+class SessionChatCompletionContext(ChatCompletionContext):
+    """
+    Sends the per-session messages (see prompts.session_context) before the conversation kept by `context`,
+    they are never evicted nor saved with the state since the agent rebuilds them.
+    """
+
+    def __init__(self, context: ChatCompletionContext, session_messages: List[LLMMessage]) -> None:
+        super().__init__()
+        self.context = context
+        self._session_messages = list(session_messages)
+
+    async def add_message(self, message: LLMMessage) -> None:
+        await self.context.add_message(message)
+
+    async def get_messages(self) -> List[LLMMessage]:
+        return [*self._session_messages, *await self.context.get_messages()]
+
+    async def clear(self) -> None:
+        await self.context.clear()
+
+    async def save_state(self) -> Mapping[str, Any]:
+        return await self.context.save_state()
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        await self.context.load_state(state)
+
+
+def _transcript_line(message: LLMMessage) -> str:
+    if isinstance(message, UserMessage):
+        return f"Customer: {message.content}"
+    if isinstance(message, AssistantMessage):
+        if isinstance(message.content, str):
+            return f"Assistant: {message.content}"
+        return "Assistant called: " + ", ".join(
+            f"{call.name}({call.arguments})" for call in message.content
+        )
+    if isinstance(message, FunctionExecutionResultMessage):
+        return "Tool results: " + " ".join(result.content for result in message.content)
+    return str(message.content)
+
+
+def get_model_context(
+    agent_type: str,
+    model_client: ChatCompletionClient,
+    session_messages: Optional[List[LLMMessage]] = None,
+) -> ChatCompletionContext:
+    """
+    Returns the model context of an agent type following its policy in CONTEXT_POLICIES,
+    set CONTEXT_POLICY=unbounded to keep the whole conversation for every agent.
+    The `session_messages`, if any, are sent before the conversation.
+    """
+    policy = CONTEXT_POLICIES.get(agent_type)
+    context: ChatCompletionContext
+    if policy is None or os.getenv("CONTEXT_POLICY", "bounded").lower() == "unbounded":
+        context = UnboundedChatCompletionContext()
+    else:
+        context = BoundedChatCompletionContext(model_client, policy)
+    if session_messages:
+        context = SessionChatCompletionContext(context, session_messages)
+    return context
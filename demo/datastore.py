@@ -1,13 +1,22 @@
-import csv
+import asyncio
 import datetime
+import functools
+import os
+import re
 import sqlite3
-from dataclasses import dataclass
-from typing import Any, List, Optional
-
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from cache import TTLCache
+from importer import ImportReport, import_cars
+from metrics import Metrics
+from migrations import migrate
 from utils import print_error, print_info
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Car:
     id: int
     brand: str
@@ -20,7 +29,7 @@ class Car:
     is_available: bool
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Order:
     id: int
     car: Car
@@ -31,76 +40,190 @@ class Order:
     is_available: bool
 
 
-# Represents a temporary cache for car IDs that the Advisor agent uses to get the id of the car the user wishes to buy.
-# A better approach could be to use a database, and pass the session id to the order agent instead of the car id in the prompt.
+# Hands the car id cached by the cache_carId tool to the Advisor agent that invoked it, within the same turn.
+# The Advisor agent keeps the id in its own state, that is saved with the session (see lifecycle.py).
 class CarIdCache:
     """
-    Represents a temporary cache for car IDs that the Advisor agent uses to get the id of the car the user wishes to buy.
-    # A better approach could be to use a database, and pass the session id to the order agent instead of the car id in the cache.
+    Represents a temporary cache for car IDs, read and cleared by the Advisor agent at the end of the turn
+    in which the tool was used.
     """
 
     cache: dict = {}
 
 
+@dataclass(slots=True, frozen=True)
+class SearchResult:
+    cars: List[Car]
+    # Number of cars matching the search, across all pages
+    total: int
+    # For each facet field, the number of matching cars per value
+    facets: Dict[str, Dict[str, int]]
+
+
+class OrderConflictError(ValueError):
+    """Raised when a car is no longer available because it has been ordered in the meantime."""
+
+    def __init__(self, car_id: int):
+        super().__init__(f"Car with id {car_id} is no longer available.")
+        self.car_id = car_id
+
+
+@dataclass(frozen=True)
+class SQLiteProfile:
+    """
+    Connection settings applied to every CarDB connection.
+    Pragmas left to None keep the SQLite defaults.
+    """
+
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    mmap_size: Optional[int] = None
+    # Negative values are expressed in KiB, positive ones in pages
+    cache_size: Optional[int] = None
+    # Seconds a connection waits for a lock before failing with "database is locked"
+    busy_timeout: float = 5.0
+    # Size of the per-connection prepared statements cache
+    cached_statements: int = 128
+
+
+DEFAULT_PROFILE = SQLiteProfile()
+
+# WAL lets readers proceed while an order is being written, synchronous=NORMAL is safe with WAL
+# and avoids an fsync on every commit.
+PRODUCTION_PROFILE = SQLiteProfile(
+    journal_mode="WAL",
+    synchronous="NORMAL",
+    mmap_size=256 * 1024 * 1024,
+    cache_size=-64 * 1024,
+    cached_statements=256,
+)
+
+PROFILES = {"default": DEFAULT_PROFILE, "production": PRODUCTION_PROFILE}
+
+
+def get_profile() -> SQLiteProfile:
+    """The profile selected by CARDB_PROFILE: default or production (default)."""
+    name = os.getenv("CARDB_PROFILE", "production").lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown CARDB_PROFILE '{name}', expected one of {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+# The selected columns follow the dataclass fields order, so rows can be mapped positionally
+CAR_COLUMNS = ", ".join(field.name for field in fields(Car))
+ORDER_COLUMNS = ", ".join(
+    f"o.{field.name}" for field in fields(Order) if field.name != "car"
+)
+ORDER_CAR_COLUMNS = ", ".join(f"c.{field.name}" for field in fields(Car))
+
+
+def _car_factory(cursor: sqlite3.Cursor, row: Tuple) -> Car:
+    return Car(*row)
+
+
+def _order_factory(cursor: sqlite3.Cursor, row: Tuple) -> Order:
+    # Order columns come first (without the car), followed by the car ones
+    return Order(row[0], Car(*row[6:]), *row[1:6])
+
+
+CAR_QUERY = f"SELECT {CAR_COLUMNS} FROM Cars WHERE id = ?"
+AVAILABLE_CAR_QUERY = CAR_QUERY + " AND is_available = 1"
+
+ORDERS_QUERY = f"""
+    SELECT {ORDER_COLUMNS}, {ORDER_CAR_COLUMNS}
+    FROM Orders o
+    JOIN Cars c ON o.car_id = c.id
+"""
+ORDER_QUERY = ORDERS_QUERY + " WHERE o.id = ?"
+AVAILABLE_ORDER_QUERY = ORDER_QUERY + " AND o.is_available = 1"
+CUSTOMER_ORDERS_QUERY = (
+    ORDERS_QUERY + " WHERE o.customer_name = ? AND o.is_available = 1"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_cars_query(brand: bool, year: bool, price: bool) -> str:
+    """Builds the find_cars query once for each combination of filters."""
+    query = f"SELECT {CAR_COLUMNS} FROM Cars WHERE is_available = 1"
+    if brand:
+        query += " AND brand = ?"
+    if year:
+        query += " AND year = ?"
+    if price:
+        query += " AND price <= ?"
+    return query
+
+
+SEARCH_FACETS = ("brand", "fuel", "color", "year")
+
+
+def _search_terms(text: str) -> str:
+    """Turns free text into an FTS5 query matching all the words as prefixes, without FTS syntax injection."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+@functools.lru_cache(maxsize=None)
+def _placeholders(count: int) -> str:
+    return ", ".join("?" * count)
+
+
 class CarDB:
     """
     A class to manage the car database using SQLite.
     It provides methods to create, read, update, and delete car and order records.
     """
 
-    def __init__(self, db_name: str = "data/cars.db"):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(
+        self,
+        db_name: str = "data/cars.db",
+        check_same_thread: bool = True,
+        profile: SQLiteProfile = DEFAULT_PROFILE,
+    ):
+        self.conn = sqlite3.connect(
+            db_name,
+            check_same_thread=check_same_thread,
+            timeout=profile.busy_timeout,
+            cached_statements=profile.cached_statements,
+        )
         self.conn.row_factory = sqlite3.Row
+        self._apply_profile(profile)
+
+    def _apply_profile(self, profile: SQLiteProfile):
+        """Applies the profile pragmas to the connection."""
+        if profile.journal_mode is not None:
+            self.conn.execute(f"PRAGMA journal_mode = {profile.journal_mode};")
+        if profile.synchronous is not None:
+            self.conn.execute(f"PRAGMA synchronous = {profile.synchronous};")
+        if profile.mmap_size is not None:
+            self.conn.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)};")
+        if profile.cache_size is not None:
+            self.conn.execute(f"PRAGMA cache_size = {int(profile.cache_size)};")
+
+    def _query(self, row_factory, sql: str, params=()) -> sqlite3.Cursor:
+        """Executes a query whose rows are mapped by `row_factory`, without building intermediate Row objects."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = row_factory
+        return cursor.execute(sql, params)
 
     def init(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        if len(tables) == 0:
-            try:
-                print_info("Database does not exist, creating...")
-                self._create_tables()
-                print_info("Importing cars...")
-                self._import_cars("data/cars.csv")
-                print_info("Database initialized successfully!")
-            except Exception as e:
-                print_error(f"Error initializing database: {e}")
-
-    def _create_tables(self):
-        """Creates the Cars and Orders tables if they don't exist."""
-
-        print_info("Creating tables...")
-
-        # Create Cars table
-        create_cars_table_sql = """
-        CREATE TABLE IF NOT EXISTS Cars (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            brand TEXT NOT NULL,
-            year INTEGER NOT NULL,
-            price INTEGER NOT NULL,
-            color TEXT,
-            mileage INTEGER,
-            fuel TEXT,
-            model TEXT,
-            is_available BOOLEAN NOT NULL
-        );
         """
-        self.conn.execute(create_cars_table_sql)
-
-        create_orders_table_sql = """
-        CREATE TABLE IF NOT EXISTS Orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            car_id INTEGER NOT NULL,
-            customer_name TEXT NOT NULL,
-            customer_email TEXT NOT NULL,
-            date TEXT NOT NULL,
-            status TEXT,
-            is_available BOOLEAN NOT NULL,
-            FOREIGN KEY (car_id) REFERENCES Cars (id)
-        );
+        Upgrades the database schema to the latest version, importing the cars when the database is new.
         """
-        self.conn.execute(create_orders_table_sql)
-        self.conn.commit()
+        cursor = self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='Cars';"
+        )
+        is_new = cursor.fetchone() is None
+        try:
+            if is_new:
+                print_info("Database does not exist, creating...")
+            migrate(self.conn)
+            if is_new:
+                print_info("Importing cars...")
+                report = self.import_cars("data/cars.csv")
+                print_info(f"Database initialized successfully! {report}")
+            # Refreshes the statistics used by the query planner
+            self.conn.execute("PRAGMA optimize;")
+        except Exception as e:
+            print_error(f"Error initializing database: {e}")
 
     def create_order(
         self, car_id: int, customer_name: str, customer_email: str
@@ -109,25 +232,33 @@ class CarDB:
         Creates a new order in the Orders table.
         Updates the associated car's is_available field to False.
         Returns the newly created Order object.
-        """
 
-        car = self.get_car(car_id)
-        if not car:
-            raise ValueError(f"Car with id {car_id} not found.")
+        The car is reserved with a conditional update in the same transaction that inserts the order,
+        so when concurrent sessions order the same car only one of them succeeds, the others get an
+        OrderConflictError.
+        """
 
         date = datetime.date.today().isoformat()
         status = "order created"
 
-        cursor = self.conn.execute(
-            """
-            INSERT INTO Orders (car_id, customer_name, customer_email, date, status, is_available)
-            VALUES (?, ?, ?, ?, ?, ?);
-            """,
-            (car_id, customer_name.lower(), customer_email.lower(), date, status, True),
-        )
-
-        self.conn.execute("UPDATE Cars SET is_available = 0 WHERE id = ?;", (car_id,))
-        self.conn.commit()
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE Cars SET is_available = 0 WHERE id = ? AND is_available = 1;",
+                (car_id,),
+            )
+            if cursor.rowcount == 0:
+                if self.get_car(car_id, include_unavailable=True) is None:
+                    raise ValueError(f"Car with id {car_id} not found.")
+                raise OrderConflictError(car_id)
+
+            cursor = self.conn.execute(
+                """
+                INSERT INTO Orders (car_id, customer_name, customer_email, date, status, is_available)
+                VALUES (?, ?, ?, ?, ?, ?);
+                """,
+                (car_id, customer_name.lower(), customer_email.lower(), date, status, True),
+            )
+            car = self.get_car(car_id, include_unavailable=True)
 
         return Order(
             id=cursor.lastrowid,
@@ -149,62 +280,38 @@ class CarDB:
         )
         return cursor.fetchone() is not None
 
-    def delete_order(self, order_id: int) -> None:
+    def delete_order(self, order_id: int) -> Optional[int]:
         """
         Deletes (marks as unavailable) an order from the Orders table by its ID.
         Updates the associated car's is_available field to True and sets the order's status to 'Deleted'.
+        Returns the id of the car of the order, or None if the order does not exist or is already deleted.
+
+        The order is marked with a conditional update in the same transaction that frees the car, so when
+        concurrent sessions delete the same order only one of them frees the car, which could otherwise
+        have been ordered again in the meantime.
         """
-        cursor = self.conn.execute(
-            "SELECT car_id FROM Orders WHERE id = ?;", (order_id,)
-        )
-        row = cursor.fetchone()
-        if row:
-            car_id = row["car_id"]
-            self.conn.execute(
-                "UPDATE Cars SET is_available = 1 WHERE id = ?;", (car_id,)
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE Orders SET is_available = 0, is_deleted = 1, status = 'Deleted' WHERE id = ? AND is_deleted = 0;",
+                (order_id,),
             )
+            if cursor.rowcount != 1:
+                return None
+            car_id = self.conn.execute(
+                "SELECT car_id FROM Orders WHERE id = ?;", (order_id,)
+            ).fetchone()["car_id"]
             self.conn.execute(
-                "UPDATE Orders SET is_available = 0, status = 'Deleted' WHERE id = ?;",
-                (order_id,),
+                "UPDATE Cars SET is_available = 1 WHERE id = ?;", (car_id,)
             )
-            self.conn.commit()
+        return car_id
 
     def get_orders_by_customer(self, customer_name: str) -> List[Order]:
         """
         Retrieves all orders made by a specific customer, including the associated Car object.
         """
-        cursor = self.conn.execute(
-            """
-            SELECT o.*, c.id as car_id, c.brand, c.year, c.price, c.color, c.mileage, c.fuel, c.model, c.is_available
-            FROM Orders o
-            JOIN Cars c ON o.car_id = c.id
-            WHERE o.customer_name = ? AND o.is_available = 1;
-            """,
-            (customer_name.lower(),),
-        )
-        rows = cursor.fetchall()
-        return [
-            Order(
-                id=row["id"],
-                car=Car(
-                    id=row["car_id"],
-                    brand=row["brand"],
-                    year=row["year"],
-                    price=row["price"],
-                    color=row["color"],
-                    mileage=row["mileage"],
-                    fuel=row["fuel"],
-                    model=row["model"],
-                    is_available=row["is_available"],
-                ),
-                customer_name=row["customer_name"],
-                customer_email=row["customer_email"],
-                date=row["date"],
-                status=row["status"],
-                is_available=row["is_available"],
-            )
-            for row in rows
-        ]
+        return self._query(
+            _order_factory, CUSTOMER_ORDERS_QUERY, (customer_name.lower(),)
+        ).fetchall()
 
     def get_order(
         self, order_id: int, include_deleted: bool = False
@@ -213,65 +320,33 @@ class CarDB:
         Retrieves an order from the Orders table based on its ID, including the associated Car object.
         If `include_deleted` is True, retrieves orders regardless of their availability.
         """
-        query = """
-            SELECT o.*, c.id as car_id, c.brand, c.year, c.price, c.color, c.mileage, c.fuel, c.model, c.is_available
-            FROM Orders o
-            JOIN Cars c ON o.car_id = c.id
-            WHERE o.id = ?
+        query = ORDER_QUERY if include_deleted else AVAILABLE_ORDER_QUERY
+        return self._query(_order_factory, query, (order_id,)).fetchone()
+
+    def get_orders_by_ids(
+        self, order_ids: List[int], include_deleted: bool = False
+    ) -> List[Order]:
+        """
+        Retrieves several orders with a single query, in the order of `order_ids`.
+        Orders that do not exist (or are deleted, unless `include_deleted` is True) are omitted.
         """
+        ids = list(dict.fromkeys(order_ids))
+        if not ids:
+            return []
+        query = f"{ORDERS_QUERY} WHERE o.id IN ({_placeholders(len(ids))})"
         if not include_deleted:
             query += " AND o.is_available = 1"
+        orders = {order.id: order for order in self._query(_order_factory, query, ids)}
+        return [orders[order_id] for order_id in ids if order_id in orders]
 
-        cursor = self.conn.execute(query, (order_id,))
-        row = cursor.fetchone()
-        if row:
-            return Order(
-                id=row["id"],
-                car=Car(
-                    id=row["car_id"],
-                    brand=row["brand"],
-                    year=row["year"],
-                    price=row["price"],
-                    color=row["color"],
-                    mileage=row["mileage"],
-                    fuel=row["fuel"],
-                    model=row["model"],
-                    is_available=row["is_available"],
-                ),
-                customer_name=row["customer_name"],
-                customer_email=row["customer_email"],
-                date=row["date"],
-                status=row["status"],
-                is_available=row["is_available"],
-            )
-        return None
-
-    def _import_cars(self, csv_file: str):
+    def import_cars(
+        self, path: str, batch_size: int = 1000, upsert: bool = True
+    ) -> ImportReport:
         """
-        Reads cars data from a CSV file and inserts them into the Cars table.
-        Assumes the CSV has columns: id, brand, year, price, color, mileage, fuel, model.
+        Streams the cars of a feed (csv, jsonl or parquet) into the Cars table in batches.
+        Expects the columns: id, brand, year, price, color, mileage, fuel, model.
         """
-        with open(csv_file, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            cars = []
-            for row in reader:
-                car = (
-                    int(row["id"]),
-                    row["brand"],
-                    int(row["year"]),
-                    int(row["price"]),
-                    row["color"],
-                    int(row["mileage"]),
-                    row["fuel"],
-                    row["model"],
-                    True,
-                )
-                cars.append(car)
-            self.conn.executemany(
-                "INSERT OR REPLACE INTO Cars (id,brand, year, price, color, mileage, fuel, model, is_available) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
-                cars,
-            )
-            self.conn.commit()
+        return import_cars(self.conn, path, batch_size=batch_size, upsert=upsert)
 
     def delete_car(self, car_id: int) -> None:
         """Deletes a car from the Cars table based on its id."""
@@ -283,64 +358,374 @@ class CarDB:
         Retrieves a car from the Cars table based on its id.
         By default, only retrieves available cars unless `include_unavailable` is True.
         """
-        query = "SELECT * FROM Cars WHERE id = ?"
+        query = CAR_QUERY if include_unavailable else AVAILABLE_CAR_QUERY
+        return self._query(_car_factory, query, (car_id,)).fetchone()
+
+    def get_cars(
+        self, car_ids: List[int], include_unavailable: bool = False
+    ) -> List[Car]:
+        """
+        Retrieves several cars with a single query, in the order of `car_ids`.
+        Cars that do not exist (or are not available, unless `include_unavailable` is True) are omitted.
+        """
+        ids = list(dict.fromkeys(car_ids))
+        if not ids:
+            return []
+        query = f"SELECT {CAR_COLUMNS} FROM Cars WHERE id IN ({_placeholders(len(ids))})"
         if not include_unavailable:
             query += " AND is_available = 1"
-        cursor = self.conn.execute(query, (car_id,))
-        row = cursor.fetchone()
-        if row:
-            return Car(
-                id=row["id"],
-                brand=row["brand"],
-                year=row["year"],
-                price=row["price"],
-                color=row["color"],
-                mileage=row["mileage"],
-                fuel=row["fuel"],
-                model=row["model"],
-                is_available=row["is_available"],
-            )
-        return None
+        cars = {car.id: car for car in self._query(_car_factory, query, ids)}
+        return [cars[car_id] for car_id in ids if car_id in cars]
 
     def find_cars(
         self,
         brand: Optional[str] = None,
         year: Optional[int] = None,
         price: Optional[int] = None,
-    ) -> List[Car]:
+        lazy: bool = False,
+    ) -> Union[List[Car], Iterator[Car]]:
         """
         Finds all available cars that match the provided filters.
         Filters can be combined (e.g., brand and year).
+        If `lazy` is True, returns an iterator that fetches the cars while it is consumed
+        instead of materializing the whole result set.
         """
-        query = "SELECT * FROM Cars WHERE is_available = 1"
+        params: List[Any] = [
+            value for value in (brand, year, price) if value is not None
+        ]
+        query = _find_cars_query(brand is not None, year is not None, price is not None)
+        cursor = self._query(_car_factory, query, params)
+        return cursor if lazy else cursor.fetchall()
+
+    def search_cars(
+        self,
+        text: Optional[str] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        max_mileage: Optional[int] = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> SearchResult:
+        """
+        Searches the available cars matching all the words of `text` (against brand, model, color and fuel)
+        and the range filters. Returns a page of cars, best matches first (cheapest first without text),
+        the total number of matches and the facet counts over all of them.
+        """
+        source = "Cars c"
+        conditions = ["c.is_available = 1"]
         params: List[Any] = []
 
-        if brand is not None:
-            query += " AND brand = ?"
-            params.append(brand)
-        if year is not None:
-            query += " AND year = ?"
-            params.append(year)
-        if price is not None:
-            query += " AND price <= ?"
-            params.append(price)
-
-        cursor = self.conn.execute(query, params)
-        rows = cursor.fetchall()
-        return [
-            Car(
-                id=row["id"],
-                brand=row["brand"],
-                year=row["year"],
-                price=row["price"],
-                color=row["color"],
-                mileage=row["mileage"],
-                fuel=row["fuel"],
-                model=row["model"],
-                is_available=row["is_available"],
-            )
-            for row in rows
-        ]
+        terms = _search_terms(text or "")
+        if terms:
+            source = "CarsFts f JOIN Cars c ON c.id = f.rowid"
+            conditions.append("CarsFts MATCH ?")
+            params.append(terms)
+        for condition, value in (
+            ("c.year >= ?", min_year),
+            ("c.year <= ?", max_year),
+            ("c.price >= ?", min_price),
+            ("c.price <= ?", max_price),
+            ("c.mileage <= ?", max_mileage),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        where = f"FROM {source} WHERE {' AND '.join(conditions)}"
+        order = "f.rank, c.price" if terms else "c.price, c.id"
+        cars = self._query(
+            _car_factory,
+            f"SELECT {ORDER_CAR_COLUMNS} {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        total = self.conn.execute(f"SELECT COUNT(*) {where}", params).fetchone()[0]
+        facets = {
+            facet: {
+                str(row[0]): row[1]
+                for row in self.conn.execute(
+                    f"SELECT c.{facet}, COUNT(*) {where} GROUP BY c.{facet} ORDER BY COUNT(*) DESC",
+                    params,
+                )
+            }
+            for facet in SEARCH_FACETS
+        }
+        return SearchResult(cars=cars, total=total, facets=facets)
 
     def close(self):
         self.conn.close()
+
+
+class AsyncCarDB:
+    """
+    An asyncio friendly wrapper around CarDB, so that agents never block the runtime on disk I/O.
+    Reads are served by a bounded pool of connections running on a thread pool, while all writes
+    go through a single connection so that they are serialized without contending with each other.
+    Per-query latency and pool-wait times are collected in `metrics`.
+
+    get_car and find_cars results are served from a read-through cache, the writes invalidate only
+    the entries that could include the cars they change. With `shared` other processes write to the database
+    too (the workers of the distributed runtime): their commits are detected with PRAGMA data_version before
+    every cached read, and clear the cache.
+    """
+
+    def __init__(
+        self,
+        db_name: str = "data/cars.db",
+        readers: int = 4,
+        profile: SQLiteProfile = DEFAULT_PROFILE,
+        cache_size: int = 1024,
+        cache_ttl: Optional[float] = 60.0,
+        shared: bool = False,
+    ):
+        self.db_name = db_name
+        self.profile = profile
+        self.metrics = Metrics()
+
+        self._car_cache: TTLCache[Tuple[int, bool], Optional[Car]] = TTLCache(
+            cache_size, cache_ttl
+        )
+        self._find_cache: TTLCache[
+            Tuple[Optional[str], Optional[int], Optional[int]], List[Car]
+        ] = TTLCache(cache_size, cache_ttl)
+        # Bumped by every invalidation, a read that started before it must not fill the cache with stale results
+        self._generation = 0
+        # data_version changes when another connection commits, it is read on a connection of its own
+        self.shared = shared
+        self._version_conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._connections: List[CarDB] = []
+
+        # Connections are created lazily, the pool starts with a placeholder for each reader.
+        self._readers: asyncio.Queue[Optional[CarDB]] = asyncio.Queue()
+        for _ in range(readers):
+            self._readers.put_nowait(None)
+        self._reader_executor = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="cardb-reader"
+        )
+
+        self._writer: List[Optional[CarDB]] = [None]
+        self._write_lock = asyncio.Lock()
+        self._writer_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cardb-writer"
+        )
+
+    def _call(self, slot: List[Optional[CarDB]], method: str, args, kwargs) -> Any:
+        if slot[0] is None:
+            slot[0] = CarDB(
+                self.db_name, check_same_thread=False, profile=self.profile
+            )
+            self._connections.append(slot[0])
+        return getattr(slot[0], method)(*args, **kwargs)
+
+    async def _read(self, method: str, *args, **kwargs) -> Any:
+        """Runs a CarDB read method on a pooled reader connection."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        slot = [await self._readers.get()]
+        acquired = time.perf_counter()
+        self.metrics.record("pool_wait", acquired - start)
+
+        def release(_) -> None:
+            # The connection goes back to the pool only once the query has really completed,
+            # even if the awaiting task has been cancelled in the meantime.
+            loop.call_soon_threadsafe(self._readers.put_nowait, slot[0])
+
+        future = self._reader_executor.submit(self._call, slot, method, args, kwargs)
+        future.add_done_callback(release)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            self.metrics.record(method, time.perf_counter() - acquired)
+
+    async def _write(self, method: str, *args, **kwargs) -> Any:
+        """Runs a CarDB write method on the single writer connection."""
+        start = time.perf_counter()
+        async with self._write_lock:
+            acquired = time.perf_counter()
+            self.metrics.record("writer_wait", acquired - start)
+            future = self._writer_executor.submit(
+                self._call, self._writer, method, args, kwargs
+            )
+            try:
+                # Even if the caller is cancelled the single threaded executor keeps writes serialized
+                return await asyncio.wrap_future(future)
+            finally:
+                self.metrics.record(method, time.perf_counter() - acquired)
+
+    def _invalidate_car(self, car: Car) -> None:
+        """Drops the cached lookups whose result could include `car`."""
+        self._generation += 1
+        self._car_cache.invalidate(lambda key: key[0] == car.id)
+        self._find_cache.invalidate(
+            lambda key: (key[0] is None or key[0] == car.brand)
+            and (key[1] is None or key[1] == car.year)
+            and (key[2] is None or car.price <= key[2])
+        )
+
+    async def _invalidate_car_id(self, car_id: int) -> None:
+        car = await self._read("get_car", car_id, include_unavailable=True)
+        if car is None:
+            # Without the car details every cached search could be affected
+            self._invalidate_all()
+        else:
+            self._invalidate_car(car)
+
+    def _invalidate_all(self) -> None:
+        self._generation += 1
+        self._car_cache.clear()
+        self._find_cache.clear()
+
+    def _check_data_version(self) -> None:
+        """Clears the cache when the database changed since the last check, including the writes of other processes."""
+        if not self.shared:
+            return
+        if self._version_conn is None:
+            self._version_conn = sqlite3.connect(self.db_name, timeout=self.profile.busy_timeout)
+        # With WAL the version is read from the shared memory index, without any disk I/O
+        version = self._version_conn.execute("PRAGMA data_version;").fetchone()[0]
+        if version != self._data_version:
+            if self._data_version is not None:
+                self._invalidate_all()
+            self._data_version = version
+
+    async def _cached_read(self, cache: TTLCache, key: Tuple, method: str, *args, **kwargs):
+        self._check_data_version()
+        found, value = cache.get(key)
+        if not found:
+            generation = self._generation
+            value = await self._read(method, *args, **kwargs)
+            if generation == self._generation:
+                cache.set(key, value)
+        return value
+
+    async def init(self) -> None:
+        await self._write("init")
+        self._invalidate_all()
+
+    async def create_order(
+        self, car_id: int, customer_name: str, customer_email: str
+    ) -> Order:
+        try:
+            order = await self._write(
+                "create_order", car_id, customer_name, customer_email
+            )
+        except OrderConflictError:
+            # The cached lookups still show the car as available
+            await self._invalidate_car_id(car_id)
+            raise
+        self._invalidate_car(order.car)
+        return order
+
+    async def order_exists(self, order_id: int) -> bool:
+        return await self._read("order_exists", order_id)
+
+    async def delete_order(self, order_id: int) -> Optional[int]:
+        car_id = await self._write("delete_order", order_id)
+        if car_id is not None:
+            await self._invalidate_car_id(car_id)
+        return car_id
+
+    async def get_orders_by_customer(self, customer_name: str) -> List[Order]:
+        return await self._read("get_orders_by_customer", customer_name)
+
+    async def get_order(
+        self, order_id: int, include_deleted: bool = False
+    ) -> Optional[Order]:
+        return await self._read("get_order", order_id, include_deleted=include_deleted)
+
+    async def get_orders_by_ids(
+        self, order_ids: List[int], include_deleted: bool = False
+    ) -> List[Order]:
+        return await self._read(
+            "get_orders_by_ids", order_ids, include_deleted=include_deleted
+        )
+
+    async def import_cars(
+        self, path: str, batch_size: int = 1000, upsert: bool = True
+    ) -> ImportReport:
+        try:
+            return await self._write(
+                "import_cars", path, batch_size=batch_size, upsert=upsert
+            )
+        finally:
+            self._invalidate_all()
+
+    async def delete_car(self, car_id: int) -> None:
+        car = await self._read("get_car", car_id, include_unavailable=True)
+        await self._write("delete_car", car_id)
+        if car is not None:
+            self._invalidate_car(car)
+
+    async def get_car(
+        self, car_id: int, include_unavailable: bool = False
+    ) -> Optional[Car]:
+        return await self._cached_read(
+            self._car_cache,
+            (car_id, include_unavailable),
+            "get_car",
+            car_id,
+            include_unavailable=include_unavailable,
+        )
+
+    async def get_cars(
+        self, car_ids: List[int], include_unavailable: bool = False
+    ) -> List[Car]:
+        """Serves the cached cars and fetches the missing ones with a single query."""
+        ids = list(dict.fromkeys(car_ids))
+        self._check_data_version()
+        cars: Dict[int, Optional[Car]] = {}
+        missing = []
+        for car_id in ids:
+            found, car = self._car_cache.get((car_id, include_unavailable))
+            if found:
+                cars[car_id] = car
+            else:
+                missing.append(car_id)
+
+        if missing:
+            generation = self._generation
+            fetched = await self._read(
+                "get_cars", missing, include_unavailable=include_unavailable
+            )
+            cars.update({car.id: car for car in fetched})
+            if generation == self._generation:
+                for car_id in missing:
+                    self._car_cache.set((car_id, include_unavailable), cars.get(car_id))
+
+        return [cars[car_id] for car_id in ids if cars.get(car_id) is not None]
+
+    async def find_cars(
+        self,
+        brand: Optional[str] = None,
+        year: Optional[int] = None,
+        price: Optional[int] = None,
+    ) -> List[Car]:
+        cars = await self._cached_read(
+            self._find_cache,
+            (brand, year, price),
+            "find_cars",
+            brand=brand,
+            year=year,
+            price=price,
+        )
+        # A copy, so that callers cannot alter the cached result
+        return list(cars)
+
+    async def search_cars(self, text: Optional[str] = None, **filters) -> SearchResult:
+        return await self._read("search_cars", text, **filters)
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {"get_car": self._car_cache.stats(), "find_cars": self._find_cache.stats()}
+
+    async def close(self) -> None:
+        """Waits for in-flight queries and closes all the connections."""
+        self._reader_executor.shutdown(wait=True)
+        self._writer_executor.shutdown(wait=True)
+        if self._version_conn is not None:
+            self._version_conn.close()
+            self._version_conn = None
+        for db in self._connections:
+            db.close()
+        self._connections.clear()
@@ -0,0 +1,191 @@
+"""
+The distributed runtime: a gRPC host relays the messages between worker runtimes, each worker process hosts some of
+the agent types, so the work of the sessions (model clients, JSON, console rendering, database) is spread over cores.
+The main process runs the host and the worker of the user agent, the other agent types run in the worker processes
+started with RUNTIME_MODE=worker (see main.py).
+gRPC is an optional dependency, it is imported only by the distributed mode.
+"""
+
+import asyncio
+import functools
+import os
+import subprocess
+import sys
+import uuid
+from typing import IO, Any, Iterable, List, Optional, Set
+
+from autogen_core import (
+    AgentRuntime,
+    ClosureAgent,
+    ClosureContext,
+    MessageContext,
+    TopicId,
+    TypeSubscription,
+)
+from messages import UserTerminationMessage, WorkerReadyMessage, message_serializers
+
+DEFAULT_HOST_ADDRESS = "localhost:50051"
+# Triage and after sales are light, the advisor and the sales agents get a process each
+DEFAULT_WORKERS = "triage_agent,after_sale_agent;advisor_agent;sales_agent"
+# The topic the workers announce themselves on
+RUNTIME_TOPIC = "runtime"
+WATCHER_TYPE = "runtime_watcher"
+
+
+def _grpc() -> Any:
+    try:
+        from autogen_ext.runtimes import grpc
+    except ImportError as e:
+        raise ImportError(
+            "The distributed runtime requires grpcio, install it with `uv add autogen-ext[grpc]`."
+        ) from e
+    return grpc
+
+
+def host_address() -> str:
+    return os.getenv("RUNTIME_HOST_ADDRESS", DEFAULT_HOST_ADDRESS)
+
+
+def worker_groups() -> List[List[str]]:
+    """
+    The agent types of each worker process started by the main process, from RUNTIME_WORKERS: the workers are
+    separated by `;` and their agent types by `,`. Empty when the workers are started separately.
+    """
+    value = os.getenv("RUNTIME_WORKERS", DEFAULT_WORKERS)
+    return [
+        [agent_type.strip() for agent_type in group.split(",") if agent_type.strip()]
+        for group in value.split(";")
+        if group.strip()
+    ]
+
+
+def worker_agent_types() -> List[str]:
+    """The agent types hosted by this worker process, from WORKER_AGENTS."""
+    agent_types = [agent_type.strip() for agent_type in os.getenv("WORKER_AGENTS", "").split(",") if agent_type.strip()]
+    if not agent_types:
+        raise ValueError("WORKER_AGENTS must list the agent types of the worker")
+    return agent_types
+
+
+def start_host(address: str) -> Any:
+    host = _grpc().GrpcWorkerAgentRuntimeHost(address=address)
+    host.start()
+    return host
+
+
+@functools.cache
+def _worker_runtime_class() -> type:
+    class WorkerAgentRuntime(_grpc().GrpcWorkerAgentRuntime):
+        """
+        The host matches the responses to the requests by request id, but every worker numbers its requests from 1:
+        the requests of two workers to the same agent collide and a response is lost. The ids are made unique.
+        """
+
+        def __init__(self, host_address: str) -> None:
+            super().__init__(host_address=host_address)
+            self._request_prefix = uuid.uuid4().hex[:8]
+
+        async def _get_new_request_id(self) -> str:
+            return f"{self._request_prefix}-{await super()._get_new_request_id()}"
+
+    return WorkerAgentRuntime
+
+
+async def start_worker(address: str) -> AgentRuntime:
+    """Starts a worker runtime connected to the host, it serializes the messages of messages.py."""
+    runtime = _worker_runtime_class()(host_address=address)
+    runtime.add_message_serializer(message_serializers())
+    await runtime.start()
+    return runtime
+
+
+async def announce_ready(runtime: AgentRuntime, agent_types: List[str]) -> None:
+    await runtime.publish_message(WorkerReadyMessage(agent_types=agent_types), TopicId(RUNTIME_TOPIC, "main"))
+
+
+def spawn_workers(
+    groups: Iterable[List[str]], address: str, stdout: Optional[IO[Any] | int] = None
+) -> List[subprocess.Popen]:
+    """Starts a worker process running main.py for each group of agent types."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    workers = []
+    for agent_types in groups:
+        env = dict(
+            os.environ,
+            RUNTIME_MODE="worker",
+            RUNTIME_HOST_ADDRESS=address,
+            WORKER_AGENTS=",".join(agent_types),
+        )
+        workers.append(
+            subprocess.Popen(
+                [sys.executable, script],
+                cwd=os.path.dirname(script),
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=stdout,
+            )
+        )
+    return workers
+
+
+def stop_workers(workers: List[subprocess.Popen], timeout: float = 30) -> None:
+    """Asks the workers to stop (SIGTERM) one at a time, they print their metrics before exiting."""
+    for worker in workers:
+        worker.terminate()
+        try:
+            worker.wait(timeout)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+
+
+def worker_path(path: str, agent_types: List[str]) -> str:
+    """A per worker variant of a file path (e.g. usage.advisor_agent.prom), the processes do not overwrite each other."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{'-'.join(agent_types)}{ext}"
+
+
+class RuntimeWatcher:
+    """
+    Follows the distributed runtime from the main process: the agent types announced by the workers and the
+    terminated sessions (the intervention handlers of the single threaded runtime are not available on gRPC workers).
+    """
+
+    def __init__(self, sessions: int = 1) -> None:
+        self.ready: Set[str] = set()
+        self.terminated: Set[str] = set()
+        self._sessions = sessions
+        self._changed = asyncio.Condition()
+
+    async def register(self, runtime: AgentRuntime) -> None:
+        async def on_message(
+            _: ClosureContext, message: WorkerReadyMessage | UserTerminationMessage, ctx: MessageContext
+        ) -> None:
+            async with self._changed:
+                if isinstance(message, WorkerReadyMessage):
+                    self.ready.update(message.agent_types)
+                elif ctx.topic_id is not None:
+                    self.terminated.add(ctx.topic_id.source)
+                self._changed.notify_all()
+
+        await ClosureAgent.register_closure(
+            runtime,
+            WATCHER_TYPE,
+            on_message,
+            subscriptions=lambda: [
+                TypeSubscription(topic_type=RUNTIME_TOPIC, agent_type=WATCHER_TYPE),
+                TypeSubscription(topic_type="default", agent_type=WATCHER_TYPE),
+            ],
+        )
+
+    async def wait_ready(self, agent_types: Iterable[str], timeout: float = 60) -> None:
+        """Waits for the workers hosting `agent_types`, the sessions fail when an agent type is missing."""
+        expected = set(agent_types)
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: expected <= self.ready), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"No worker hosts {', '.join(sorted(expected - self.ready))}") from None
+
+    async def wait_terminated(self) -> None:
+        async with self._changed:
+            await self._changed.wait_for(lambda: len(self.terminated) >= self._sessions)
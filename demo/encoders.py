@@ -0,0 +1,92 @@
+from typing import Any, Dict, Optional, Sequence
+
+from datastore import Car, Order, SearchResult
+
+# The fields sent to the model, availability is implied by the tools returning only available cars
+CAR_FIELDS = ("id", "brand", "model", "year", "price", "color", "mileage", "fuel")
+ORDER_FIELDS = (
+    "id",
+    "date",
+    "status",
+    "customer_name",
+    "customer_email",
+    "car.id",
+    "car.brand",
+    "car.model",
+    "car.year",
+    "car.price",
+    "car.color",
+)
+
+# Rows returned to the model by a single tool call, the remaining ones are summarized with a "more results" line
+MAX_ROWS = 20
+
+
+def _value(record: Any, field: str) -> str:
+    for name in field.split("."):
+        record = getattr(record, name)
+    if record is None:
+        return ""
+    if isinstance(record, bool):
+        return "1" if record else "0"
+    # The separator is escaped so that a value cannot shift the columns
+    return str(record).replace("|", "/")
+
+
+def encode_table(
+    name: str,
+    records: Sequence[Any],
+    fields: Sequence[str],
+    total: Optional[int] = None,
+    max_rows: int = MAX_ROWS,
+    more_hint: str = "",
+) -> str:
+    """
+    Encodes records as a table: a header row with the record name and the fields, then one row of values
+    per record, separated by `|`. Nested fields are written with dots (e.g. `car.brand`).
+    When there are more than `max_rows` records (or `total` is larger than the records), a last line
+    reports how many results were left out, followed by `more_hint`.
+    """
+    total = len(records) if total is None else total
+    rows = records[:max_rows]
+    lines = [f"{name} " + "|".join(fields)]
+    lines.extend("|".join(_value(record, field) for field in fields) for record in rows)
+    if total > len(rows):
+        lines.append(f"(+{total - len(rows)} more results{', ' + more_hint if more_hint else ''})")
+    return "\n".join(lines)
+
+
+def encode_cars(
+    cars: Sequence[Car],
+    fields: Sequence[str] = CAR_FIELDS,
+    total: Optional[int] = None,
+    max_rows: int = MAX_ROWS,
+    more_hint: str = "",
+) -> str:
+    if not cars:
+        return "No cars found"
+    return encode_table("Car", cars, fields, total, max_rows, more_hint)
+
+
+def encode_orders(
+    orders: Sequence[Order],
+    fields: Sequence[str] = ORDER_FIELDS,
+    max_rows: int = MAX_ROWS,
+) -> str:
+    if not orders:
+        return "No orders found"
+    return encode_table("Order", orders, fields, max_rows=max_rows)
+
+
+def encode_facets(facets: Dict[str, Dict[str, int]]) -> str:
+    """Encodes the facet counts on a line per field, e.g. `brand: Tesla 5, BMW 3`."""
+    return "\n".join(
+        f"{field}: " + ", ".join(f"{value} {count}" for value, count in counts.items())
+        for field, counts in facets.items()
+    )
+
+
+def encode_search_result(result: SearchResult, offset: int = 0, more_hint: str = "") -> str:
+    """Encodes a page of search results starting at `offset`, the total number of matches and the facets."""
+    cars = encode_cars(result.cars, total=result.total - offset, more_hint=more_hint)
+    return f"{cars}\nMatches: {result.total}\n{encode_facets(result.facets)}"
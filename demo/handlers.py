@@ -9,14 +9,20 @@ from autogen_core import (
 from messages import UserTerminationMessage
 
 
-# Represents a handler that listens for user termination messages
+# Represents a handler that listens for user termination messages,
+# the runtime terminates once all the `sessions` have been terminated
 class UserTerminationHandler(DefaultInterventionHandler):
-    def __init__(self) -> None:
+    def __init__(self, sessions: int = 1) -> None:
         self._termination_value: UserTerminationMessage | None = None
+        self._sessions = sessions
+        self._terminated_sessions: set[str] = set()
 
     async def on_publish(self, message: Any, *, message_context: MessageContext) -> Any:
         if isinstance(message, UserTerminationMessage):
-            self._termination_value = message
+            sender = message_context.sender
+            self._terminated_sessions.add(sender.key if sender is not None else "")
+            if len(self._terminated_sessions) >= self._sessions:
+                self._termination_value = message
         return message
 
     async def on_response(
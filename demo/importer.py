@@ -0,0 +1,204 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from utils import print_error, print_info
+
+CarRow = Tuple[int, str, int, int, str, int, str, str]
+
+# New cars are inserted as available, existing ones get their details refreshed but keep their availability,
+# so that a nightly feed does not make an ordered car available again.
+UPSERT_CAR_SQL = """
+    INSERT INTO Cars (id, brand, year, price, color, mileage, fuel, model, is_available)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT(id) DO UPDATE SET
+        brand = excluded.brand,
+        year = excluded.year,
+        price = excluded.price,
+        color = excluded.color,
+        mileage = excluded.mileage,
+        fuel = excluded.fuel,
+        model = excluded.model;
+"""
+
+# Updates in place rather than INSERT OR REPLACE, whose implicit delete would not fire the search index triggers
+REPLACE_CAR_SQL = """
+    INSERT INTO Cars (id, brand, year, price, color, mileage, fuel, model, is_available)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT(id) DO UPDATE SET
+        brand = excluded.brand,
+        year = excluded.year,
+        price = excluded.price,
+        color = excluded.color,
+        mileage = excluded.mileage,
+        fuel = excluded.fuel,
+        model = excluded.model,
+        is_available = 1;
+"""
+
+# Only the first bad rows of a feed are logged
+MAX_LOGGED_ERRORS = 10
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    skipped: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.rows} rows imported in {self.batches} batches, {self.skipped} skipped, "
+            f"{self.seconds:.2f}s ({self.rows_per_second:.0f} rows/s)"
+        )
+
+
+def read_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_parquet(path: str, batch_size: int = 10_000) -> Iterator[Dict[str, Any]]:
+    """Reads a columnar parquet file one record batch at a time."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Reading parquet feeds requires pyarrow, install it with `uv add pyarrow`."
+        ) from e
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+READERS = {
+    ".csv": read_csv,
+    ".jsonl": read_jsonl,
+    ".ndjson": read_jsonl,
+    ".parquet": read_parquet,
+}
+
+
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Streams the rows of a feed, the format is selected from the file extension."""
+    extension = os.path.splitext(path)[1].lower()
+    reader = READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"Unsupported feed format '{extension}'")
+    return reader(path)
+
+
+def _text(row: Dict[str, Any], field: str) -> str:
+    """A text column, missing (None, a null in jsonl or parquet) and blank values are invalid."""
+    value = row[field]
+    if value is None or not str(value).strip():
+        raise ValueError(f"{field} is empty")
+    return str(value).strip()
+
+
+def parse_car(row: Dict[str, Any]) -> CarRow:
+    """Converts a feed row to the Cars columns, raises KeyError or ValueError for invalid rows."""
+    return (
+        int(row["id"]),
+        _text(row, "brand"),
+        int(row["year"]),
+        int(row["price"]),
+        _text(row, "color"),
+        int(row["mileage"]),
+        _text(row, "fuel"),
+        _text(row, "model"),
+    )
+
+
+def batched(rows: Iterable[CarRow], size: int) -> Iterator[List[CarRow]]:
+    iterator = iter(rows)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def import_cars(
+    conn: sqlite3.Connection,
+    path: str,
+    batch_size: int = 1000,
+    upsert: bool = True,
+) -> ImportReport:
+    """
+    Streams the cars of a feed (csv, jsonl or parquet) into the Cars table.
+    Rows are inserted in batches, each one in its own transaction, so memory usage does not depend
+    on the size of the feed and invalid rows are skipped instead of aborting the whole import.
+    With `upsert` existing cars keep their availability, otherwise they are made available again.
+    """
+    report = ImportReport()
+    sql = UPSERT_CAR_SQL if upsert else REPLACE_CAR_SQL
+    start = time.perf_counter()
+
+    def skip(reason: str) -> None:
+        report.skipped += 1
+        if report.skipped <= MAX_LOGGED_ERRORS:
+            print_error(f"Skipping car: {reason}")
+
+    def parsed_rows() -> Iterator[CarRow]:
+        for line, row in enumerate(read_rows(path), start=1):
+            try:
+                yield parse_car(row)
+            except (KeyError, TypeError, ValueError) as e:
+                skip(f"row {line} is invalid ({e!r})")
+
+    for batch in batched(parsed_rows(), batch_size):
+        try:
+            with conn:
+                conn.executemany(sql, batch)
+            report.rows += len(batch)
+        except sqlite3.DatabaseError:
+            # Retries the batch row by row to isolate the offending ones
+            for car in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, car)
+                    report.rows += 1
+                except sqlite3.DatabaseError as e:
+                    skip(f"car {car[0]} was rejected ({e})")
+        report.batches += 1
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+if __name__ == "__main__":
+    from datastore import CarDB
+
+    parser = argparse.ArgumentParser(description="Imports a car inventory feed.")
+    parser.add_argument("feed", help="The feed to import (.csv, .jsonl or .parquet)")
+    parser.add_argument("--db", default="data/cars.db")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--replace",
+        action="store_true",
+        help="Replace existing cars instead of updating them in place",
+    )
+    args = parser.parse_args()
+
+    db = CarDB(args.db)
+    db.init()
+    print_info(
+        str(db.import_cars(args.feed, batch_size=args.batch_size, upsert=not args.replace))
+    )
+    db.close()
@@ -0,0 +1,390 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Set
+
+from autogen_core import AgentId, AgentInstantiationContext, AgentRuntime, MessageContext, RoutedAgent
+from metrics import Metrics
+from utils import print_error
+
+
+class PooledAgent(RoutedAgent):
+    """
+    A per-session agent whose instances are managed by an AgentPool: an instance is not evicted while it is
+    handling a message. Agents with a conversation override `save_state` and `load_state`, the state is
+    restored when an evicted (or, with a durable store, interrupted) session receives a new message.
+    """
+
+    _pool: Optional["AgentPool"] = None
+
+    async def on_message_impl(self, message: Any, ctx: MessageContext) -> Any:
+        if self._pool is None:
+            return await super().on_message_impl(message, ctx)
+        self._pool.enter(self.id)
+        try:
+            return await super().on_message_impl(message, ctx)
+        finally:
+            self._pool.leave(self.id)
+
+    async def save_state(self) -> Mapping[str, Any]:
+        return {}
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        pass
+
+    async def checkpoint(self) -> None:
+        """Saves the state to a durable store, called by the agents at the end of each turn."""
+        if self._pool is not None:
+            await self._pool.checkpoint(self)
+
+    async def end_session(self) -> None:
+        """Discards the saved state of the whole session, it will not be resumed."""
+        if self._pool is not None:
+            await self._pool.end_session(self.id.key)
+
+
+class MemoryStateStore:
+    """Keeps the state of the evicted agents in memory, by agent id."""
+
+    # The states are lost with the process, the live agents are not checkpointed
+    durable = False
+
+    def __init__(self) -> None:
+        self._states: Dict[AgentId, Mapping[str, Any]] = {}
+
+    async def save(self, agent_id: AgentId, state: Mapping[str, Any]) -> None:
+        self._states[agent_id] = state
+
+    async def load(self, agent_id: AgentId) -> Optional[Mapping[str, Any]]:
+        return self._states.get(agent_id)
+
+    async def delete(self, agent_id: AgentId) -> None:
+        self._states.pop(agent_id, None)
+
+    async def delete_session(self, session: str) -> None:
+        for agent_id in [agent_id for agent_id in self._states if agent_id.key == session]:
+            del self._states[agent_id]
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"states": len(self._states)}
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class SQLiteStateStore:
+    """
+    Keeps the state of the agents in a SQLite database, one row per agent (session, agent type) holding its
+    compressed JSON state, so that the sessions survive a restart and can be resumed by another process.
+    The agents are checkpointed at the end of each turn, a state identical to the one last written is not written again.
+    """
+
+    durable = True
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        # A checkpoint is lost on a power failure at worst, never on a crash of the process
+        self._conn.execute("PRAGMA synchronous = NORMAL;")
+        self._conn.execute("PRAGMA busy_timeout = 5000;")
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS agent_state (
+                    session TEXT NOT NULL,
+                    agent_type TEXT NOT NULL,
+                    state BLOB NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (session, agent_type)
+                ) WITHOUT ROWID;
+                """
+            )
+        # Digest of the state last written or read for each agent
+        self._digests: Dict[AgentId, bytes] = {}
+        self._stats: Counter[str] = Counter()
+
+    @staticmethod
+    def _encode(state: Mapping[str, Any]) -> bytes:
+        # A value that is not JSON fails the checkpoint, rather than being saved as a string and failing the resume
+        return zlib.compress(json.dumps(state, separators=(",", ":")).encode())
+
+    def _write(self, agent_id: AgentId, data: bytes) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO agent_state (session, agent_type, state, updated_at) VALUES (?, ?, ?, ?);",
+                (agent_id.key, agent_id.type, data, time.time()),
+            )
+
+    def _read(self, agent_id: AgentId) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM agent_state WHERE session = ? AND agent_type = ?;",
+                (agent_id.key, agent_id.type),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _execute(self, sql: str, parameters: tuple) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(sql, parameters)
+
+    async def save(self, agent_id: AgentId, state: Mapping[str, Any]) -> None:
+        data = self._encode(state)
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if self._digests.get(agent_id) == digest:
+            self._stats["unchanged"] += 1
+            return
+        await asyncio.to_thread(self._write, agent_id, data)
+        self._digests[agent_id] = digest
+        self._stats["writes"] += 1
+        self._stats["bytes_written"] += len(data)
+
+    async def load(self, agent_id: AgentId) -> Optional[Mapping[str, Any]]:
+        data = await asyncio.to_thread(self._read, agent_id)
+        if data is None:
+            self._stats["misses"] += 1
+            return None
+        self._digests[agent_id] = hashlib.blake2b(data, digest_size=16).digest()
+        self._stats["loads"] += 1
+        return json.loads(zlib.decompress(data))
+
+    async def delete(self, agent_id: AgentId) -> None:
+        self._digests.pop(agent_id, None)
+        await asyncio.to_thread(
+            self._execute,
+            "DELETE FROM agent_state WHERE session = ? AND agent_type = ?;",
+            (agent_id.key, agent_id.type),
+        )
+
+    async def delete_session(self, session: str) -> None:
+        for agent_id in [agent_id for agent_id in self._digests if agent_id.key == session]:
+            del self._digests[agent_id]
+        await asyncio.to_thread(self._execute, "DELETE FROM agent_state WHERE session = ?;", (session,))
+        self._stats["sessions_ended"] += 1
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            name: self._stats[name]
+            for name in ("writes", "unchanged", "bytes_written", "loads", "misses", "sessions_ended")
+        }
+
+
+StateStore = MemoryStateStore | SQLiteStateStore
+
+
+class AgentPool:
+    """
+    Bounds the per-session agent instances of a runtime: the instances idle for more than `idle_timeout` seconds
+    are evicted by a background sweep, and when an agent type exceeds `max_instances` live instances its least
+    recently used idle ones are evicted. With a `store` the state of an evicted instance is saved and loaded back
+    into the instance created for the next message of its session, without it the session starts over.
+    A durable store is written at the end of each turn instead (see `checkpoint`), the sessions interrupted by a
+    restart are resumed lazily, when their first message creates the agent instances again.
+    An agent handling a message (in this demo, every agent of a session until the session ends, since the
+    agents call each other with nested requests) is never evicted, so `max_instances` is a soft limit.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 300,
+        max_instances: int = 1000,
+        store: Optional[StateStore] = None,
+    ) -> None:
+        # The runtime of the instances, set when the first one is created
+        self._runtime: Optional[AgentRuntime] = None
+        self.idle_timeout = idle_timeout
+        self.max_instances = max_instances
+        self.store = store
+        # Live instances of each agent type, least recently used first
+        self._live: Dict[str, OrderedDict[AgentId, PooledAgent]] = {}
+        self._last_used: Dict[AgentId, float] = {}
+        self._busy: Counter[AgentId] = Counter()
+        # States saved by an eviction still writing them to the store
+        self._saving: Dict[AgentId, Mapping[str, Any]] = {}
+        self._stats: Dict[str, Counter[str]] = {}
+        self._sweeper: Optional[asyncio.Task[None]] = None
+        # The sessions ended by their user, their agents are no longer saved
+        self._ended: Set[str] = set()
+        # The time to restore (load and apply) and to checkpoint the state of an agent
+        self.metrics = Metrics()
+
+    @classmethod
+    def from_env(cls) -> "AgentPool":
+        """
+        AGENT_IDLE_TIMEOUT (seconds, 0 disables the idle eviction), AGENT_MAX_INSTANCES (per agent type, 0 for no limit)
+        and AGENT_STATE_STORE: none (an evicted session starts over), memory (keep the conversation of the evicted
+        sessions) or sqlite (checkpoint the sessions to AGENT_STATE_PATH, they survive a restart).
+        """
+        store: Optional[StateStore] = None
+        match os.getenv("AGENT_STATE_STORE", "none").lower():
+            case "none":
+                pass
+            case "memory":
+                store = MemoryStateStore()
+            case "sqlite":
+                store = SQLiteStateStore(os.getenv("AGENT_STATE_PATH", "data/sessions.db"))
+            case other:
+                raise ValueError(f"Unknown AGENT_STATE_STORE '{other}'")
+        return cls(
+            idle_timeout=float(os.getenv("AGENT_IDLE_TIMEOUT", "300")),
+            max_instances=int(os.getenv("AGENT_MAX_INSTANCES", "1000")),
+            store=store,
+        )
+
+    def factory(self, factory: Callable[[], PooledAgent]) -> Callable[[], Awaitable[PooledAgent]]:
+        """Wraps the factory of an agent type, the instances it creates are managed by the pool."""
+
+        async def _create() -> PooledAgent:
+            self._runtime = AgentInstantiationContext.current_runtime()
+            agent_id = AgentInstantiationContext.current_agent_id()
+            agent = factory()
+            agent._pool = self
+            start = time.perf_counter()
+            state = self._saving.get(agent_id)
+            if state is None and self.store is not None and agent_id.key not in self._ended:
+                state = await self.store.load(agent_id)
+            live = self._live.get(agent_id.type, {}).get(agent_id)
+            if live is not None:
+                # Created by a concurrent message while the state was loading
+                return live
+            if state is not None:
+                await agent.load_state(state)
+                self.metrics.record("resume", time.perf_counter() - start)
+                self._count(agent_id.type, "restored")
+                if self.store is not None and not self.store.durable:
+                    # The live instance holds the state now, it is saved again when evicted
+                    await self.store.delete(agent_id)
+            self._count(agent_id.type, "created")
+            self._live.setdefault(agent_id.type, OrderedDict())[agent_id] = agent
+            self._last_used[agent_id] = time.monotonic()
+            await self._enforce_limit(agent_id)
+            return agent
+
+        return _create
+
+    def enter(self, agent_id: AgentId) -> None:
+        self._busy[agent_id] += 1
+        live = self._live.get(agent_id.type)
+        if live is not None and agent_id in live:
+            live.move_to_end(agent_id)
+
+    def leave(self, agent_id: AgentId) -> None:
+        self._busy[agent_id] -= 1
+        if self._busy[agent_id] <= 0:
+            del self._busy[agent_id]
+        self._last_used[agent_id] = time.monotonic()
+
+    def start(self) -> None:
+        if self.idle_timeout > 0 and self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self.store is not None:
+            await self.store.close()
+
+    async def checkpoint(self, agent: PooledAgent) -> None:
+        """Writes the state of `agent` to a durable store, the other stores are written on eviction only."""
+        if self.store is None or not self.store.durable or agent.id.key in self._ended:
+            return
+        with self.metrics.timer("checkpoint"):
+            state = await agent.save_state()
+            if state:
+                await self.store.save(agent.id, state)
+
+    async def end_session(self, session: str) -> None:
+        """Deletes the saved states of a session, its agents are not saved anymore."""
+        self._ended.add(session)
+        if self.store is not None:
+            await self.store.delete_session(session)
+
+    async def _sweep(self) -> None:
+        interval = min(max(self.idle_timeout / 2, 0.1), 30)
+        while True:
+            await asyncio.sleep(interval)
+            deadline = time.monotonic() - self.idle_timeout
+            for live in list(self._live.values()):
+                for agent_id in [agent_id for agent_id in live if self._last_used[agent_id] <= deadline]:
+                    try:
+                        await self.evict(agent_id, "evicted_idle")
+                    except Exception as e:
+                        print_error(f"Error evicting agent ({agent_id}): {e}")
+
+    async def _enforce_limit(self, created: AgentId) -> None:
+        """Evicts the least recently used idle instances of the type of `created`, that is about to get its message."""
+        live = self._live[created.type]
+        if self.max_instances <= 0 or len(live) <= self.max_instances:
+            return
+        for agent_id in list(live):
+            if len(live) <= self.max_instances:
+                break
+            if agent_id != created:
+                await self.evict(agent_id, "evicted_lru")
+
+    async def evict(self, agent_id: AgentId, reason: str = "evicted") -> bool:
+        """
+        Removes an idle instance from the runtime, saving its state first (a durable store already has it, written
+        by the last checkpoint). Returns False if it is busy.
+        """
+        live = self._live.get(agent_id.type, {})
+        agent = live.get(agent_id)
+        if agent is None or self._busy[agent_id]:
+            return False
+        state = None
+        if self.store is not None and not self.store.durable and agent_id.key not in self._ended:
+            state = await agent.save_state() or None
+        if self._busy[agent_id] or live.get(agent_id) is not agent:
+            # Received a message while its state was being saved
+            return False
+
+        del live[agent_id]
+        del self._last_used[agent_id]
+        # AutoGen has no API to unload an agent, the runtimes keep the instances in _instantiated_agents
+        instances = getattr(self._runtime, "_instantiated_agents", None)
+        if not isinstance(instances, dict):
+            raise RuntimeError(
+                f"{type(self._runtime).__name__} has no _instantiated_agents dict, the agent pool cannot evict "
+                "its instances: disable the eviction (AGENT_IDLE_TIMEOUT=0, AGENT_MAX_INSTANCES=0)"
+            )
+        instances.pop(agent_id, None)
+        self._count(agent_id.type, reason)
+        if state is not None:
+            self._saving[agent_id] = state
+            try:
+                await self.store.save(agent_id, state)
+            finally:
+                if self._saving.get(agent_id) is state:
+                    del self._saving[agent_id]
+        await agent.close()
+        return True
+
+    def _count(self, agent_type: str, name: str) -> None:
+        self._stats.setdefault(agent_type, Counter())[name] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """The live instances of each agent type and the instances created, restored and evicted."""
+        return {
+            agent_type: {
+                "live": len(self._live.get(agent_type, {})),
+                **{
+                    name: counter[name]
+                    for name in ("created", "restored", "evicted_idle", "evicted_lru")
+                },
+            }
+            for agent_type, counter in self._stats.items()
+        }
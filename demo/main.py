@@ -2,59 +2,189 @@ import sys
 
 sys.path.append("..")
 import asyncio
+import os
+from typing import Awaitable, Callable, Collection, Dict, List, Optional
 
 from advisor_agent import AdvisorAgent
 from after_sales_agent import AfterSalesAgent
-from autogen_core import AgentId, SingleThreadedAgentRuntime
+from autogen_core import AgentId, AgentRuntime, SingleThreadedAgentRuntime
 from autogen_core.models import ChatCompletionClient
-from datastore import CarDB
+from classifier import TriageClassifier, fast_path_summary
+from distributed import (
+    RuntimeWatcher,
+    announce_ready,
+    host_address,
+    spawn_workers,
+    start_host,
+    start_worker,
+    stop_workers,
+    worker_agent_types,
+    worker_groups,
+    worker_path,
+)
 from handlers import UserTerminationHandler
+from lifecycle import AgentPool, PooledAgent
 from messages import SessionStartMessage
+from metrics import Metrics
 from rich import print
 from sales_agent import SalesAgent
 from tools import Tools
 from triage_agent import TriageAgent
+from usage import usage_tracker
 from user_agent import UserAgent
-from utils import print_core
+from user_io import UserChannel, get_user_channel
+from utils import print_core, print_metrics
 
-from model_clients.azure import get_model
+from model_clients.cache import (
+    CachedChatCompletionClient,
+    cached_agent_types,
+    get_response_store,
+)
+from model_clients.registry import get_model_client
+from model_clients.resilient import ResilientChatCompletionClient, with_resilience
+from model_clients.routing import (
+    FallbackChatCompletionClient,
+    TimedChatCompletionClient,
+    find_wrapper,
+)
+from model_clients.settings import agent_model_profiles, fallback_agent_types, get_setting
+from model_clients.usage import UsageChatCompletionClient
+
+AGENT_TYPES = ["triage_agent", "advisor_agent", "sales_agent", "after_sale_agent"]
+
+
+def create_model_client(profile: Optional[str] = None) -> ChatCompletionClient:
+    """
+    Creates the client of a model profile (None for the default model): its usage is accounted and its calls are
+    bounded and retried (see model_clients/resilient.py), when the deployment keeps failing the calls go to the
+    profile named by MODEL_SECONDARY_PROFILE, if any.
+    """
+    client = UsageChatCompletionClient(
+        get_model_client(profile=profile), profile or "default", usage_tracker.on_usage
+    )
+    secondary = get_setting("MODEL_SECONDARY_PROFILE", "", profile)
+    fallback = (
+        UsageChatCompletionClient(get_model_client(profile=secondary), secondary, usage_tracker.on_usage)
+        if secondary
+        else None
+    )
+    return with_resilience(client, profile, fallback)
+
+
+def get_agent_model_clients(metrics: Metrics) -> Dict[str, ChatCompletionClient]:
+    """
+    Returns the model client of each agent type.
+    Agents listed in AGENT_MODELS use their own model profile (e.g. a small, fast model for the triage),
+    those also listed in MODEL_FALLBACK_AGENTS ask the default model again when their answer is not confident.
+    The agents opted in to the response cache get a caching client (the triage and the after sales agent by default,
+    since their answers depend only on their input).
+    The latency of the model calls of each agent type is recorded in `metrics`, the tokens and cost of the calls
+    that reach a model (cache hits excluded, fallbacks included) in the usage tracker.
+    """
+    store = get_response_store()
+    default_client = create_model_client()
+    profile_clients: Dict[str, ChatCompletionClient] = {}
+    profiles = agent_model_profiles()
+    fallback = fallback_agent_types()
+    cached = cached_agent_types() if store is not None else []
+
+    model_clients: Dict[str, ChatCompletionClient] = {}
+    for agent_type in AGENT_TYPES:
+        profile = profiles.get(agent_type)
+        if profile is None:
+            client = default_client
+        else:
+            if profile not in profile_clients:
+                profile_clients[profile] = create_model_client(profile)
+            client = profile_clients[profile]
+            if agent_type in fallback:
+                client = FallbackChatCompletionClient(client, default_client)
+        if agent_type in cached:
+            client = CachedChatCompletionClient(client, store, namespace=agent_type)
+        model_clients[agent_type] = TimedChatCompletionClient(
+            client, f"model:{agent_type}", metrics.record
+        )
+    return model_clients
+
+
+def wrapper_stats(
+    model_clients: Dict[str, ChatCompletionClient], wrapper_type: type
+) -> Dict[str, Dict[str, float]]:
+    """The stats of the wrappers of `wrapper_type`, a wrapper shared by several agent types is listed once."""
+    agent_types: Dict[int, List[str]] = {}
+    wrappers = {}
+    for agent_type, client in model_clients.items():
+        wrapper = find_wrapper(client, wrapper_type)
+        if wrapper is not None:
+            agent_types.setdefault(id(wrapper), []).append(agent_type)
+            wrappers[id(wrapper)] = wrapper
+    return {",".join(agent_types[key]): wrapper.stats() for key, wrapper in wrappers.items()}
 
 
 async def register_agents(
-    runtime: SingleThreadedAgentRuntime, model_client: ChatCompletionClient
+    runtime: AgentRuntime,
+    model_clients: Dict[str, ChatCompletionClient],
+    channel: Optional[UserChannel],
+    metrics: Metrics,
+    agent_types: Optional[Collection[str]] = None,
+    pool: Optional[AgentPool] = None,
 ):
     """
-    Register all agents with the runtime.
+    Register the agents with the runtime, only those of `agent_types` when given (a worker of the distributed runtime).
+    The instances of the per-session agents are evicted by `pool` when idle, the after sales agent is shared.
     """
-    await TriageAgent.register(
-        runtime,
-        type="triage_agent",
-        factory=lambda: TriageAgent(model_client=model_client),
-    )
 
-    await UserAgent.register(runtime, type="user_agent", factory=lambda: UserAgent())
+    def hosted(agent_type: str) -> bool:
+        return agent_types is None or agent_type in agent_types
 
-    await AdvisorAgent.register(
-        runtime,
-        type="advisor_agent",
-        factory=lambda: AdvisorAgent(model_client=model_client),
-    )
+    def managed(factory: Callable[[], PooledAgent]) -> Callable[[], PooledAgent | Awaitable[PooledAgent]]:
+        return pool.factory(factory) if pool is not None else factory
 
-    await SalesAgent.register(
-        runtime,
-        type="sales_agent",
-        factory=lambda: SalesAgent(model_client=model_client),
-    )
+    if hosted("triage_agent"):
+        # The triage pre-classifier is stateless, a single instance is shared by all the sessions
+        classifier = TriageClassifier.from_env()
 
-    await AfterSalesAgent.register(
-        runtime,
-        type="after_sale_agent",
-        factory=lambda: AfterSalesAgent(model_client=model_client),
-    )
+        await TriageAgent.register(
+            runtime,
+            type="triage_agent",
+            factory=managed(
+                lambda: TriageAgent(
+                    model_client=model_clients["triage_agent"],
+                    classifier=classifier,
+                    metrics=metrics,
+                )
+            ),
+        )
+
+    if hosted("user_agent"):
+        await UserAgent.register(
+            runtime, type="user_agent", factory=managed(lambda: UserAgent(channel, metrics=metrics))
+        )
+
+    if hosted("advisor_agent"):
+        await AdvisorAgent.register(
+            runtime,
+            type="advisor_agent",
+            factory=managed(lambda: AdvisorAgent(model_client=model_clients["advisor_agent"])),
+        )
+
+    if hosted("sales_agent"):
+        await SalesAgent.register(
+            runtime,
+            type="sales_agent",
+            factory=managed(lambda: SalesAgent(model_client=model_clients["sales_agent"])),
+        )
+
+    if hosted("after_sale_agent"):
+        await AfterSalesAgent.register(
+            runtime,
+            type="after_sale_agent",
+            factory=lambda: AfterSalesAgent(model_client=model_clients["after_sale_agent"]),
+        )
 
 
 async def send_session_message(
-    runtime: SingleThreadedAgentRuntime, session_id: str
+    runtime: AgentRuntime, session_id: str
 ) -> None:
     """
     Send a session start message to the user agent."""
@@ -65,39 +195,133 @@ async def send_session_message(
     )
 
 
-async def main():
-    # Initializes the database if it doesn't exist
-    CarDB().init()
-
-    print_core("Initializing the runtime...\n")
-
+async def run_local(
+    model_clients: Dict[str, ChatCompletionClient],
+    channel: UserChannel,
+    sessions: int,
+    metrics: Metrics,
+    pool: AgentPool,
+) -> None:
+    """All the agents run in a single threaded runtime, in this process."""
     # Create the runtime with a termination handler
     # This handler will handle the termination of the runtime when user types "exit"
-    termination_handler = UserTerminationHandler()
+    termination_handler = UserTerminationHandler(sessions)
     runtime = SingleThreadedAgentRuntime(intervention_handlers=[termination_handler])
     Tools.runtime = runtime
 
-    # Get the LLM client
-    model_client = get_model()
-    # Register the agents
-    await register_agents(runtime, model_client)
+    # Register the agents, the idle instances are evicted by the pool
+    await register_agents(runtime, model_clients, channel, metrics, pool=pool)
 
     runtime.start()
 
-    # Start the session (you can try adding more sessions to see how AutoGen handles multiple sessions)
-    session_ids = ["1"]
-    await asyncio.gather(
-        *(send_session_message(runtime, session_id) for session_id in session_ids)
-    )
+    # Start the sessions (try USER_SESSIONS=3 to see how AutoGen handles multiple sessions)
+    await channel.start(lambda session_id: send_session_message(runtime, session_id), sessions)
 
     # Wait for the termination handler to finish
     await runtime.stop_when(lambda: termination_handler.has_terminated)
 
     # Close the runtime freeing up resources
     await runtime.close()
+
+
+async def run_distributed(channel: UserChannel, sessions: int, metrics: Metrics, pool: AgentPool) -> None:
+    """
+    This process runs the gRPC host and the user agent, the other agent types run in the worker processes
+    listed in RUNTIME_WORKERS (or started separately with RUNTIME_MODE=worker when RUNTIME_WORKERS is empty).
+    """
+    address = host_address()
+    host = start_host(address)
+    runtime = await start_worker(address)
+    Tools.runtime = runtime
+
+    watcher = RuntimeWatcher(sessions)
+    await watcher.register(runtime)
+    await register_agents(runtime, {}, channel, metrics, agent_types=["user_agent"], pool=pool)
+
+    workers = spawn_workers(worker_groups(), address)
+    try:
+        print_core(f"Waiting for the workers on {address}...")
+        await watcher.wait_ready(AGENT_TYPES)
+
+        await channel.start(lambda session_id: send_session_message(runtime, session_id), sessions)
+        await watcher.wait_terminated()
+    finally:
+        stop_workers(workers)
+        await runtime.stop()
+        await host.stop()
+
+
+async def run_worker(
+    model_clients: Dict[str, ChatCompletionClient], metrics: Metrics, pool: AgentPool
+) -> List[str]:
+    """Hosts the agent types of WORKER_AGENTS on a worker of the distributed runtime, until SIGTERM or SIGINT."""
+    agent_types = worker_agent_types()
+    runtime = await start_worker(host_address())
+    # The tools publish the order updates from this process
+    Tools.runtime = runtime
+    await register_agents(runtime, model_clients, None, metrics, agent_types=agent_types, pool=pool)
+    await announce_ready(runtime, agent_types)
+    print_core(f"Worker hosting {', '.join(agent_types)} started")
+    await runtime.stop_when_signal()
+    return agent_types
+
+
+async def main():
+    # Initializes the database if it doesn't exist
+    await Tools.db.init()
+
+    print_core("Initializing the runtime...\n")
+
+    agent_metrics = Metrics()
+    # Bounds the live agent instances, see AGENT_IDLE_TIMEOUT and AGENT_MAX_INSTANCES, and saves the sessions
+    # state to AGENT_STATE_STORE
+    pool = AgentPool.from_env()
+    pool.start()
+    model_clients: Dict[str, ChatCompletionClient] = {}
+    usage_metrics_path = os.getenv("USAGE_METRICS_PATH", "data/usage.prom")
+
+    # The agents run in this process (local), or across worker processes connected by gRPC (distributed)
+    # The user sessions are served by the channel selected by USER_CHANNEL, the runtime stops when all of them ended
+    mode = os.getenv("RUNTIME_MODE", "local").lower()
+    match mode:
+        case "local" | "distributed":
+            channel = get_user_channel()
+            sessions = int(os.getenv("USER_SESSIONS", "1"))
+            if mode == "local":
+                # Get the LLM clients of the backend selected by MODEL_BACKEND (azure, stub or replay)
+                model_clients = get_agent_model_clients(agent_metrics)
+                await run_local(model_clients, channel, sessions, agent_metrics, pool)
+            else:
+                await run_distributed(channel, sessions, agent_metrics, pool)
+            await channel.close()
+        case "worker":
+            model_clients = get_agent_model_clients(agent_metrics)
+            agent_types = await run_worker(model_clients, agent_metrics, pool)
+            usage_metrics_path = worker_path(usage_metrics_path, agent_types)
+        case _:
+            raise ValueError(f"Unknown RUNTIME_MODE '{mode}'")
+
+    await pool.close()
     print_core("Runtime stopped.")
-    CarDB().close()
+    await Tools.db.close()
     print_core("Database closed.")
+    print_metrics("Database queries", Tools.db.metrics.summary())
+    print_metrics("Database cache", Tools.db.cache_stats())
+    print_metrics("Agent latency", agent_metrics.summary())
+    print_metrics("Agent instances", pool.stats())
+    print_metrics("Session state", pool.metrics.summary())
+    if pool.store is not None:
+        print_metrics("Session state store", {"store": pool.store.stats()})
+    print_metrics("Triage fast path", fast_path_summary(agent_metrics))
+    for title, wrapper_type in (
+        ("Model response cache", CachedChatCompletionClient),
+        ("Model routing", FallbackChatCompletionClient),
+        ("Model resilience", ResilientChatCompletionClient),
+    ):
+        print_metrics(title, wrapper_stats(model_clients, wrapper_type))
+    print_metrics("Model usage", usage_tracker.summary())
+    usage_tracker.export_prometheus(usage_metrics_path)
+    usage_tracker.close()
 
 
 if __name__ == "__main__":
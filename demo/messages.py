@@ -1,4 +1,11 @@
 from dataclasses import dataclass
+from typing import Any, List
+
+from autogen_core import (
+    JSON_DATA_CONTENT_TYPE,
+    MessageSerializer,
+    try_get_known_serializers_for_type,
+)
 
 
 @dataclass
@@ -35,3 +42,60 @@ class OrderUpdateMessage:
 @dataclass
 class UserTerminationMessage:
     reason: str = "User terminated the conversation"
+
+
+# A chunk of an agent answer streamed to the user agent while it is generated,
+# the complete answer follows as a regular message
+@dataclass
+class StreamChunkMessage:
+    content: str
+
+
+# Published by a worker of the distributed runtime once the agent types it hosts are registered
+@dataclass
+class WorkerReadyMessage:
+    agent_types: List[str]
+
+
+# The messages exchanged by the agents, serialized as JSON when they cross the processes of the distributed runtime
+MESSAGE_TYPES = [
+    UserMessage,
+    AdvisorMessage,
+    SessionStartMessage,
+    TriageMessage,
+    OrderMessage,
+    OrderUpdateMessage,
+    UserTerminationMessage,
+    StreamChunkMessage,
+    WorkerReadyMessage,
+]
+
+
+class NoneSerializer(MessageSerializer[None]):
+    """The message handlers return None, that is sent back as the response of every request between processes."""
+
+    @property
+    def data_content_type(self) -> str:
+        return JSON_DATA_CONTENT_TYPE
+
+    @property
+    def type_name(self) -> str:
+        return "NoneType"
+
+    def deserialize(self, payload: bytes) -> None:
+        return None
+
+    def serialize(self, message: None) -> bytes:
+        return b"null"
+
+
+def message_serializers() -> List[MessageSerializer[Any]]:
+    """The serializers of the messages, registered on every gRPC worker runtime."""
+    return [
+        NoneSerializer(),
+        *(
+            serializer
+            for message_type in MESSAGE_TYPES
+            for serializer in try_get_known_serializers_for_type(message_type)
+        ),
+    ]
@@ -0,0 +1,79 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator
+
+
+class LatencyStats:
+    """
+    Collects latency samples (in seconds) for a single operation.
+    Only the most recent `max_samples` are kept to compute percentiles, while count and totals cover all samples.
+    """
+
+    def __init__(self, max_samples: int = 10_000) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: Deque[float] = deque(maxlen=max_samples)
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._samples.append(seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Returns the p-th percentile (0-100) of the retained samples."""
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self) -> Dict[str, float]:
+        """Returns a summary of the collected samples, latencies are in milliseconds."""
+        return {
+            "count": self.count,
+            "mean_ms": self.mean * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Metrics:
+    """
+    A registry of named latency stats.
+    """
+
+    def __init__(self) -> None:
+        self._stats: Dict[str, LatencyStats] = {}
+
+    def get(self, name: str) -> LatencyStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = LatencyStats()
+        return stats
+
+    def record(self, name: str, seconds: float) -> None:
+        self.get(name).record(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Records the time spent in the wrapped block under the given name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: stats.summary() for name, stats in sorted(self._stats.items())}
+
+    def reset(self) -> None:
+        self._stats.clear()
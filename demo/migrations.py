@@ -0,0 +1,233 @@
+import datetime
+import sqlite3
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from utils import print_info
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    A schema migration step.
+    `apply` runs inside a transaction together with the schema change bookkeeping, so it must only
+    contain fast operations (DDL, small updates). Changes touching many rows go into `backfill`,
+    that is executed in small batches so that the database is never locked for long.
+    Both must be idempotent since an interrupted migration is executed again at the next startup.
+    """
+
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+    backfill: Optional[str] = None
+
+
+def _create_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS Cars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            brand TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            price INTEGER NOT NULL,
+            color TEXT,
+            mileage INTEGER,
+            fuel TEXT,
+            model TEXT,
+            is_available BOOLEAN NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS Orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            car_id INTEGER NOT NULL,
+            customer_name TEXT NOT NULL,
+            customer_email TEXT NOT NULL,
+            date TEXT NOT NULL,
+            status TEXT,
+            is_available BOOLEAN NOT NULL,
+            FOREIGN KEY (car_id) REFERENCES Cars (id)
+        );
+        """
+    )
+
+
+# Secondary indexes for the find_cars filters (brand led, year led and price only) and the orders lookups
+INDEXES = {
+    "idx_cars_available_brand": "Cars (is_available, brand, year, price)",
+    "idx_cars_available_year": "Cars (is_available, year, price)",
+    "idx_cars_available_price": "Cars (is_available, price)",
+    "idx_orders_customer": "Orders (customer_name, is_available)",
+    "idx_orders_car": "Orders (car_id)",
+}
+
+
+def _create_indexes(conn: sqlite3.Connection) -> None:
+    for name, definition in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition};")
+
+
+def _add_orders_is_deleted(conn: sqlite3.Connection) -> None:
+    if not _has_column(conn, "Orders", "is_deleted"):
+        conn.execute(
+            "ALTER TABLE Orders ADD COLUMN is_deleted BOOLEAN NOT NULL DEFAULT 0;"
+        )
+
+
+def _create_cars_search_index(conn: sqlite3.Connection) -> None:
+    # External content table: the index stores only the tokens, the values are read from Cars
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS CarsFts USING fts5(
+            brand, model, color, fuel, content='Cars', content_rowid='id'
+        );
+        """
+    )
+    # executescript would commit the migration transaction, so the triggers are created one by one.
+    # The existing cars are indexed by the backfill after the triggers are in place: the cars not indexed yet
+    # must not be removed from the index (FTS5 would corrupt it), their current values are indexed later.
+    for trigger in (
+        """
+        CREATE TRIGGER IF NOT EXISTS cars_fts_insert AFTER INSERT ON Cars BEGIN
+            INSERT INTO CarsFts (rowid, brand, model, color, fuel)
+            VALUES (new.id, new.brand, new.model, new.color, new.fuel);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS cars_fts_delete AFTER DELETE ON Cars
+        WHEN EXISTS (SELECT 1 FROM CarsFts_docsize WHERE id = old.id) BEGIN
+            INSERT INTO CarsFts (CarsFts, rowid, brand, model, color, fuel)
+            VALUES ('delete', old.id, old.brand, old.model, old.color, old.fuel);
+        END;
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS cars_fts_update AFTER UPDATE OF brand, model, color, fuel ON Cars
+        WHEN EXISTS (SELECT 1 FROM CarsFts_docsize WHERE id = old.id) BEGIN
+            INSERT INTO CarsFts (CarsFts, rowid, brand, model, color, fuel)
+            VALUES ('delete', old.id, old.brand, old.model, old.color, old.fuel);
+            INSERT INTO CarsFts (rowid, brand, model, color, fuel)
+            VALUES (new.id, new.brand, new.model, new.color, new.fuel);
+        END;
+        """,
+    ):
+        conn.execute(trigger)
+
+
+def _has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table});"))
+
+
+# The ordered list of migrations, new steps must be appended with an increasing version.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Create Cars and Orders tables", _create_tables),
+    Migration(2, "Create secondary indexes", _create_indexes),
+    Migration(
+        3,
+        "Add Orders.is_deleted",
+        _add_orders_is_deleted,
+        # Orders deleted before this migration are only marked by their status
+        backfill="""
+            UPDATE Orders SET is_deleted = 1 WHERE id IN (
+                SELECT id FROM Orders WHERE status = 'Deleted' AND is_deleted = 0 LIMIT ?
+            );
+        """,
+    ),
+    Migration(
+        4,
+        "Create the cars full-text search index",
+        _create_cars_search_index,
+        # CarsFts_docsize holds a row per indexed car. The cars are indexed from the highest id down, and the new
+        # cars (AUTOINCREMENT, higher ids) are indexed by the trigger, so the indexed cars are always the ones above
+        # the lowest indexed id and each batch is an id range below it
+        backfill="""
+            INSERT INTO CarsFts (rowid, brand, model, color, fuel)
+            SELECT id, brand, model, color, fuel FROM Cars
+            WHERE id < COALESCE((SELECT MIN(id) FROM CarsFts_docsize), (SELECT MAX(id) FROM Cars) + 1)
+            ORDER BY id DESC LIMIT ?;
+        """,
+    ),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Returns the version of the last migration applied to the database."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        );
+        """
+    )
+    row = conn.execute("SELECT MAX(version) FROM schema_version;").fetchone()
+    return row[0] or 0
+
+
+def backfill(conn: sqlite3.Connection, statement: str, batch_size: int) -> int:
+    """
+    Executes `statement` (that must take the batch size as its only parameter) until it no longer
+    updates any row, committing after each batch so that other writers can interleave.
+    Returns the number of updated rows.
+    """
+    total = 0
+    while True:
+        with conn:
+            updated = conn.execute(statement, (batch_size,)).rowcount
+        if updated <= 0:
+            return total
+        total += updated
+
+
+def migrate(
+    conn: sqlite3.Connection,
+    migrations: List[Migration] = MIGRATIONS,
+    batch_size: int = 1000,
+) -> int:
+    """
+    Brings the database schema up to date applying the pending migrations in order.
+    Returns the resulting schema version.
+    """
+    conn.commit()
+    version = schema_version(conn)
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= version:
+            continue
+
+        print_info(f"Applying migration {migration.version}: {migration.description}")
+
+        # BEGIN IMMEDIATE takes the write lock upfront, so concurrent processes starting together
+        # apply each migration once.
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            if schema_version(conn) < migration.version:
+                migration.apply(conn)
+                if migration.backfill is None:
+                    _record(conn, migration)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if migration.backfill is not None:
+            rows = backfill(conn, migration.backfill, batch_size)
+            print_info(f"Backfilled {rows} rows")
+            with conn:
+                _record(conn, migration)
+
+        version = migration.version
+
+    return version
+
+
+def _record(conn: sqlite3.Connection, migration: Migration) -> None:
+    conn.execute(
+        "INSERT OR IGNORE INTO schema_version (version, description, applied_at) VALUES (?, ?, ?);",
+        (
+            migration.version,
+            migration.description,
+            datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        ),
+    )
@@ -1,14 +1,39 @@
+from typing import Any, Mapping
+
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.base import Handoff
-from autogen_agentchat.messages import HandoffMessage, TextMessage
-from autogen_core import AgentId, MessageContext, RoutedAgent, message_handler
+from autogen_agentchat.messages import HandoffMessage
+from autogen_core import AgentId, MessageContext, message_handler
 from autogen_core.models import ChatCompletionClient
-from messages import AdvisorMessage, OrderMessage, TriageMessage, UserMessage
-from tools import Tools
+from context import get_model_context
+from lifecycle import PooledAgent
+from messages import (
+    AdvisorMessage,
+    OrderMessage,
+    StreamChunkMessage,
+    TriageMessage,
+    UserMessage,
+)
+from prompts import SALES_PROMPT
+from streaming import STREAMING_ENABLED, run_streaming
+from tools import SALES_TOOLS, SharedHandoff
+from usage import usage_tracker
 from utils import print_core, print_route
 
 
-class SalesAgent(RoutedAgent):
+# Shared by all the instances, see tools.py
+SALES_HANDOFFS = [
+    SharedHandoff(
+        target="triage_agent",
+        description="Use it when the user no longer needs assistance, the request has been resolved, the question is not relevant to an order or the user is not interested in continuing the conversation.",
+    ),
+    SharedHandoff(
+        target="advisor_agent",
+        description="Use it when the user has question that is related to car advising or the user wishes some advising regarding ordering or considering a car like a car model or brand or seeing the available cars.",
+    ),
+]
+
+
+class SalesAgent(PooledAgent):
     """
     Sales agent that specializes in handling user requests related to car orders.
     It uses a set of tools to perform operations such as creating, deleting, and retrieving orders.
@@ -24,77 +49,24 @@ class SalesAgent(RoutedAgent):
         self._agent = AssistantAgent(
             name="order_management_agent",
             model_client=model_client,
-            tools=[
-                Tools.get_car,
-                Tools.create_order,
-                Tools.delete_order,
-                Tools.get_order,
-                Tools.get_orders,
-                Tools.inform_after_sales_department,
-            ],
-            system_message=f""""
-            You are a specialized assistant responsible for handling conversations related to car orders.
-            Your primary tasks include creating orders, deleting orders, checking existing orders, and retrieving the list of places where orders have been made. Follow these guidelines:
-
-            Creating an Order:
-
-            Required Information:
-            - id of the car to order
-            - Customer name
-            - Customer email            
-            
-            Before creating the order, ask the user for a confirmation of the order details and ask to confirm by typing "yes" or "no".
-            If the user confirms, proceed with the order creation.
-            If the user does not confirm, ask them if they would like to provide any additional information or cancel the order.
-            After successfully creating the order, you must invoke the tool `inform_after_sales_department` with the following details:
-            - order id (as returned from the create_order tool)
-                        
-            Deleting an Order:
-
-            Before proceeding with a deletion, always ask the user for a final confirmation.
-            Ensure that the user explicitly confirms that they want to delete the order. 
-            After successfully deleting the order, you must invoke the tool `inform_after_sales_department` with the following details:
-            - order id
-            
-            Asking About Existing Orders:
-
-            Request the customer name to fetch and display any existing orders related to that customer.
-
-            Retrieving the List of Places Order:
-
-            Ask for the customer's name in order to provide the list of places where orders have been made.     
-
-            Informing the After Sales Department:
-
-            Required Information:
-            - order id
-            - order status
-
-            Each time a new order is created or an order is deleted, you must invoke the tool `inform_after_sales_department` to notify the after-sales department about the order status change.      
+            # Keeps the conversation within a token budget, see CONTEXT_POLICIES
+            model_context=get_model_context("sales_agent", model_client),
+            tools=SALES_TOOLS,
+            system_message=SALES_PROMPT,
+            reflect_on_tool_use=True,
+            model_client_stream=STREAMING_ENABLED,
+            handoffs=SALES_HANDOFFS,
+        )
 
-            Additional Guidelines:
+    async def save_state(self) -> Mapping[str, Any]:
+        return {"assistant": await self._agent.save_state()}
 
-            Always verify that all required information is provided before executing any operation.
-            When information is missing, ask clear and concise follow-up questions to obtain the necessary details.
-            Handle the conversation in a friendly, clear, and professional manner.
-            Ensure that each operation is clearly confirmed with the user to avoid any miscommunication.
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        await self._agent.load_state(state["assistant"])
 
-            If you encounter any issues, need further clarification, or require assistance, feel free to request a handoff to the proper agent.
-            Kindly deny any requests that are not related to car orders or the tasks mentioned above.
-            If the user is not interested in continuing the conversation, please use the handoff tool to transfer the conversation to the user agent.
-            
-            """,
-            reflect_on_tool_use=True,
-            handoffs=[
-                Handoff(
-                    target="triage_agent",
-                    description="Use it when the user no longer needs assistance, the request has been resolved, the question is not relevant to an order or the user is not interested in continuing the conversation.",
-                ),
-                Handoff(
-                    target="advisor_agent",
-                    description="Use it when the user has question that is related to car advising or the user wishes some advising regarding ordering or considering a car like a car model or brand or seeing the available cars.",
-                ),
-            ],
+    async def _send_chunk(self, content: str) -> None:
+        await self.send_message(
+            StreamChunkMessage(content=content), AgentId("user_agent", self.id.key)
         )
 
     @message_handler()
@@ -103,10 +75,11 @@ class SalesAgent(RoutedAgent):
     ) -> None:
         print_route(ctx.sender, self.id, message.content)
 
-        response = await self._agent.on_messages(
-            [TextMessage(content=message.content, source="user")],
-            ctx.cancellation_token,
-        )
+        with usage_tracker.turn(self.id.type, self.id.key):
+            response = await run_streaming(
+                self._agent, message.content, ctx.cancellation_token, self._send_chunk
+            )
+        await self.checkpoint()
 
         if isinstance(response.chat_message, HandoffMessage):
             print_core(
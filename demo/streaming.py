@@ -0,0 +1,35 @@
+import os
+from typing import Awaitable, Callable, Optional
+
+from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import ModelClientStreamingChunkEvent, TextMessage
+from autogen_core import CancellationToken
+
+# Streams the model output of the agents to the user as it is generated, set MODEL_STREAMING=false to disable it
+STREAMING_ENABLED = os.getenv("MODEL_STREAMING", "true").lower() in ("1", "true", "yes")
+
+
+async def run_streaming(
+    agent: AssistantAgent,
+    content: str,
+    cancellation_token: CancellationToken,
+    on_chunk: Callable[[str], Awaitable[None]],
+) -> Response:
+    """
+    Runs the assistant on a user message like `on_messages`, calling `on_chunk` with each chunk of text
+    generated by the model (the direct answers and the reflection on the tool results) as soon as it is received.
+    Tool calls and handoffs are not streamed.
+    """
+    response: Optional[Response] = None
+    async for event in agent.on_messages_stream(
+        [TextMessage(content=content, source="user")], cancellation_token
+    ):
+        if isinstance(event, ModelClientStreamingChunkEvent):
+            await on_chunk(event.content)
+        elif isinstance(event, Response):
+            response = event
+
+    if response is None:
+        raise RuntimeError(f"The agent {agent.name} did not return a response")
+    return response
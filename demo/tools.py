@@ -1,17 +1,35 @@
+import os
 import random
-from typing import List
+from functools import cached_property
+from typing import Any, Callable, List
 
-from autogen_core import SingleThreadedAgentRuntime, TopicId
-from datastore import Car, CarDB, CarIdCache, Order
+from autogen_agentchat.base import Handoff
+from autogen_core import AgentRuntime, TopicId
+from autogen_core.tools import BaseTool, FunctionTool
+from datastore import AsyncCarDB, CarIdCache, OrderConflictError, get_profile
+from encoders import encode_cars, encode_orders, encode_search_result
 from messages import OrderUpdateMessage
 from typing_extensions import Annotated
 from utils import print_error, print_tool
 
 
+# Tool results are encoded as compact tables (see encoders.py) rather than dataclass reprs,
+# repeating the field names on every row would multiply the prompt tokens
 class Tools:
 
-    db: CarDB = CarDB()
-    runtime: SingleThreadedAgentRuntime
+    # The SQLite profile can be switched with the CARDB_PROFILE environment variable (default or production),
+    # the database path with CARDB_PATH (shared by the processes of the distributed runtime, whose cached reads
+    # are checked against the writes of the other processes)
+    db: AsyncCarDB = AsyncCarDB(
+        os.getenv("CARDB_PATH", "data/cars.db"),
+        profile=get_profile(),
+        shared=os.getenv("RUNTIME_MODE", "local").lower() != "local",
+    )
+    runtime: AgentRuntime
+
+    SEARCH_PAGE_SIZE = 10
+    # Cars listed by a single get_available_cars call, the model can ask for the next pages
+    CARS_PAGE_SIZE = 20
 
     @staticmethod
     async def get_available_cars(
@@ -23,18 +41,82 @@ class Tools:
             int | None,
             "The available budged for the car or None to consider any budget",
         ],
-    ) -> List[Car]:
+        page: Annotated[int, "The page of results to retrieve, starting from 1"] = 1,
+    ) -> Annotated[str, "A table of the available cars"]:
         """Use this tool you need to get the available cars"""
 
         print_tool("get_available_cars", f"{brand}-{year}-{budget}")
-        return Tools.db.find_cars(brand=brand, year=year, price=budget)
+        cars = await Tools.db.find_cars(brand=brand, year=year, price=budget)
+        start = (max(page, 1) - 1) * Tools.CARS_PAGE_SIZE
+        return encode_cars(
+            cars[start:],
+            max_rows=Tools.CARS_PAGE_SIZE,
+            more_hint=f"call again with page={max(page, 1) + 1} to see them",
+        )
+
+    @staticmethod
+    async def search_cars(
+        keywords: Annotated[
+            str | None,
+            "Words to match against the car brand, model, color and fuel (e.g. 'red electric'), or None to match any car",
+        ],
+        min_year: Annotated[int | None, "The minimum year of the car, or None"],
+        max_year: Annotated[int | None, "The maximum year of the car, or None"],
+        min_price: Annotated[int | None, "The minimum price of the car, or None"],
+        max_price: Annotated[int | None, "The maximum price of the car, or None"],
+        max_mileage: Annotated[int | None, "The maximum mileage of the car, or None"],
+        page: Annotated[int, "The page of results to retrieve, starting from 1"] = 1,
+    ) -> Annotated[
+        str,
+        "A table with a page of matching cars, the total number of matches and the number of matches per brand, fuel, color and year",
+    ]:
+        """Use this tool to search the available cars by description and ranges of year, price and mileage"""
+
+        print_tool(
+            "search_cars",
+            f"{keywords}-{min_year}-{max_year}-{min_price}-{max_price}-{max_mileage}-{page}",
+        )
+        offset = (max(page, 1) - 1) * Tools.SEARCH_PAGE_SIZE
+        result = await Tools.db.search_cars(
+            keywords,
+            min_year=min_year,
+            max_year=max_year,
+            min_price=min_price,
+            max_price=max_price,
+            max_mileage=max_mileage,
+            limit=Tools.SEARCH_PAGE_SIZE,
+            offset=offset,
+        )
+        return encode_search_result(
+            result, offset, more_hint=f"search again with page={max(page, 1) + 1} to see them"
+        )
 
     @staticmethod
-    async def get_car(id: Annotated[int, "The id of the car"]):
+    async def get_car(
+        id: Annotated[int, "The id of the car"],
+    ) -> Annotated[str, "The car info, or a message if the car is not available"]:
         """Use this tool to get a car info by its id"""
 
         print_tool("get_car", f"{id}")
-        return Tools.db.get_car(id)
+        car = await Tools.db.get_car(id)
+        if car is None:
+            return f"Car {id} is not available"
+        return encode_cars([car])
+
+    @staticmethod
+    async def get_cars(
+        ids: Annotated[list[int], "The ids of the cars"],
+    ) -> Annotated[
+        str,
+        "A table of the available cars among the requested ones, or a message if none of them is available",
+    ]:
+        """Use this tool to get the info of several cars at once, instead of calling get_car for each of them"""
+
+        print_tool("get_cars", f"{ids}")
+        cars = await Tools.db.get_cars(ids)
+        if len(cars) == 0:
+            return f"None of the cars {ids} is available"
+        return encode_cars(cars)
 
     @staticmethod
     async def cache_carId(
@@ -53,14 +135,18 @@ class Tools:
         customer_name: Annotated[str, "The name of the customer"],
         customer_email: Annotated[str, "The email of the customer"],
     ) -> Annotated[
-        Order | None,
-        "The order info to communicate to the user, or None if the order could not be created",
+        str | None,
+        "The order info to communicate to the user, a message if the car is no longer available, or None if the order could not be created",
     ]:
         """Use this tool to create a new order for a car"""
 
         print_tool("create_order", f"{car_id}-{customer_name}-{customer_email}")
         try:
-            return Tools.db.create_order(car_id, customer_name, customer_email)
+            order = await Tools.db.create_order(car_id, customer_name, customer_email)
+            return encode_orders([order])
+        except OrderConflictError as e:
+            print_error(f"Order conflict: {e}")
+            return f"Car {car_id} has just been ordered by another customer and is no longer available."
         except Exception as e:
             print_error(f"Error creating order: {e}")
             return None
@@ -76,11 +162,10 @@ class Tools:
 
         print_tool("delete_order", f"{order_id}")
         try:
-            order = Tools.db.get_order(order_id)
-            if order is None:
-                print_error(f"Order {order} not found")
+            # Checked by the delete itself, an order deleted by a concurrent session is not found
+            if await Tools.db.delete_order(order_id) is None:
+                print_error(f"Order {order_id} not found")
                 return "Order not found!"
-            Tools.db.delete_order(order_id)
             return True
         except Exception as e:
             print_error(f"Error deleting order: {e}")
@@ -90,7 +175,7 @@ class Tools:
     async def get_order(
         order_id: Annotated[int, "The id of the order to retrieve"],
     ) -> Annotated[
-        Order | str,
+        str,
         "The found order, or a message if the order was not found",
     ]:
         """Use this tool to find an order by its id"""
@@ -98,33 +183,55 @@ class Tools:
         print_tool("get_order", f"{order_id}")
 
         try:
-            order = Tools.db.get_order(order_id)
+            order = await Tools.db.get_order(order_id)
             if order is None:
                 message = f"Order {order} not found"
                 print_error(message)
                 return message
-            return order
+            return encode_orders([order])
         except Exception as e:
             print_error(f"Error getting order: {e}")
             return "An error occurred while retrieving the order"
 
+    @staticmethod
+    async def get_orders_by_ids(
+        order_ids: Annotated[list[int], "The ids of the orders to retrieve"],
+    ) -> Annotated[
+        str,
+        "A table of the orders found among the requested ones, or a message if none of them was found",
+    ]:
+        """Use this tool to find several orders at once by their ids, instead of calling get_order for each of them"""
+
+        print_tool("get_orders_by_ids", f"{order_ids}")
+
+        try:
+            orders = await Tools.db.get_orders_by_ids(order_ids)
+            if len(orders) == 0:
+                message = f"Orders {order_ids} not found"
+                print_error(message)
+                return message
+            return encode_orders(orders)
+        except Exception as e:
+            print_error(f"Error getting orders: {e}")
+            return "An error occurred while retrieving the orders"
+
     @staticmethod
     async def lookup_order(
         order_id: Annotated[int, "The id of the order to retrieve"],
     ) -> Annotated[
-        Order | str,
+        str,
         "The found order, or a message if the order was not found",
     ]:
         """Use this tool to find an order by its id"""
 
         print_tool("lookup_order", f"{order_id}")
         try:
-            order = Tools.db.get_order(order_id, include_deleted=True)
+            order = await Tools.db.get_order(order_id, include_deleted=True)
             if order is None:
                 message = f"Order {order} not found"
                 print_error(message)
                 return message
-            return order
+            return encode_orders([order])
         except Exception as e:
             print_error(f"Error getting order: {e}")
             return "An error occurred while retrieving the order"
@@ -135,18 +242,18 @@ class Tools:
             str, "The name of the customer to retrieve orders for"
         ],
     ) -> Annotated[
-        List[Order] | str,
-        "The list of orders for the customer, or a message if no orders were found",
+        str,
+        "A table of the orders of the customer, or a message if no orders were found",
     ]:
         """Use this tool to find an the orders of a customer by their name"""
 
         print_tool("get_orders", f"{customer_name}")
 
         try:
-            orders = Tools.db.get_orders_by_customer(customer_name)
+            orders = await Tools.db.get_orders_by_customer(customer_name)
             if len(orders) == 0:
                 return f"No orders found for {customer_name}!"
-            return orders
+            return encode_orders(orders)
         except Exception as e:
             print_error(f"Error getting customer orders: {e}")
             return "An error occurred while retrieving customer's orders"
@@ -176,3 +283,36 @@ class Tools:
             ),  # the after_sales is not tied to any specific session, it just listen to this topic
         )
         return random.randint(1, 1000)  # Simulate a notification id
+
+
+# AssistantAgent builds a FunctionTool, with its JSON schema and arguments model, for every function and handoff
+# it is given: the tools of each agent type are built once and shared by all the sessions
+def shared_tools(*functions: Callable[..., Any]) -> List[FunctionTool]:
+    return [FunctionTool(function, description=function.__doc__ or "") for function in functions]
+
+
+class SharedHandoff(Handoff):
+    """A handoff whose tool is built once, rather than every time an agent asks for it."""
+
+    @cached_property
+    def handoff_tool(self) -> BaseTool[Any, Any]:
+        return Handoff.handoff_tool.fget(self)
+
+
+ADVISOR_TOOLS = shared_tools(
+    Tools.get_available_cars,
+    Tools.search_cars,
+    Tools.get_cars,
+    Tools.cache_carId,
+)
+SALES_TOOLS = shared_tools(
+    Tools.get_car,
+    Tools.get_cars,
+    Tools.create_order,
+    Tools.delete_order,
+    Tools.get_order,
+    Tools.get_orders_by_ids,
+    Tools.get_orders,
+    Tools.inform_after_sales_department,
+)
+AFTER_SALES_TOOLS = shared_tools(Tools.lookup_order)
@@ -1,48 +1,80 @@
+import time
+from typing import Any, Mapping, Optional
+
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.base import Handoff
-from autogen_agentchat.messages import HandoffMessage, TextMessage
-from autogen_core import AgentId, MessageContext, RoutedAgent, message_handler
+from autogen_agentchat.messages import HandoffMessage
+from autogen_core import AgentId, MessageContext, message_handler
 from autogen_core.models import ChatCompletionClient
-from messages import TriageMessage, UserMessage
+from classifier import TriageClassifier
+from lifecycle import PooledAgent
+from messages import StreamChunkMessage, TriageMessage, UserMessage
+from metrics import Metrics
+from prompts import TRIAGE_PROMPT
+from streaming import STREAMING_ENABLED, run_streaming
+from tools import SharedHandoff
+from usage import usage_tracker
 from utils import print_core, print_route
 
 
-class TriageAgent(RoutedAgent):
+# Shared by all the instances, see tools.py
+TRIAGE_HANDOFFS = {
+    "user_agent": SharedHandoff(
+        target="user_agent",
+        description="Use it when the user provides a question that is not relevant to car ordering, advising, availability or related to a previous car order.",
+        message="I'm sorry, I'm not able to help you with that.",
+    ),
+    "advisor_agent": SharedHandoff(
+        target="advisor_agent",
+        description="Use it when the user provides a question that involves a conversation about a car or the user wishes some advising regarding ordering or considering a car.",
+    ),
+    "sales_agent": SharedHandoff(
+        target="sales_agent",
+        description="Use it when the user provides a question that involves a conversation about a an existing order or he wishes to cancel an order.",
+    ),
+}
+
+
+class TriageAgent(PooledAgent):
     """
     Triage agent that specializes in handling user requests and forwarding them to the appropriate agent.
     """
 
-    def __init__(self, model_client: ChatCompletionClient) -> None:
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        classifier: Optional[TriageClassifier] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
         super().__init__(
             description="An agent that specializes in handling user requests and handoff them to the proper agent."
         )
 
         print_core(f"Agent ({self.id}) initialized")
 
+        # Messages routed with confidence by the local classifier skip the LLM,
+        # the triage latency of both paths is recorded in `metrics`
+        self._classifier = classifier
+        self._metrics = metrics or Metrics()
+        self._handoffs = TRIAGE_HANDOFFS
+
         # We rely on the AssistantAgent to handle the triage process since it offers a nice handoff mechanism.
         self._agent = AssistantAgent(
             name="triage_agent",
             model_client=model_client,
-            handoffs=[
-                Handoff(
-                    target="user_agent",
-                    description="Use it when the user provides a question that is not relevant to car ordering, advising, availability or related to a previous car order.",
-                    message="I'm sorry, I'm not able to help you with that.",
-                ),
-                Handoff(
-                    target="advisor_agent",
-                    description="Use it when the user provides a question that involves a conversation about a car or the user wishes some advising regarding ordering or considering a car.",
-                ),
-                Handoff(
-                    target="sales_agent",
-                    description="Use it when the user provides a question that involves a conversation about a an existing order or he wishes to cancel an order.",
-                ),
-            ],
-            system_message=f""""
-            "You are an assistant whose role is to triage user requests and handoff them to the proper agent.
-            If you need more information about the user request, you can ask the user for more details.
-            """,
+            handoffs=list(self._handoffs.values()),
+            system_message=TRIAGE_PROMPT,
             reflect_on_tool_use=True,
+            model_client_stream=STREAMING_ENABLED,
+        )
+
+    async def save_state(self) -> Mapping[str, Any]:
+        # Stateless on purpose: the assistant is reset before each request (see handle_request), so an evicted
+        # or resumed triage agent routes the next message exactly as the instance it replaces would have
+        return {}
+
+    async def _send_chunk(self, content: str) -> None:
+        await self.send_message(
+            StreamChunkMessage(content=content), AgentId("user_agent", self.id.key)
         )
 
     @message_handler()
@@ -51,35 +83,33 @@ class TriageAgent(RoutedAgent):
         """
         Handles the request from the User Agent and uses the internal assistant to decide how to handle it.
         """
+        start = time.perf_counter()
+        classification = (
+            self._classifier.classify(message.content) if self._classifier else None
+        )
+        if classification is not None:
+            self._metrics.record("triage:fast_path", time.perf_counter() - start)
+            print_core(
+                f"Agent ({self.id}) routed to {classification.target} by {classification.source}"
+            )
+            handoff = self._handoffs[classification.target]
+            await self._route(handoff.target, handoff.message, message)
+            return
+
         # We reset the assistant agent to remove any previous context.
         await self._agent.on_reset(ctx.cancellation_token)
 
-        response = await self._agent.on_messages(
-            [TextMessage(content=message.content, source="user")],
-            ctx.cancellation_token,
-        )
+        with usage_tracker.turn(self.id.type, self.id.key):
+            response = await run_streaming(
+                self._agent, message.content, ctx.cancellation_token, self._send_chunk
+            )
+        self._metrics.record("triage:llm", time.perf_counter() - start)
 
         # If agent request handoff, forwards the message to the target agent
         if isinstance(response.chat_message, HandoffMessage):
-            match response.chat_message.target:
-                # The user probably want to ask about a car or needs some advising
-                case "advisor_agent":
-                    response = await self.send_message(
-                        TriageMessage(content=message.content),
-                        AgentId(response.chat_message.target, self.id.key),
-                    )
-                # The user probably wants to cancel an order or ask about an existing order
-                case "sales_agent":
-                    await self.send_message(
-                        UserMessage(content=message.content),
-                        AgentId(response.chat_message.target, self.id.key),
-                    )
-                case _:
-                    # The user probably has provided a question that is not relevant.
-                    await self.send_message(
-                        TriageMessage(content=response.chat_message.content),
-                        AgentId(response.chat_message.target, self.id.key),
-                    )
+            await self._route(
+                response.chat_message.target, response.chat_message.content, message
+            )
         else:
             # In case the agent does not request handoff, send the response back to user agent
             # to let the user agent continue the conversation
@@ -87,3 +117,27 @@ class TriageAgent(RoutedAgent):
                 TriageMessage(content=response.chat_message.content),
                 AgentId("user_agent", self.id.key),
             )
+
+    async def _route(self, target: str, handoff_message: str, message: UserMessage) -> None:
+        """
+        Forwards the user message to the handoff target.
+        """
+        match target:
+            # The user probably want to ask about a car or needs some advising
+            case "advisor_agent":
+                await self.send_message(
+                    TriageMessage(content=message.content),
+                    AgentId(target, self.id.key),
+                )
+            # The user probably wants to cancel an order or ask about an existing order
+            case "sales_agent":
+                await self.send_message(
+                    UserMessage(content=message.content),
+                    AgentId(target, self.id.key),
+                )
+            case _:
+                # The user probably has provided a question that is not relevant.
+                await self.send_message(
+                    TriageMessage(content=handoff_message),
+                    AgentId(target, self.id.key),
+                )
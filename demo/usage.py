@@ -0,0 +1,226 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterator, Optional, TextIO, Tuple
+
+from autogen_core import FunctionCall
+from autogen_core.models import CreateResult, RequestUsage
+
+from model_clients.settings import get_setting
+
+
+@dataclass
+class UsageScope:
+    """The agent turn the model calls belong to, `calls` counts the model calls (iterations) of the turn."""
+
+    agent_type: str
+    session: str
+    turn: int
+    calls: int = 0
+
+
+@dataclass(slots=True, frozen=True)
+class UsageRecord:
+    timestamp: float
+    agent_type: str
+    session: str
+    turn: int
+    iteration: int
+    kind: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency_ms: float
+    cost: float
+    # The model did not report the usage, the tokens are counted locally
+    estimated: bool = False
+
+
+@dataclass
+class UsageTotals:
+    calls: int = 0
+    estimated: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    cost: float = 0.0
+
+    def add(self, record: UsageRecord) -> None:
+        self.calls += 1
+        self.estimated += record.estimated
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.latency += record.latency_ms / 1000
+        self.cost += record.cost
+
+
+_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+_kind: ContextVar[Optional[str]] = ContextVar("usage_kind", default=None)
+
+
+@contextmanager
+def usage_kind(kind: str) -> Iterator[None]:
+    """Labels the model calls made in the block (e.g. `summary`), instead of deriving it from the result."""
+    token = _kind.set(kind)
+    try:
+        yield
+    finally:
+        _kind.reset(token)
+
+
+def background_context() -> Context:
+    """
+    The context of a task started by an agent turn (e.g. a conversation summary): its model calls are recorded for
+    the agent and session of the turn as turn 0, rather than as iterations of whatever turn is running.
+    """
+    scope = _scope.get()
+    context = Context()
+    if scope is not None:
+        context.run(_scope.set, UsageScope(scope.agent_type, scope.session, 0))
+    return context
+
+
+@dataclass
+class _Prices:
+    # Prices per million tokens
+    prompt: float = 0.0
+    completion: float = 0.0
+
+
+class UsageTracker:
+    """
+    Accounts the tokens, latency and cost of every model call, tagged by agent type, session, turn and
+    iteration (the position of the call in the turn) through the scope opened by the agents with `turn`.
+    Totals are aggregated in memory, each call is also appended to a JSONL log when `log_path` is set.
+    """
+
+    def __init__(self, log_path: Optional[str] = None) -> None:
+        self.log_path = log_path
+        self._log: Optional[TextIO] = None
+        self._turns: Dict[Tuple[str, str], int] = {}
+        self._prices: Dict[str, _Prices] = {}
+        # (agent_type, kind, model) -> totals
+        self.totals: Dict[Tuple[str, str, str], UsageTotals] = {}
+        # (agent_type, session) -> totals
+        self.sessions: Dict[Tuple[str, str], UsageTotals] = {}
+
+    @contextmanager
+    def turn(self, agent_type: str, session: str) -> Iterator[UsageScope]:
+        """Opens the scope of an agent turn, the model calls made within it are tagged with it."""
+        key = (agent_type, session)
+        self._turns[key] = self._turns.get(key, 0) + 1
+        token = _scope.set(UsageScope(agent_type, session, self._turns[key]))
+        try:
+            yield _scope.get()
+        finally:
+            _scope.reset(token)
+
+    def _price(self, model: str) -> _Prices:
+        prices = self._prices.get(model)
+        if prices is None:
+            profile = None if model == "default" else model
+            prices = self._prices[model] = _Prices(
+                float(get_setting("MODEL_PRICE_PROMPT", "0", profile)),
+                float(get_setting("MODEL_PRICE_COMPLETION", "0", profile)),
+            )
+        return prices
+
+    def on_usage(
+        self,
+        model: str,
+        result: CreateResult,
+        latency: float,
+        estimate: Optional[Callable[[], RequestUsage]] = None,
+    ) -> None:
+        """
+        Records a model call, to be passed to UsageChatCompletionClient.
+        A result without usage (e.g. a stream that did not send it) is accounted with the tokens of `estimate`.
+        """
+        scope = _scope.get() or UsageScope("unknown", "", 0)
+        scope.calls += 1
+        kind = _kind.get() or (
+            "tool_call"
+            if isinstance(result.content, list)
+            and any(isinstance(call, FunctionCall) for call in result.content)
+            else "text"
+        )
+        prices = self._price(model)
+        usage = result.usage
+        estimated = usage.prompt_tokens == 0 and usage.completion_tokens == 0 and estimate is not None
+        if estimated:
+            usage = estimate()
+        record = UsageRecord(
+            timestamp=time.time(),
+            agent_type=scope.agent_type,
+            session=scope.session,
+            turn=scope.turn,
+            iteration=scope.calls,
+            kind=kind,
+            model=model,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            latency_ms=latency * 1000,
+            cost=(usage.prompt_tokens * prices.prompt + usage.completion_tokens * prices.completion) / 1_000_000,
+            estimated=estimated,
+        )
+        self.record(record)
+
+    def record(self, record: UsageRecord) -> None:
+        self.totals.setdefault((record.agent_type, record.kind, record.model), UsageTotals()).add(record)
+        self.sessions.setdefault((record.agent_type, record.session), UsageTotals()).add(record)
+        if self.log_path:
+            if self._log is None:
+                self._log = open(self.log_path, "a", encoding="utf-8")
+            self._log.write(json.dumps(asdict(record)) + "\n")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """The totals by agent type, call kind and model, for print_metrics."""
+        return {
+            f"{agent_type}/{kind}/{model}": {
+                "calls": totals.calls,
+                "estimated_calls": totals.estimated,
+                "prompt_tokens": totals.prompt_tokens,
+                "completion_tokens": totals.completion_tokens,
+                "mean_latency_ms": totals.latency / totals.calls * 1000,
+                "cost": totals.cost,
+            }
+            for (agent_type, kind, model), totals in sorted(self.totals.items())
+        }
+
+    def to_prometheus(self) -> str:
+        """Renders the totals in the Prometheus text exposition format."""
+        metrics = {
+            "cardream_model_calls_total": ("Model calls", lambda t: t.calls),
+            "cardream_model_estimated_calls_total": ("Model calls with locally counted tokens", lambda t: t.estimated),
+            "cardream_model_prompt_tokens_total": ("Prompt tokens", lambda t: t.prompt_tokens),
+            "cardream_model_completion_tokens_total": ("Completion tokens", lambda t: t.completion_tokens),
+            "cardream_model_latency_seconds_total": ("Time spent in model calls", lambda t: t.latency),
+            "cardream_model_cost_total": ("Cost of the model calls", lambda t: t.cost),
+        }
+        lines = []
+        for name, (description, value) in metrics.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for (agent_type, kind, model), totals in sorted(self.totals.items()):
+                labels = f'agent="{agent_type}",kind="{kind}",model="{model}"'
+                lines.append(f"{name}{{{labels}}} {value(totals)}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: str) -> None:
+        # Written to a temporary file and renamed, so that a scraper never reads a partial file
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+# The tracker shared by all the agents, configured by USAGE_LOG_PATH (JSONL log of every call, disabled when empty)
+usage_tracker = UsageTracker(log_path=os.getenv("USAGE_LOG_PATH", "data/usage.jsonl") or None)
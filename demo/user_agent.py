@@ -1,30 +1,60 @@
+import time
+from typing import Any, Mapping, Optional
+
 from autogen_core import (
     AgentId,
     DefaultTopicId,
     MessageContext,
-    RoutedAgent,
     message_handler,
 )
+from lifecycle import PooledAgent
 from messages import (
     AdvisorMessage,
     OrderMessage,
     SessionStartMessage,
+    StreamChunkMessage,
     TriageMessage,
     UserMessage,
     UserTerminationMessage,
 )
-from utils import print_assistant, print_core, print_route
+from metrics import Metrics
+from user_io import UserChannel
+from utils import (
+    print_assistant,
+    print_core,
+    print_route,
+    print_stream_chunk,
+    print_stream_end,
+    print_stream_start,
+)
 
 
-class UserAgent(RoutedAgent):
+class UserAgent(PooledAgent):
     """
     User agent that interacts with the user and forwards messages to the appropriate agent.
+    The user input is read from `channel` without blocking, so the runtime keeps serving the other sessions.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, channel: UserChannel, metrics: Optional[Metrics] = None) -> None:
         super().__init__("Interactive user agent")
         print_core(f"Agent ({self.id}) initialized")
         self.is_terminated = False
+        self._channel = channel
+        # The end-to-end turn time, from the user input to the reply, and the time to the first
+        # visible token are recorded in `metrics`
+        self._metrics = metrics
+        self._sent_at: Optional[float] = None
+        self._first_token_recorded = False
+        # The text streamed since the last complete answer, that is not printed again
+        self._streamed = ""
+        # The type of the agent waiting for the user reply, a resumed session continues with it
+        self._reply_to: Optional[str] = None
+
+    async def save_state(self) -> Mapping[str, Any]:
+        return {"reply_to": self._reply_to} if self._reply_to is not None else {}
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        self._reply_to = state.get("reply_to")
 
     @message_handler
     async def handle_session_start(
@@ -39,14 +69,37 @@ class UserAgent(RoutedAgent):
             ctx.sender,
             "User session started",
         )
-        user_input = input(
-            f"\n({self.id.key}) Welcome to CarDream, how can i help you today? (type 'exit' to leave): "
-        )
+        if self._reply_to is None:
+            prompt = "Welcome to CarDream, how can i help you today? (type 'exit' to leave): "
+        else:
+            # Restored from the saved session state, the conversation continues where it was interrupted
+            prompt = "Welcome back to CarDream, type your reply (or 'exit' to end): "
+        user_input = await self._receive(f"\n({self.id.key}) {prompt}")
         if user_input == "exit":
             await self._terminate()
         else:
             user_message = UserMessage(content=user_input)
-            await self.send_message(user_message, AgentId("triage_agent", self.id.key))
+            self._sent_at = time.perf_counter()
+            self._first_token_recorded = False
+            await self.send_message(
+                user_message, AgentId(self._reply_to or "triage_agent", self.id.key)
+            )
+
+    @message_handler
+    async def handle_stream_chunk(
+        self, message: StreamChunkMessage, ctx: MessageContext
+    ) -> None:
+        """
+        Prints a chunk of an answer as soon as it is generated.
+        """
+        if self.is_terminated:
+            return
+
+        if not self._streamed:
+            print_stream_start(ctx.sender, self.id)
+        self._record_first_token()
+        self._streamed += message.content
+        print_stream_chunk(message.content)
 
     @message_handler()
     async def handle_triage_request(
@@ -61,23 +114,55 @@ class UserAgent(RoutedAgent):
         if self.is_terminated:
             return
 
-        print_assistant(ctx.sender, self.id, message.content)
+        self._record_first_token()
+        if self._metrics is not None and self._sent_at is not None:
+            self._metrics.record("turn", time.perf_counter() - self._sent_at)
+            self._sent_at = None
 
-        user_input = input(f"\n({self.id.key}) Type your reply (or 'exit' to end): ")
+        if self._streamed and message.content.strip() == self._streamed.strip():
+            # The answer has already been printed while streamed
+            print_stream_end()
+        else:
+            if self._streamed:
+                print_stream_end()
+            print_assistant(ctx.sender, self.id, message.content)
+        self._streamed = ""
+        self._reply_to = ctx.sender.type if ctx.sender is not None else None
+        await self.checkpoint()
+        await self._channel.send(self.id.key, message.content)
+
+        user_input = await self._receive(f"\n({self.id.key}) Type your reply (or 'exit' to end): ")
         if user_input == "exit":
             await self._terminate()
-            self.is_terminated = True
         else:
             # Once the user provided some input we reply back to agent who requested user input
             # to let the agent conversation continue
             user_message = UserMessage(content=user_input)
+            self._sent_at = time.perf_counter()
+            self._first_token_recorded = False
             await self.send_message(user_message, ctx.sender)
 
+    async def _receive(self, prompt: str) -> str:
+        try:
+            return await self._channel.receive(self.id.key, prompt)
+        except EOFError:
+            # The user is gone (end of the input or connection closed)
+            return "exit"
+
+    def _record_first_token(self) -> None:
+        if self._metrics is None or self._sent_at is None or self._first_token_recorded:
+            return
+        self._metrics.record("ttft", time.perf_counter() - self._sent_at)
+        self._first_token_recorded = True
+
     async def _terminate(self) -> None:
         """
         Handles the termination of the agent conversation.
         """
         print_core(f"Terminating agent ({self.id})...")
+        self.is_terminated = True
+        # The session is over, its saved state is discarded
+        await self.end_session()
         await self.publish_message(
             UserTerminationMessage(),
             DefaultTopicId(),
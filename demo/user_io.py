@@ -0,0 +1,190 @@
+import asyncio
+import os
+import sys
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class UserChannel(ABC):
+    """
+    The I/O of the user sessions: UserAgent waits for the user input with `receive` and delivers the answers with `send`.
+    The channels are asynchronous, a session waiting for its user never blocks the runtime nor the other sessions.
+    `receive` raises EOFError when the user is gone (end of the input, closed connection).
+    """
+
+    @abstractmethod
+    async def receive(self, session: str, prompt: str) -> str: ...
+
+    async def send(self, session: str, text: str) -> None:
+        """Delivers an answer, the console channel does nothing since UserAgent already prints the conversation."""
+
+    async def start(self, on_session: Callable[[str], Awaitable[None]], sessions: int) -> None:
+        """Starts `sessions` user sessions, calling `on_session` with the id of each one."""
+        await asyncio.gather(*(on_session(str(i + 1)) for i in range(sessions)))
+
+    async def close(self) -> None:
+        pass
+
+
+class ConsoleChannel(UserChannel):
+    """
+    Reads the user input from stdin without blocking the event loop: a pipe is watched by the event loop,
+    a terminal or a regular file is read by a worker thread.
+    The sessions share the console, so their prompts are asked one at a time.
+    """
+
+    def __init__(self) -> None:
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._pipe = True
+        self._lock = asyncio.Lock()
+
+    async def _readline(self) -> str:
+        if self._reader is None and self._pipe and sys.stdin.isatty():
+            # A terminal shares its open file with stdout, watching it would make stdout non-blocking too
+            # and the large writes of the console (streamed answers, metric tables) could fail
+            self._pipe = False
+        if self._reader is None and self._pipe:
+            reader = asyncio.StreamReader()
+            try:
+                await asyncio.get_running_loop().connect_read_pipe(
+                    lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+                )
+                self._reader = reader
+            except (OSError, ValueError, NotImplementedError):
+                # stdin redirected from a regular file (or a Windows console) cannot be watched by the event loop
+                self._pipe = False
+        if self._reader is not None:
+            line = (await self._reader.readline()).decode()
+        else:
+            line = await asyncio.to_thread(sys.stdin.readline)
+        if not line:
+            raise EOFError
+        return line.rstrip("\r\n")
+
+    async def receive(self, session: str, prompt: str) -> str:
+        async with self._lock:
+            print(prompt, end="", flush=True)
+            return await self._readline()
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            # The event loop made the pipe non-blocking, it is handed back as it was found
+            try:
+                os.set_blocking(sys.stdin.fileno(), True)
+            except (OSError, ValueError):
+                pass
+            self._reader = None
+
+
+class QueueChannel(UserChannel):
+    """
+    An in-memory channel, the user side is driven by code (tests, load generators):
+    `put` queues the next input of a session and `get` waits for its next answer, `end` closes a session input
+    and `drain` collects the answers left once the session ended.
+    """
+
+    def __init__(self) -> None:
+        self._inputs: Dict[str, asyncio.Queue[Optional[str]]] = defaultdict(asyncio.Queue)
+        self._outputs: Dict[str, asyncio.Queue[str]] = defaultdict(asyncio.Queue)
+
+    def put(self, session: str, text: str) -> None:
+        self._inputs[session].put_nowait(text)
+
+    def end(self, session: str) -> None:
+        self._inputs[session].put_nowait(None)
+
+    async def get(self, session: str) -> str:
+        return await self._outputs[session].get()
+
+    def drain(self, session: str) -> List[str]:
+        """Returns the answers of an ended session not read with `get`, and forgets the session."""
+        self._inputs.pop(session, None)
+        outputs = self._outputs.pop(session, None)
+        answers = []
+        while outputs is not None and not outputs.empty():
+            answers.append(outputs.get_nowait())
+        return answers
+
+    async def receive(self, session: str, prompt: str) -> str:
+        text = await self._inputs[session].get()
+        if text is None:
+            raise EOFError
+        return text
+
+    async def send(self, session: str, text: str) -> None:
+        self._outputs[session].put_nowait(text)
+
+
+class SocketChannel(UserChannel):
+    """
+    Serves the sessions over a local TCP socket with a line protocol (e.g. `nc 127.0.0.1 8765`):
+    each connection is a new session, the prompts and answers are written to it and every line read is a user input.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[str, tuple[asyncio.StreamReader, asyncio.StreamWriter]] = {}
+
+    async def start(self, on_session: Callable[[str], Awaitable[None]], sessions: int) -> None:
+        """Accepts up to `sessions` connections, a session starts as soon as its user connects."""
+        accepted = 0
+
+        async def _on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            nonlocal accepted
+            if accepted >= sessions:
+                writer.write(b"No more sessions available.\n")
+                await writer.drain()
+                writer.close()
+                return
+            accepted += 1
+            session = str(accepted)
+            self._connections[session] = (reader, writer)
+            await on_session(session)
+
+        self._server = await asyncio.start_server(_on_connection, self.host, self.port)
+        print(f"Waiting for {sessions} user sessions on {self.host}:{self.port}")
+
+    async def _write(self, session: str, text: str) -> None:
+        connection = self._connections.get(session)
+        if connection is None or connection[1].is_closing():
+            return
+        writer = connection[1]
+        writer.write(text.encode())
+        await writer.drain()
+
+    async def receive(self, session: str, prompt: str) -> str:
+        await self._write(session, prompt)
+        reader, _ = self._connections[session]
+        line = (await reader.readline()).decode()
+        if not line:
+            raise EOFError
+        return line.rstrip("\r\n")
+
+    async def send(self, session: str, text: str) -> None:
+        await self._write(session, f"{text}\n")
+
+    async def close(self) -> None:
+        for _, writer in self._connections.values():
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+def get_user_channel() -> UserChannel:
+    """
+    Creates the channel selected by USER_CHANNEL: console (default) or socket, listening on USER_SOCKET_ADDRESS.
+    The queue channel is created directly by the code driving the sessions.
+    """
+    channel = os.getenv("USER_CHANNEL", "console").lower()
+    match channel:
+        case "console":
+            return ConsoleChannel()
+        case "socket":
+            host, _, port = os.getenv("USER_SOCKET_ADDRESS", "127.0.0.1:8765").rpartition(":")
+            return SocketChannel(host or "127.0.0.1", int(port))
+        case _:
+            raise ValueError(f"Unknown USER_CHANNEL '{channel}'")
@@ -1,4 +1,8 @@
+from typing import Dict
+
 from rich import print
+from rich.table import Table
+from rich.text import Text
 
 
 def print_core(message: str):
@@ -19,6 +23,19 @@ def print_assistant(sender: str, receiver: str, message: str):
     )
 
 
+def print_stream_start(sender: str, receiver: str):
+    print(f"[bold green italic]({sender}->{receiver}):[/bold green italic] ", end="")
+
+
+def print_stream_chunk(chunk: str):
+    # Printed as plain text, chunks may contain unbalanced markup brackets
+    print(Text(chunk, style="bold cyan"), end="", flush=True)
+
+
+def print_stream_end():
+    print()
+
+
 def print_tool(tool: str, params: str):
     print(f"[bold blue]Tool ({tool}) invoked with: {params}[/bold blue]")
 
@@ -33,3 +50,24 @@ def print_notification(sender: str, receiver: str, message: str):
     print(
         f"[bold green italic]({sender}->{receiver}):[/bold green italic] [bold yellow]{message}[/bold yellow]"
     )
+
+
+def print_metrics(title: str, summary: Dict[str, Dict[str, float]]):
+    if not summary:
+        return
+    columns = list(next(iter(summary.values())).keys())
+    table = Table(title=title, title_style="bold magenta italic")
+    table.add_column("name", style="bold blue")
+    for column in columns:
+        table.add_column(column, justify="right")
+    for name, values in summary.items():
+        table.add_row(
+            name,
+            *(
+                f"{values.get(column, 0):.2f}"
+                if isinstance(values.get(column, 0), float)
+                else str(values.get(column, 0))
+                for column in columns
+            ),
+        )
+    print(table)
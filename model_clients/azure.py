@@ -1,22 +1,41 @@
-import os
+from typing import Any, AsyncGenerator, Mapping, Optional, Union
 
+from autogen_core.models import CreateResult
 from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
-from dotenv import load_dotenv
 
-load_dotenv()
+from .resilient import resilience_enabled
+from .settings import get_setting
 
 
-def get_model():
+class _AzureClient(AzureOpenAIChatCompletionClient):
+    """
+    Asks for the usage of the streamed calls, which is not sent by default (the result would report 0 tokens).
+    It is not set in the create args of the client, the API rejects `stream_options` on calls that do not stream.
+    """
+
+    def create_stream(
+        self, *args: Any, extra_create_args: Mapping[str, Any] = {}, **kwargs: Any
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        return super().create_stream(
+            *args, extra_create_args={"stream_options": {"include_usage": True}, **extra_create_args}, **kwargs
+        )
+
+
+def get_model(profile: Optional[str] = None):
     """
     Get the model client for Azure OpenAI.
+    With a `profile` (e.g. `small`) the settings prefixed by the profile name are used when set,
+    e.g. `SMALL_DEPLOYMENT` and `SMALL_MODEL` for a smaller deployment on the same endpoint.
 
     You can modify the code here to use a different model clients like
     OpenAI, Azure AI Foundry, Anthropic, Ollama, Gemini or even Semantic Kernel.
     """
-    return AzureOpenAIChatCompletionClient(
-        azure_deployment=os.getenv("DEPLOYMENT"),
-        model=os.getenv("MODEL"),
-        api_version=os.getenv("VERSION"),
-        azure_endpoint=os.getenv("ENDPOINT"),
-        api_key=os.getenv("API_KEY"),
+    return _AzureClient(
+        azure_deployment=get_setting("DEPLOYMENT", profile=profile),
+        model=get_setting("MODEL", profile=profile),
+        api_version=get_setting("VERSION", profile=profile),
+        azure_endpoint=get_setting("ENDPOINT", profile=profile),
+        api_key=get_setting("API_KEY", profile=profile),
+        # The calls are retried by ResilientChatCompletionClient when enabled, the SDK retries would multiply them
+        max_retries=0 if resilience_enabled(profile) else 2,
     )
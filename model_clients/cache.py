@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+from dotenv import load_dotenv
+
+from .wrapper import ChatCompletionClientWrapper
+
+load_dotenv()
+
+# Only complete answers are cached, truncated or filtered ones are requested again
+CACHEABLE_FINISH_REASONS = ("stop", "function_calls")
+
+
+class ResponseStore(ABC):
+    """A store of model responses, entries expire `ttl` seconds after being stored."""
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+
+    def _expires_at(self) -> float:
+        return time.time() + self.ttl if self.ttl is not None else float("inf")
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CreateResult]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: CreateResult) -> None: ...
+
+
+class MemoryResponseStore(ResponseStore):
+    """An in-memory LRU store holding up to `max_entries` responses."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Tuple[float, CreateResult]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[CreateResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: CreateResult) -> None:
+        self._entries[key] = (self._expires_at(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SQLiteResponseStore(ResponseStore):
+    """
+    A store persisted in a SQLite database (memory mapped), so that the cached responses survive restarts
+    and can be shared by several processes.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA mmap_size = 268435456;")
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                """
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE expires_at < ?;", (time.time(),)
+            )
+
+    def get(self, key: str) -> Optional[CreateResult]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires_at >= ?;",
+                (key, time.time()),
+            ).fetchone()
+        return CreateResult.model_validate_json(row[0]) if row else None
+
+    def set(self, key: str, value: CreateResult) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?);",
+                (key, value.model_dump_json(), self._expires_at()),
+            )
+
+
+def model_config(client: ChatCompletionClient) -> List[Dict[str, Any]]:
+    """
+    The configuration of the models answering through `client`: the model and deployment names and the create args
+    (temperature, max_tokens, ...) of every client at the end of its chain of wrappers, fallbacks included.
+    The OpenAI clients keep them in `_create_args` and `_raw_config`, the API key and the endpoint are left out.
+    """
+    if isinstance(client, ChatCompletionClientWrapper):
+        configs = model_config(client.client)
+        fallback = getattr(client, "fallback", None)
+        return configs + model_config(fallback) if fallback is not None else configs
+    raw_config = getattr(client, "_raw_config", {})
+    return [
+        {
+            "client": type(client).__name__,
+            "deployment": raw_config.get("azure_deployment"),
+            "create_args": getattr(client, "_create_args", {}),
+            "model_info": client.model_info,
+        }
+    ]
+
+
+class CachedChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    A model client that serves repeated requests from a response store.
+    The cache key covers the messages, the tools, the output options and the model configuration (see model_config),
+    so only requests that would be sent identically to the same model are served from the cache.
+    Cache hits do not contribute to the usage of the wrapped client.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        store: ResponseStore,
+        namespace: str = "",
+    ):
+        super().__init__(client)
+        self.store = store
+        self.namespace = namespace
+        # Fixed once the clients are created, a change of model or settings is a new key
+        self._model = model_config(client)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema],
+        json_output: Optional[bool],
+        extra_create_args: Mapping[str, Any],
+    ) -> str:
+        data = {
+            "namespace": self.namespace,
+            "model": self._model,
+            "messages": [message.model_dump() for message in messages],
+            "tools": [tool.schema if isinstance(tool, Tool) else tool for tool in tools],
+            "json_output": json_output,
+            "extra_create_args": extra_create_args,
+        }
+        serialized = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[CreateResult]:
+        result = self.store.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result.model_copy(update={"cached": True})
+
+    def _save(self, key: str, result: CreateResult) -> None:
+        if result.finish_reason in CACHEABLE_FINISH_REASONS:
+            self.store.set(key, result)
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = self._key(messages, tools, json_output, extra_create_args)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        result = await self.client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self._save(key, result)
+        return result
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            key = self._key(messages, tools, json_output, extra_create_args)
+            cached = self._lookup(key)
+            if cached is not None:
+                # A cached answer is replayed as a single chunk
+                if isinstance(cached.content, str):
+                    yield cached.content
+                yield cached
+                return
+
+            async for chunk in self.client.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(chunk, CreateResult):
+                    self._save(key, chunk)
+                yield chunk
+
+        return _generator()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def get_response_store() -> Optional[ResponseStore]:
+    """
+    Creates the response store configured by the environment:
+    MODEL_CACHE selects the backend (memory, sqlite or none), MODEL_CACHE_TTL the entries lifetime in seconds
+    and MODEL_CACHE_PATH the sqlite database.
+    """
+    backend = os.getenv("MODEL_CACHE", "memory").lower()
+    ttl = float(os.getenv("MODEL_CACHE_TTL", "3600"))
+    match backend:
+        case "memory":
+            return MemoryResponseStore(ttl=ttl)
+        case "sqlite":
+            return SQLiteResponseStore(
+                os.getenv("MODEL_CACHE_PATH", "data/model_cache.db"), ttl=ttl
+            )
+        case "none" | "":
+            return None
+        case _:
+            raise ValueError(f"Unknown MODEL_CACHE backend '{backend}'")
+
+
+def cached_agent_types() -> List[str]:
+    """The agent types opted in to the response cache (MODEL_CACHE_AGENTS, comma separated)."""
+    agents = os.getenv("MODEL_CACHE_AGENTS", "triage_agent,after_sale_agent")
+    return [agent.strip() for agent in agents.split(",") if agent.strip()]
@@ -0,0 +1,72 @@
+import json
+from typing import Callable, Dict, Optional
+
+from autogen_core.models import ChatCompletionClient, ModelFamily, ModelInfo
+
+from .settings import get_setting
+
+# A factory receives the model profile name (None for the default model)
+ModelClientFactory = Callable[[Optional[str]], ChatCompletionClient]
+
+
+def _azure(profile: Optional[str]) -> ChatCompletionClient:
+    from .azure import get_model
+
+    return get_model(profile)
+
+
+def _stub(profile: Optional[str]) -> ChatCompletionClient:
+    from .stub import get_stub_model
+
+    return get_stub_model(profile)
+
+
+def _replay(profile: Optional[str]) -> ChatCompletionClient:
+    """
+    Replays recorded responses in order, read from MODEL_REPLAY_PATH:
+    a JSON list of strings (text answers) or CreateResult objects.
+    """
+    from autogen_core.models import CreateResult
+    from autogen_ext.models.replay import ReplayChatCompletionClient
+
+    with open(get_setting("MODEL_REPLAY_PATH", "data/replay.json", profile), encoding="utf-8") as f:
+        responses = [
+            response if isinstance(response, str) else CreateResult.model_validate(response)
+            for response in json.load(f)
+        ]
+    return ReplayChatCompletionClient(
+        responses,
+        model_info=ModelInfo(
+            vision=False, function_calling=True, json_output=False, family=ModelFamily.UNKNOWN
+        ),
+    )
+
+
+# The available backends, more can be added with register_backend
+MODEL_BACKENDS: Dict[str, ModelClientFactory] = {
+    "azure": _azure,
+    "stub": _stub,
+    "replay": _replay,
+}
+
+
+def register_backend(name: str, factory: ModelClientFactory) -> None:
+    """Registers a model client factory under `name`, replacing any existing one."""
+    MODEL_BACKENDS[name.lower()] = factory
+
+
+def get_model_client(
+    backend: Optional[str] = None, profile: Optional[str] = None
+) -> ChatCompletionClient:
+    """
+    Creates the model client of `backend`, by default the one selected by MODEL_BACKEND (azure when not set).
+    `profile` selects a named model configuration (e.g. `small`), see `settings.get_setting`.
+    The backend modules are imported lazily, so the stub does not require the Azure settings.
+    """
+    name = (backend or get_setting("MODEL_BACKEND", "azure", profile)).lower()
+    factory = MODEL_BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(
+            f"Unknown model backend '{name}', available backends: {', '.join(MODEL_BACKENDS)}"
+        )
+    return factory(profile)
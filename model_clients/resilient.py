@@ -0,0 +1,393 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+
+from .settings import get_setting
+from .wrapper import ChatCompletionClientWrapper
+
+# Throttling, timeouts and server errors are worth another attempt, other client errors (e.g. 400, 401) are not
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    # openai.APIConnectionError and APITimeoutError carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """The delay requested by the server (Retry-After headers of a 429 or 503 response), if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def is_throttled(error: BaseException) -> bool:
+    """A 429, or any error with a Retry-After: the deployment is up but asks to slow down."""
+    return getattr(error, "status_code", None) == 429 or retry_after(error) is not None
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker rejects a call and there is no fallback model."""
+
+
+@dataclass(frozen=True)
+class ResiliencePolicy:
+    """
+    How a model call is bounded and retried:
+    each attempt must complete within `timeout` seconds and the whole call (attempts and backoff) within `deadline`.
+    Retryable failures are attempted again up to `retries` times after a jittered exponential backoff
+    (`backoff` * 2^attempt, at most `max_backoff`, or the delay asked by the server).
+    With `hedge` a duplicate request is sent when the first one is slower than the `hedge_quantile` of the recent
+    latencies (once `hedge_min_samples` are known), the first answer wins.
+    After `breaker_failures` consecutive failures the circuit opens and calls go to the fallback model,
+    a trial call is let through every `breaker_reset` seconds. Throttled calls are not failures of the deployment,
+    and without a fallback model the circuit never opens: rejecting the calls would only turn an outage of the
+    primary model into an outage of all the sessions.
+    """
+
+    timeout: float = 60.0
+    deadline: float = 120.0
+    retries: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    breaker_failures: int = 5
+    breaker_reset: float = 30.0
+
+    @classmethod
+    def from_settings(cls, profile: Optional[str] = None) -> "ResiliencePolicy":
+        """Reads the policy of a model profile from the MODEL_TIMEOUT, MODEL_RETRIES, ... settings."""
+        defaults = cls()
+        return cls(
+            timeout=float(get_setting("MODEL_TIMEOUT", str(defaults.timeout), profile)),
+            deadline=float(get_setting("MODEL_DEADLINE", str(defaults.deadline), profile)),
+            retries=int(get_setting("MODEL_RETRIES", str(defaults.retries), profile)),
+            backoff=float(get_setting("MODEL_RETRY_BACKOFF", str(defaults.backoff), profile)),
+            max_backoff=float(get_setting("MODEL_RETRY_MAX_BACKOFF", str(defaults.max_backoff), profile)),
+            hedge=get_setting("MODEL_HEDGE", "false", profile).lower() in ("1", "true", "yes"),
+            breaker_failures=int(get_setting("MODEL_BREAKER_FAILURES", str(defaults.breaker_failures), profile)),
+            breaker_reset=float(get_setting("MODEL_BREAKER_RESET", str(defaults.breaker_reset), profile)),
+        )
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failures and rejects the calls for `reset_timeout` seconds,
+    then lets a single trial call through (half open): a success closes it, a failure opens it again.
+    Every trial call must record an outcome, otherwise the breaker stays open for another `reset_timeout`.
+    """
+
+    def __init__(
+        self, failures: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic
+    ):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.consecutive_failures = 0
+        self.opens = 0
+        self._opened_at: Optional[float] = None
+        # A trial call is running (half open)
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self.clock() - self._opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half_open":
+            # The trial call, the next ones are rejected until it completes or the timeout expires again
+            self._opened_at = self.clock()
+            self._trial = True
+        return state != "open"
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self._trial or self.consecutive_failures >= self.failures:
+            if self._opened_at is None:
+                self.opens += 1
+            self._opened_at = self.clock()
+            self._trial = False
+
+    def record_throttled(self) -> None:
+        """
+        Not counted as a failure, the deployment is up but busy: a throttled trial call closes the breaker.
+        """
+        if self._trial:
+            self.record_success()
+
+
+class ResilientChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    A model client that bounds the latency of the calls and survives a failing deployment (see ResiliencePolicy):
+    per attempt timeouts and an overall deadline, jittered retries of throttled and failed requests,
+    optional hedged requests and a circuit breaker that sends the calls to `fallback` (e.g. a secondary deployment).
+    Streamed calls are retried only until their first chunk, the answer is never restarted once shown, and they are
+    not hedged: the hedge delay is computed from the latencies of the non streamed calls only.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        policy: ResiliencePolicy = ResiliencePolicy(),
+        fallback: Optional[ChatCompletionClient] = None,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(client)
+        self.policy = policy
+        self.fallback = fallback
+        self.breaker = CircuitBreaker(policy.breaker_failures, policy.breaker_reset)
+        self._rng = random.Random(seed)
+        # Latencies of the non streamed calls, a streamed call is timed to its first chunk and is not comparable
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """The latency after which a duplicate request is sent, None when hedging is off or not yet calibrated."""
+        if not self.policy.hedge or len(self._latencies) < self.policy.hedge_min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.policy.hedge_quantile))]
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Model call deadline exceeded")
+        return min(self.policy.timeout, remaining)
+
+    def _retry_delay(self, attempt: int, error: Exception, deadline: float) -> Optional[float]:
+        """
+        Records a failed attempt and returns the delay before the next one,
+        or None when the call must not be attempted again (not retryable, out of retries or past the deadline).
+        """
+        if isinstance(error, TimeoutError):
+            self.timeouts += 1
+        self._record_error(error)
+        if not is_retryable(error):
+            return None
+        delay = retry_after(error)
+        if delay is None:
+            # Full jitter, so that the sessions throttled together do not retry together
+            delay = self._rng.uniform(0, min(self.policy.max_backoff, self.policy.backoff * 2**attempt))
+        delay = min(delay, self.policy.max_backoff)
+        if attempt >= self.policy.retries or time.monotonic() + delay >= deadline:
+            return None
+        self.retries += 1
+        return delay
+
+    def _record_error(self, error: Exception) -> None:
+        """Reports a failed attempt to the circuit breaker, only the failures of an unavailable deployment count."""
+        if self.fallback is None:
+            # Nowhere to send the calls, the breaker stays closed
+            return
+        if not is_retryable(error):
+            # The deployment answered, the request itself is wrong (e.g. 400, 401)
+            self.breaker.record_success()
+        elif is_throttled(error):
+            self.breaker.record_throttled()
+        else:
+            self.breaker.record_failure()
+
+    async def _create_hedged(self, messages: Sequence[LLMMessage], kwargs: Dict[str, Any]) -> CreateResult:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self.client.create(messages, **kwargs)
+
+        first = asyncio.ensure_future(self.client.create(messages, **kwargs))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                self.hedges += 1
+                pending.add(asyncio.ensure_future(self.client.create(messages, **kwargs)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        self.calls += 1
+        kwargs = dict(
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        deadline = time.monotonic() + self.policy.deadline
+        error: Optional[Exception] = None
+        attempt = 0
+        while self.breaker.allow():
+            start = time.monotonic()
+            try:
+                timeout = self._attempt_timeout(deadline)
+                result = await asyncio.wait_for(self._create_hedged(messages, kwargs), timeout)
+            except Exception as e:
+                error = e
+                delay = self._retry_delay(attempt, e, deadline)
+                if delay is None:
+                    if not is_retryable(e):
+                        raise
+                    break
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._latencies.append(time.monotonic() - start)
+            return result
+
+        if self.fallback is None:
+            raise error or CircuitOpenError("The model circuit breaker is open")
+        self.fallbacks += 1
+        return await asyncio.wait_for(self.fallback.create(messages, **kwargs), self._attempt_timeout(deadline))
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        kwargs = dict(
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+        async def _stream(
+            client: ChatCompletionClient, timeout: float
+        ) -> AsyncGenerator[Union[str, CreateResult], None]:
+            # Each chunk must arrive within `timeout`, a stalled stream is abandoned
+            stream = client.create_stream(messages, **kwargs)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(anext(stream), timeout)
+                    except StopAsyncIteration:
+                        return
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            self.calls += 1
+            deadline = time.monotonic() + self.policy.deadline
+            error: Optional[Exception] = None
+            attempt = 0
+            while self.breaker.allow():
+                stream = _stream(self.client, self.policy.timeout)
+                try:
+                    timeout = self._attempt_timeout(deadline)
+                    first = await asyncio.wait_for(anext(stream), timeout)
+                except Exception as e:
+                    await stream.aclose()
+                    error = e
+                    delay = self._retry_delay(attempt, e, deadline)
+                    if delay is None:
+                        if not is_retryable(e):
+                            raise
+                        break
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                yield first
+                async for chunk in stream:
+                    yield chunk
+                return
+
+            if self.fallback is None:
+                raise error or CircuitOpenError("The model circuit breaker is open")
+            self.fallbacks += 1
+            async for chunk in _stream(self.fallback, self._attempt_timeout(deadline)):
+                yield chunk
+
+        return _generator()
+
+    async def close(self) -> None:
+        await self.client.close()
+        if self.fallback is not None:
+            await self.fallback.close()
+
+    def stats(self) -> Dict[str, Union[int, str]]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "breaker_opens": self.breaker.opens,
+            "breaker": self.breaker.state,
+        }
+
+
+def resilience_enabled(profile: Optional[str] = None) -> bool:
+    return get_setting("MODEL_RESILIENCE", "true", profile).lower() in ("1", "true", "yes")
+
+
+def with_resilience(
+    client: ChatCompletionClient,
+    profile: Optional[str] = None,
+    fallback: Optional[ChatCompletionClient] = None,
+) -> ChatCompletionClient:
+    """
+    Wraps `client` in a ResilientChatCompletionClient with the policy of `profile`,
+    unless MODEL_RESILIENCE is false.
+    """
+    if not resilience_enabled(profile):
+        return client
+    return ResilientChatCompletionClient(client, ResiliencePolicy.from_settings(profile), fallback)
@@ -0,0 +1,193 @@
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Mapping, Optional, Sequence, Type, TypeVar, Union
+
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+
+from .wrapper import ChatCompletionClientWrapper
+
+W = TypeVar("W", bound=ChatCompletionClientWrapper)
+
+
+def is_single_tool_call(result: CreateResult) -> bool:
+    """
+    The default confidence check of a routing answer: the model picked exactly one tool (e.g. one handoff).
+    A text answer (the model asks for details) or calls to different tools are considered low confidence.
+    """
+    if not isinstance(result.content, list) or not result.content:
+        return False
+    return len({call.name for call in result.content if isinstance(call, FunctionCall)}) == 1
+
+
+class FallbackChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    A model client that answers with a small, fast model and asks the fallback (larger) model
+    again when the small model answer is not confident according to `is_confident`.
+    Usage and model info are the ones of the small model.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        fallback: ChatCompletionClient,
+        is_confident: Callable[[CreateResult], bool] = is_single_tool_call,
+    ):
+        super().__init__(client)
+        self.fallback = fallback
+        self.is_confident = is_confident
+        self.calls = 0
+        self.fallbacks = 0
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        self.calls += 1
+        result = await self.client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        if self.is_confident(result):
+            return result
+
+        self.fallbacks += 1
+        return await self.fallback.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            self.calls += 1
+            # The small model answer is buffered, it is streamed only once known to be confident
+            chunks: List[Union[str, CreateResult]] = []
+            async for chunk in self.client.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                chunks.append(chunk)
+
+            # A stream ending without a result (e.g. no chunk at all) is not confident, the default model answers
+            result = chunks[-1] if chunks else None
+            if isinstance(result, CreateResult) and self.is_confident(result):
+                for chunk in chunks:
+                    yield chunk
+                return
+
+            self.fallbacks += 1
+            async for chunk in self.fallback.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                yield chunk
+
+        return _generator()
+
+    async def close(self) -> None:
+        await self.client.close()
+        await self.fallback.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "fallbacks": self.fallbacks}
+
+
+class TimedChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    A model client that reports the latency of each call to `record(name, seconds)`,
+    streamed calls are timed until the last chunk and their time to the first text chunk is reported as `<name>:ttft`.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        name: str,
+        record: Callable[[str, float], None],
+    ):
+        super().__init__(client)
+        self.name = name
+        self.record = record
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        start = time.perf_counter()
+        try:
+            return await self.client.create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+        finally:
+            self.record(self.name, time.perf_counter() - start)
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            start = time.perf_counter()
+            first_token = True
+            try:
+                async for chunk in self.client.create_stream(
+                    messages,
+                    tools=tools,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                ):
+                    if first_token and isinstance(chunk, str):
+                        self.record(f"{self.name}:ttft", time.perf_counter() - start)
+                        first_token = False
+                    yield chunk
+            finally:
+                self.record(self.name, time.perf_counter() - start)
+
+        return _generator()
+
+
+def find_wrapper(client: ChatCompletionClient, wrapper_type: Type[W]) -> Optional[W]:
+    """Returns the first wrapper of `wrapper_type` in the chain of wrapped clients, if any."""
+    while isinstance(client, ChatCompletionClientWrapper):
+        if isinstance(client, wrapper_type):
+            return client
+        client = client.client
+    return None
@@ -0,0 +1,43 @@
+import os
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def get_setting(
+    name: str, default: Optional[str] = None, profile: Optional[str] = None
+) -> Optional[str]:
+    """
+    Reads a model setting from the environment.
+    For a named model profile (e.g. `small`) `<PROFILE>_<NAME>` is read first, falling back to `<NAME>`,
+    so a profile only needs to set what differs from the default model (e.g. `SMALL_DEPLOYMENT`).
+    """
+    if profile:
+        value = os.getenv(f"{profile.upper()}_{name}")
+        if value:
+            return value
+    return os.getenv(name, default)
+
+
+def agent_model_profiles() -> Dict[str, str]:
+    """
+    The model profile of each agent type (AGENT_MODELS, e.g. `triage_agent=small`),
+    agents not listed use the default model.
+    """
+    profiles = {}
+    for entry in os.getenv("AGENT_MODELS", "").split(","):
+        agent_type, _, profile = entry.partition("=")
+        if agent_type.strip() and profile.strip():
+            profiles[agent_type.strip()] = profile.strip()
+    return profiles
+
+
+def fallback_agent_types() -> List[str]:
+    """
+    The agent types that retry with the default model when their own model answers with low confidence
+    (MODEL_FALLBACK_AGENTS, comma separated).
+    """
+    agents = os.getenv("MODEL_FALLBACK_AGENTS", "triage_agent")
+    return [agent.strip() for agent in agents.split(",") if agent.strip()]
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    ModelCapabilities,  # type: ignore
+    ModelFamily,
+    ModelInfo,
+    RequestUsage,
+    UserMessage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+from .settings import get_setting
+
+
+@dataclass
+class LatencyModel:
+    """
+    The simulated latency of a model call, in seconds.
+    `distribution` is one of none, constant (value), uniform (value to high) or lognormal (median value, sigma).
+    """
+
+    distribution: str = "none"
+    value: float = 0.0
+    high: float = 0.0
+    sigma: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        match self.distribution:
+            case "constant":
+                return self.value
+            case "uniform":
+                return rng.uniform(self.value, self.high)
+            case "lognormal":
+                return rng.lognormvariate(0, self.sigma) * self.value
+            case _:
+                return 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        """Parses a spec like `constant:0.2`, `uniform:0.1:0.5` or `lognormal:0.8:0.4`."""
+        parts = spec.strip().split(":")
+        try:
+            numbers = [float(part) for part in parts[1:]]
+            match parts[0].lower():
+                case "none" | "":
+                    return cls()
+                case "constant":
+                    return cls("constant", value=numbers[0])
+                case "uniform":
+                    return cls("uniform", value=numbers[0], high=numbers[1])
+                case "lognormal":
+                    return cls("lognormal", value=numbers[0], sigma=numbers[1] if len(numbers) > 1 else 0.5)
+        except (IndexError, ValueError):
+            raise ValueError(f"Invalid latency spec '{spec}'") from None
+        raise ValueError(f"Unknown latency distribution '{parts[0]}' in '{spec}'")
+
+
+@dataclass
+class ScriptRule:
+    """
+    Answers the last user message when it matches `pattern` (case insensitive).
+    `calls` are the tool calls to request, `{placeholders}` in their string arguments are replaced with the
+    named groups of the pattern or with the values found in the conversation (see `PLACEHOLDERS`).
+    The rule is skipped when one of the tools is not available to the agent or a placeholder cannot be resolved.
+    """
+
+    pattern: str
+    calls: List[Dict[str, Any]] = field(default_factory=list)
+    text: Optional[str] = None
+
+
+# Values looked up in the conversation, from the most recent message backwards
+PLACEHOLDERS = {
+    "agent_id": r"agent_id(?:\s+is|\s*=|:)\s*([\w/.-]*\w)",
+    "car_id": r"car_id\s*=\s*(\d+)",
+    # Dataclass reprs or the first row of the tables returned by the tools
+    "last_car_id": r"Car\(id=(\d+)|^Car id\|.*\n(\d+)\|",
+    "order_id": r"Order\(id=(\d+)|^Order id\|.*\n(\d+)\||order (?:id )?#?(\d+)",
+    "name": r"(?:name is|i am|i'm)\s+([a-z]+)",
+    "email": r"([\w.+-]+@[\w-]+\.[\w.]+)",
+}
+
+BRANDS = "Audi|BMW|Tesla|Mercedes|Toyota|Ford|Honda|Volkswagen|Hyundai|Kia|Nissan|Chevrolet|Porsche|Volvo|Mazda|Lexus|Fiat"
+
+# A script covering the conversation of the demo walkthrough, rules are tried in order
+DEFAULT_SCRIPT = [
+    # Advisor: the user picks a car, it is cached and the conversation is handed off to the sales agent
+    ScriptRule(
+        r"\b(the one|i'?ll take|this one)\b",
+        calls=[
+            {"name": "cache_carId", "arguments": {"agent_id": "{agent_id}", "car_id": "{last_car_id}"}},
+            {"name": "transfer_to_sales_agent"},
+        ],
+    ),
+    ScriptRule(
+        rf"\b(?P<brand>{BRANDS})\b",
+        calls=[{"name": "get_available_cars", "arguments": {"brand": "{brand}", "year": None, "budget": None}}],
+    ),
+    ScriptRule(
+        r"\b(?P<budget>\d+)\s*k\b",
+        calls=[{"name": "get_available_cars", "arguments": {"brand": None, "year": None, "budget": "{budget}000"}}],
+    ),
+    # Sales
+    ScriptRule(r"^\s*(yes|confirm)", calls=[{"name": "create_order", "arguments": {"car_id": "{car_id}", "customer_name": "{name}", "customer_email": "{email}"}}]),
+    ScriptRule(r"car_id\s*=", text="Great choice! Please provide your name and email to complete the order."),
+    ScriptRule(r"@", text="Please confirm the order by typing yes or no."),
+    ScriptRule(r"\b(don'?t want|cancel|delete)\b", calls=[{"name": "delete_order", "arguments": {"order_id": "{order_id}"}}]),
+    ScriptRule(r"\borders?\b", calls=[{"name": "get_orders", "arguments": {"customer_name": "{name}"}}]),
+    ScriptRule(r"\borders?\b", text="Sure, what is the name you used for your orders?"),
+    # Sales, the user has provided the name to look up their orders
+    ScriptRule(r"\b(name is|i am|i'm)\b", calls=[{"name": "get_orders", "arguments": {"customer_name": "{name}"}}]),
+    # Triage
+    ScriptRule(r"\b(orders?|cancel|delete)\b", calls=[{"name": "transfer_to_sales_agent"}]),
+    ScriptRule(r"\b(buy|cars?|models?|advi[cs]e)\b", calls=[{"name": "transfer_to_advisor_agent"}]),
+    ScriptRule(r"\b(weather|joke|news)\b", calls=[{"name": "transfer_to_user_agent"}]),
+    # Advisor, wider requests
+    ScriptRule(r"\b(cars?|models?|options|see)\b", calls=[{"name": "get_available_cars", "arguments": {"brand": None, "year": None, "budget": None}}]),
+]
+
+
+def load_script(path: str) -> List[ScriptRule]:
+    """Loads a script from a JSON file containing a list of rules (pattern, calls and text)."""
+    with open(path, encoding="utf-8") as f:
+        return [ScriptRule(**rule) for rule in json.load(f)]
+
+
+def _text(message: LLMMessage) -> str:
+    if isinstance(message, FunctionExecutionResultMessage):
+        return "\n".join(result.content for result in message.content)
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part if isinstance(part, str) else str(part) for part in content)
+
+
+class ScriptedChatCompletionClient(ChatCompletionClient):
+    """
+    A deterministic, offline model client for load tests and CI.
+    It answers the last user message following a script of rules (tool calls, handoffs or text),
+    summarizes the tool results after a tool call and waits a simulated latency before answering.
+    """
+
+    def __init__(
+        self,
+        script: Optional[List[ScriptRule]] = None,
+        latency: Optional[LatencyModel] = None,
+        token_latency: Optional[LatencyModel] = None,
+        seed: Optional[int] = None,
+        fallback_text: str = "Could you tell me a bit more about what you are looking for?",
+    ):
+        self.script = script if script is not None else DEFAULT_SCRIPT
+        self.latency = latency or LatencyModel()
+        self.token_latency = token_latency or LatencyModel()
+        self.fallback_text = fallback_text
+        self._rng = random.Random(seed)
+        self._patterns = {rule.pattern: re.compile(rule.pattern, re.I | re.M) for rule in self.script}
+        self._actual_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    def _resolve(self, value: Any, groups: Dict[str, str], messages: Sequence[LLMMessage]) -> Any:
+        if not isinstance(value, str):
+            return value
+        names = re.findall(r"{(\w+)}", value)
+        for name in names:
+            resolved = groups.get(name) or self._lookup(name, messages)
+            if resolved is None:
+                raise KeyError(name)
+            value = value.replace(f"{{{name}}}", resolved)
+        return int(value) if names and value.isdigit() else value
+
+    @staticmethod
+    def _lookup(name: str, messages: Sequence[LLMMessage]) -> Optional[str]:
+        pattern = PLACEHOLDERS.get(name)
+        if pattern is None:
+            return None
+        for message in reversed(messages):
+            match = re.search(pattern, _text(message), re.I | re.M)
+            if match:
+                return next(group for group in match.groups() if group)
+        return None
+
+    def _answer(
+        self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema]
+    ) -> Union[str, List[FunctionCall]]:
+        if messages and isinstance(messages[-1], FunctionExecutionResultMessage):
+            # Reflection on the tool results
+            return f"Here is what I found:\n{_text(messages[-1])[:1000]}"
+
+        user_messages = [m for m in messages if isinstance(m, UserMessage)]
+        if not user_messages:
+            return self.fallback_text
+        request = _text(user_messages[-1])
+        tool_names = {tool.name if isinstance(tool, Tool) else tool["name"] for tool in tools}
+
+        for rule in self.script:
+            match = self._patterns[rule.pattern].search(request)
+            if match is None or any(call["name"] not in tool_names for call in rule.calls):
+                continue
+            if not rule.calls:
+                return rule.text or self.fallback_text
+            groups = {k: v for k, v in match.groupdict().items() if v is not None}
+            try:
+                return [
+                    FunctionCall(
+                        # From the seeded generator, so that a run can be replayed and cached
+                        id=f"call_{self._rng.getrandbits(48):012x}",
+                        name=call["name"],
+                        arguments=json.dumps(
+                            {
+                                key: self._resolve(value, groups, messages)
+                                for key, value in call.get("arguments", {}).items()
+                            }
+                        ),
+                    )
+                    for call in rule.calls
+                ]
+            except KeyError:
+                continue
+        return self.fallback_text
+
+    def _usage(self, messages: Sequence[LLMMessage], content: Union[str, List[FunctionCall]]) -> RequestUsage:
+        completion = content if isinstance(content, str) else "".join(call.name + call.arguments for call in content)
+        usage = RequestUsage(
+            prompt_tokens=self.count_tokens(messages),
+            completion_tokens=max(1, len(completion) // 4),
+        )
+        self._actual_usage = usage
+        self._total_usage = RequestUsage(
+            prompt_tokens=self._total_usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._total_usage.completion_tokens + usage.completion_tokens,
+        )
+        return usage
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        await asyncio.sleep(self.latency.sample(self._rng))
+        content = self._answer(messages, tools)
+        return CreateResult(
+            finish_reason="stop" if isinstance(content, str) else "function_calls",
+            content=content,
+            usage=self._usage(messages, content),
+            cached=False,
+        )
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            await asyncio.sleep(self.latency.sample(self._rng))
+            content = self._answer(messages, tools)
+            if isinstance(content, str):
+                for token in re.findall(r"\S+\s*", content):
+                    await asyncio.sleep(self.token_latency.sample(self._rng))
+                    yield token
+            yield CreateResult(
+                finish_reason="stop" if isinstance(content, str) else "function_calls",
+                content=content,
+                usage=self._usage(messages, content),
+                cached=False,
+            )
+
+        return _generator()
+
+    async def close(self) -> None:
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._actual_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        # Roughly 4 characters per token
+        return sum(len(_text(message)) for message in messages) // 4
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return 128_000 - self.count_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self.model_info
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return ModelInfo(vision=False, function_calling=True, json_output=False, family=ModelFamily.UNKNOWN)
+
+
+def get_stub_model(profile: Optional[str] = None) -> ScriptedChatCompletionClient:
+    """
+    Creates the scripted client configured by the environment (prefixed by the profile name, if any):
+    MODEL_STUB_SCRIPT (a JSON script, the demo walkthrough script by default), MODEL_STUB_LATENCY and
+    MODEL_STUB_TOKEN_LATENCY (see LatencyModel.parse) and MODEL_STUB_SEED.
+    """
+    script_path = get_setting("MODEL_STUB_SCRIPT", profile=profile)
+    seed = get_setting("MODEL_STUB_SEED", profile=profile)
+    return ScriptedChatCompletionClient(
+        script=load_script(script_path) if script_path else None,
+        latency=LatencyModel.parse(get_setting("MODEL_STUB_LATENCY", "none", profile)),
+        token_latency=LatencyModel.parse(get_setting("MODEL_STUB_TOKEN_LATENCY", "none", profile)),
+        seed=int(seed) if seed else None,
+    )
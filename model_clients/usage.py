@@ -0,0 +1,83 @@
+import time
+from typing import Any, AsyncGenerator, Callable, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import AssistantMessage, ChatCompletionClient, CreateResult, LLMMessage, RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+
+from .wrapper import ChatCompletionClientWrapper
+
+# Receives the model name, the result of the call, its latency in seconds and a function that estimates its usage
+# with count_tokens, for the results that do not report it
+UsageCallback = Callable[[str, CreateResult, float, Callable[[], RequestUsage]], None]
+
+
+class UsageChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    A model client that reports the usage of every completed call to `on_usage`.
+    It is meant to wrap the clients that actually call a model, so that every request
+    (including fallbacks and background calls) is accounted once.
+    """
+
+    def __init__(self, client: ChatCompletionClient, model: str, on_usage: UsageCallback):
+        super().__init__(client)
+        self.model = model
+        self.on_usage = on_usage
+
+    def _estimate(
+        self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], result: CreateResult
+    ) -> Callable[[], RequestUsage]:
+        def estimate() -> RequestUsage:
+            completion = AssistantMessage(content=result.content, source="assistant")
+            return RequestUsage(
+                prompt_tokens=self.client.count_tokens(messages, tools=tools),
+                completion_tokens=self.client.count_tokens([completion]),
+            )
+
+        return estimate
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        start = time.perf_counter()
+        result = await self.client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self.on_usage(self.model, result, time.perf_counter() - start, self._estimate(messages, tools, result))
+        return result
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            start = time.perf_counter()
+            async for chunk in self.client.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(chunk, CreateResult):
+                    self.on_usage(
+                        self.model, chunk, time.perf_counter() - start, self._estimate(messages, tools, chunk)
+                    )
+                yield chunk
+
+        return _generator()